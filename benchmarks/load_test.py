@@ -0,0 +1,99 @@
+"""Load test for the query server of dbstats.server.
+
+Starts the server in-process (or targets a running one with --port), opens --clients keep-alive
+connections and has each send --requests GET requests drawn from the loaded tables: single stations,
+direct connections, trains and top-k queries. Prints the throughput and the p50, p90 and p99 latency
+overall and per route.
+
+Usage:
+    python benchmarks/load_test.py --clients 50 --requests 200
+    python benchmarks/load_test.py --port 8765 --clients 100
+"""
+
+import argparse
+import asyncio
+import random
+import sys
+import time
+from pathlib import Path
+from urllib.parse import quote, urlencode
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from dbstats.server import QueryServer, Tables
+
+
+def targets(tables, rng, n):
+    """n request targets with their route name."""
+    stations, trains, direct = list(tables.stations), list(tables.trains), list(tables.direct)
+    routes = [
+        ("station", lambda: f"/stations/{quote(rng.choice(stations))}", stations),
+        ("train", lambda: f"/trains/{quote(rng.choice(trains))}", trains),
+        ("direct", lambda: "/direct?" + urlencode(dict(zip(("from", "to"), rng.choice(direct)))), direct),
+        ("top", lambda: f"/top/stations?k={rng.choice([5, 10, 50])}", stations),
+    ]
+    routes = [(name, make) for name, make, rows in routes if rows]
+    return [(name, make()) for name, make in (rng.choice(routes) for _ in range(n))]
+
+
+async def client(port, requests, latencies):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    for route, target in requests:
+        started = time.perf_counter()
+        writer.write(f"GET {target} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+        await writer.drain()
+        head = await reader.readuntil(b"\r\n\r\n")
+        length = next(
+            int(line.split(b":")[1])
+            for line in head.split(b"\r\n")
+            if line.lower().startswith(b"content-length")
+        )
+        await reader.readexactly(length)
+        latencies.append((route, time.perf_counter() - started))
+    writer.close()
+
+
+async def main(args):
+    rng = random.Random(args.seed)
+    tables = Tables.load()
+    server = None
+    if args.port is None:
+        query_server = QueryServer(tables, args.cache_size)
+        server = await asyncio.start_server(query_server.handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+    else:
+        port = args.port
+
+    latencies = []
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(client(port, targets(tables, rng, args.requests), latencies) for _ in range(args.clients))
+    )
+    elapsed = time.perf_counter() - started
+    if server is not None:
+        server.close()
+        await server.wait_closed()
+
+    print(f"{len(latencies):,} requests from {args.clients} clients in {elapsed:.2f}s")
+    print(f"{len(latencies) / elapsed:,.0f} requests/s")
+    routes = sorted({route for route, _ in latencies})
+    for name in ["all", *routes]:
+        values = np.array([latency for route, latency in latencies if name in ("all", route)]) * 1000
+        p50, p90, p99 = np.percentile(values, [50, 90, 99])
+        print(
+            f"{name:>8} | n: {len(values):>7,} | p50: {p50:7.2f} ms | p90: {p90:7.2f} ms | p99: {p99:7.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the statistics query server.")
+    parser.add_argument("--clients", type=int, default=50, help="concurrent keep-alive connections")
+    parser.add_argument("--requests", type=int, default=200, help="requests per client")
+    parser.add_argument(
+        "--port", type=int, help="port of a running server, starts one in-process if not given"
+    )
+    parser.add_argument("--cache-size", type=int, default=4096, help="cache size of the in-process server")
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(main(parser.parse_args()))
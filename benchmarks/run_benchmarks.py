@@ -0,0 +1,207 @@
+"""Benchmark every questions/*/calculations.py on synthetic data.
+
+Each size gets its own workspace with synthetic monthly parquet files (see dbstats.synthetic)
+and a copy of the question scripts, so the real data and outputs in the repository are never
+touched. Every script runs in a fresh interpreter which reports its wall time and peak memory.
+
+Usage:
+    python benchmarks/run_benchmarks.py --sizes 10000,100000 --questions bahnhof,allgemein
+    python benchmarks/run_benchmarks.py --compare 1a2b3c4
+
+Results are written to benchmarks/results/<label>.json, the label defaults to the current commit.
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import pyarrow.parquet as pq
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from dbstats.synthetic import month_range, write_months
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+RESULTS_DIR = REPO_ROOT / "benchmarks" / "results"
+
+# Runs a question script in the child interpreter and writes its measurements to argv[2].
+RUNNER = """
+import json, os, resource, runpy, sys, time
+script, result_file = sys.argv[1], sys.argv[2]
+sys.argv = [script]
+sys.path.insert(0, os.path.dirname(script))
+start = time.perf_counter()
+runpy.run_path(script, run_name="__main__")
+wall = time.perf_counter() - start
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+peak_bytes = peak if sys.platform == "darwin" else peak * 1024
+with open(result_file, "w") as f:
+    json.dump({"wall_s": wall, "peak_bytes": peak_bytes}, f)
+"""
+
+
+def current_label():
+    result = subprocess.run(
+        ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True
+    )
+    label = result.stdout.strip() or "unknown"
+    dirty = subprocess.run(["git", "diff", "--quiet", "HEAD"], cwd=REPO_ROOT).returncode != 0
+    return f"{label}-dirty" if dirty else label
+
+
+def find_questions(selected=None):
+    scripts = sorted((REPO_ROOT / "questions").rglob("calculations.py"))
+    questions = {script.parent.name: script.parent for script in scripts}
+    if selected:
+        unknown = set(selected) - set(questions)
+        if unknown:
+            raise SystemExit(f"Unknown questions: {', '.join(sorted(unknown))}")
+        questions = {name: questions[name] for name in selected}
+    return questions
+
+
+def prepare_workspace(workspace, questions, months, rows, seed):
+    """Generate the synthetic months and copy the question scripts into the workspace.
+
+    The output directories are recreated empty since some scripts expect them to exist.
+    """
+    paths = write_months(workspace / "data", months, rows=rows, seed=seed)
+    for name, question_dir in questions.items():
+        target = workspace / "questions" / name
+        target.mkdir(parents=True)
+        for source in question_dir.glob("*.py"):
+            shutil.copy2(source, target / source.name)
+        for source in question_dir.rglob("*"):
+            if source.is_dir() and source.name != "__pycache__":
+                (target / source.relative_to(question_dir)).mkdir(parents=True, exist_ok=True)
+    return sum(pq.ParquetFile(path).metadata.num_rows for path in paths)
+
+
+def run_question(workspace, name, timeout):
+    script = workspace / "questions" / name / "calculations.py"
+    result_file = workspace / f"{name}.result.json"
+    env = {**os.environ, "MPLBACKEND": "Agg", "PYTHONPATH": str(REPO_ROOT)}
+    start = time.perf_counter()
+    try:
+        completed = subprocess.run(
+            [sys.executable, "-c", RUNNER, str(script), str(result_file)],
+            cwd=workspace,
+            env=env,
+            capture_output=True,
+            text=True,
+            timeout=timeout,
+        )
+        returncode = completed.returncode
+        stderr = completed.stderr
+    except subprocess.TimeoutExpired:
+        returncode, stderr = None, f"timed out after {timeout}s"
+    outer_wall = time.perf_counter() - start
+
+    if returncode == 0 and result_file.exists():
+        measured = json.loads(result_file.read_text())
+        return {"ok": True, "wall_s": measured["wall_s"], "peak_bytes": measured["peak_bytes"]}
+    print(stderr[-2000:] if stderr else "", file=sys.stderr)
+    return {"ok": False, "wall_s": outer_wall, "peak_bytes": None}
+
+
+def run_benchmarks(sizes, questions, months, seed, repeat, timeout):
+    results = []
+    month_tags = month_range("2024-07", months)
+    for size in sizes:
+        with tempfile.TemporaryDirectory(prefix=f"dbstats-bench-{size}-") as tmp:
+            workspace = Path(tmp)
+            print(f"\nGenerating {months} synthetic months with ~{size:,} rows each")
+            total_rows = prepare_workspace(workspace, questions, month_tags, size, seed)
+            for name in questions:
+                for run in range(repeat):
+                    measured = run_question(workspace, name, timeout)
+                    record = {
+                        "question": name,
+                        "rows_per_month": size,
+                        "rows": total_rows,
+                        "run": run,
+                        **measured,
+                        "rows_per_s": total_rows / measured["wall_s"] if measured["ok"] else None,
+                    }
+                    results.append(record)
+                    status = "✓" if measured["ok"] else "✗"
+                    peak = f"{measured['peak_bytes'] / 2**20:,.0f} MB" if measured["peak_bytes"] else "-"
+                    print(f"{status} {name:<30} {measured['wall_s']:8.2f} s  {peak:>10}")
+    return results
+
+
+def summarize(results):
+    """Best run per question and size, keyed by "question@rows_per_month"."""
+    best = {}
+    for record in results:
+        if not record["ok"]:
+            continue
+        key = f"{record['question']}@{record['rows_per_month']}"
+        if key not in best or record["wall_s"] < best[key]["wall_s"]:
+            best[key] = record
+    return best
+
+
+def compare(current, baseline_label):
+    baseline_file = RESULTS_DIR / f"{baseline_label}.json"
+    if not baseline_file.exists():
+        print(f"No results for '{baseline_label}' in {RESULTS_DIR}")
+        return
+    baseline = summarize(json.loads(baseline_file.read_text())["results"])
+    print(f"\nCompared to {baseline_label} (wall time / peak memory, < 1.00 is better)")
+    for key, record in sorted(summarize(current).items()):
+        if key not in baseline:
+            continue
+        base = baseline[key]
+        wall_ratio = record["wall_s"] / base["wall_s"]
+        mem_ratio = record["peak_bytes"] / base["peak_bytes"]
+        print(f"  {key:<40} time {wall_ratio:5.2f}x   memory {mem_ratio:5.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--sizes", default="10000,100000", help="comma separated rows per month")
+    parser.add_argument("--months", type=int, default=3, help="number of synthetic months")
+    parser.add_argument("--questions", help="comma separated question names, default all")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per question and size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=int, default=3600, help="seconds per script run")
+    parser.add_argument("--label", help="name of the results file, default current commit")
+    parser.add_argument("--compare", help="label of earlier results to compare against")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    questions = find_questions(args.questions.split(",") if args.questions else None)
+    results = run_benchmarks(sizes, questions, args.months, args.seed, args.repeat, args.timeout)
+
+    label = args.label or current_label()
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    output = {
+        "label": label,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "months": args.months,
+        "seed": args.seed,
+        "results": results,
+    }
+    with (RESULTS_DIR / f"{label}.json").open("w", encoding="utf-8") as f:
+        json.dump(output, f, indent=2)
+    print(f"\nResults written to {RESULTS_DIR / f'{label}.json'}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
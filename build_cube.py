@@ -0,0 +1,17 @@
+import argparse
+
+from dbstats.cube import CUBE_FILE, DIMENSIONS, build
+from dbstats.months import month_files
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Store the stop statistics per station, hour, weekday and train type category of the "
+        f"monthly data files in {CUBE_FILE}."
+    )
+    parser.add_argument("--last", type=int, default=3, help="the last N months, 3 if not given")
+    parser.add_argument("--json", help="also write the whole cube as JSON records to this file")
+    args = parser.parse_args()
+    cube = build(month_files(last=args.last))
+    print(f"{CUBE_FILE} | months: {', '.join(cube.months)} | cells: {len(cube):,}")
+    if args.json:
+        cube.to_json(args.json, by=DIMENSIONS)
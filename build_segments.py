@@ -0,0 +1,13 @@
+import argparse
+
+from dbstats.months import month_files
+from dbstats.segments import SEGMENTS_DIR, build
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=f"Write the stop-to-stop segments of the monthly data files to {SEGMENTS_DIR}/."
+    )
+    parser.add_argument("--last", type=int, help="only the last N months")
+    parser.add_argument("--force", action="store_true", help="rebuild months whose source is unchanged")
+    args = parser.parse_args()
+    build(month_files(last=args.last), force=args.force)
@@ -0,0 +1,13 @@
+import argparse
+
+from dbstats.months import month_files
+from dbstats.train_days import TRAIN_DAYS_DIR, build
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=f"Write the daily statistics per train of the monthly data files to {TRAIN_DAYS_DIR}/."
+    )
+    parser.add_argument("--last", type=int, help="only the last N months")
+    parser.add_argument("--force", action="store_true", help="rebuild months whose source is unchanged")
+    args = parser.parse_args()
+    build(month_files(last=args.last), force=args.force)
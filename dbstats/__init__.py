@@ -0,0 +1 @@
+"""Shared helpers for the question scripts and data tools."""
@@ -0,0 +1,210 @@
+"""Streaming grouped aggregation over the monthly parquet files.
+
+Most questions only need means, counts and rates per group. Those follow from a handful of sums
+(the sufficient statistics), which can be computed per record batch and added up afterwards, so the
+months never have to be loaded into one DataFrame and memory stays bounded by the number of groups:
+
+    stats = aggregate(month_files(last=3), by=["station"], columns=["station", "delay_in_min", "is_canceled"])
+    average_delay = stats["delay_sum"] / stats["delay_count"]
+
+The statistics computed depend on the columns read:
+- rows: number of rows,
+- with is_canceled: canceled, the number of canceled rows, and valid, the number of rows that are not,
+- with delay_in_min: delay_count_all and delay_sum_all over all rows with a delay,
+- with both: delay_count and delay_sum over the delays of rows that are not canceled, and punctual,
+  the number of rows that are not canceled and less than PUNCTUAL_BELOW minutes late.
+
+Rows with a missing group key are dropped, like in DataFrame.groupby, unless dropna=False. Keep them
+when a total over one of the keys has to include the rows where that key is missing.
+
+The statistics of every month are kept under build/partials, keyed by the content hash of the file and
+everything that shapes the result: group keys, columns, prepare, dropna, and the content of this module
+and of the file that defines prepare with every local module it imports (so a change to e.g.
+dbstats.taxonomy or dbstats.sketch, which prepare functions call, invalidates the partials). Moving the
+window by a month then only scans the new month, the others are read back from their partials.
+DBSTATS_PARTIALS=off always scans the files.
+
+DBSTATS_ENGINE=duckdb runs the aggregation as one SQL query over all files instead (see
+dbstats.duckdb_engine), which spills to disk and uses all cores for windows that do not fit in memory.
+A prepare function has no SQL equivalent by itself, so callers that use one also pass its derived keys
+as sql_columns and its row filter as sql_where.
+"""
+
+import hashlib
+import inspect
+import json
+import os
+from pathlib import Path
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from dbstats.cache import HashIndex, local_sources
+from dbstats.trace import parquet_bytes, span
+
+BATCH_ROWS = 1 << 18
+# Partial results are merged whenever this many have piled up
+COMPACT_EVERY = 32
+# A stop counts as punctual below 6 minutes delay, as in the DB statistics
+PUNCTUAL_BELOW = 6
+PARTIALS_DIR = Path("build") / "partials"
+
+
+def batch_stats(df, by, dropna=True):
+    """Sufficient statistics of one DataFrame, grouped by the by columns."""
+    stats = pd.DataFrame({"rows": 1}, index=df.index, dtype="int64")
+    if "is_canceled" in df:
+        canceled = df["is_canceled"].fillna(False).astype(bool)
+        stats["canceled"] = canceled
+        stats["valid"] = ~canceled
+    if "delay_in_min" in df:
+        delay = df["delay_in_min"]
+        has_delay = delay.notna()
+        stats["delay_count_all"] = has_delay
+        stats["delay_sum_all"] = delay.fillna(0)
+        if "is_canceled" in df:
+            stats["delay_count"] = has_delay & ~canceled
+            stats["delay_sum"] = delay.where(~canceled, 0).fillna(0)
+            stats["punctual"] = ~canceled & (delay < PUNCTUAL_BELOW)
+    return stats.groupby([df[key] for key in by], sort=False, dropna=dropna).sum()
+
+
+def merge(partials, dropna=True):
+    """Add up grouped statistics, the result is sorted by the group keys."""
+    partials = [partial for partial in partials if len(partial)]
+    if not partials:
+        return pd.DataFrame()
+    combined = pd.concat(partials)
+    return combined.groupby(level=list(range(combined.index.nlevels)), dropna=dropna).sum()
+
+
+def _empty(by):
+    index = pd.Index([], name=by[0]) if len(by) == 1 else pd.MultiIndex.from_arrays([[]] * len(by), names=by)
+    return pd.DataFrame(index=index)
+
+
+def iter_batches(file, columns, batch_rows=BATCH_ROWS):
+    """The record batches of a file as DataFrames, read inside one span."""
+    with span(f"scan {file.name}") as s:
+        parquet_file = pq.ParquetFile(file)
+        s.add(bytes_read=parquet_bytes(file, columns))
+        for batch in parquet_file.iter_batches(batch_size=batch_rows, columns=columns):
+            s.add(rows=batch.num_rows)
+            yield batch.to_pandas()
+
+
+def aggregate_file(file, by, columns, prepare=None, dropna=True, batch_rows=BATCH_ROWS):
+    """Grouped sufficient statistics of one file, computed batch by batch."""
+    partials = []
+    for df in iter_batches(file, columns, batch_rows):
+        if prepare is not None:
+            df = prepare(df)
+        partials.append(batch_stats(df, by, dropna))
+        if len(partials) >= COMPACT_EVERY:
+            partials = [merge(partials, dropna)]
+    stats = merge(partials, dropna)
+    return _empty(by) if stats.empty else stats
+
+
+class PartialStore:
+    """Per-file statistics of one aggregation, stored as build/partials/<aggregation>/<file hash>.parquet."""
+
+    def __init__(self, by, columns, prepare=None, dropna=True, partials_dir=PARTIALS_DIR):
+        self.by = list(by)
+        self.hashes = HashIndex()
+        prepare_source = None
+        # This module, and the file of prepare with the local modules it imports: everything prepare can call
+        sources = [Path(__file__)]
+        if prepare is not None:
+            try:
+                prepare_source = inspect.getsource(prepare)
+                sources = local_sources(inspect.getsourcefile(prepare)) + sources
+            except (OSError, TypeError):
+                prepare_source = prepare.__code__.co_code.hex()
+        key = json.dumps(
+            {
+                "by": self.by,
+                "columns": list(columns),
+                "prepare": prepare_source,
+                "dropna": dropna,
+                "sources": [self.hashes(source) for source in sources],
+            }
+        )
+        self.dir = Path(partials_dir) / hashlib.sha256(key.encode()).hexdigest()[:16]
+
+    def _path(self, file):
+        return self.dir / f"{self.hashes(file)}.parquet"
+
+    def load(self, file):
+        """The stored statistics of the file, None if there are none for its current content."""
+        path = self._path(file)
+        if not path.exists():
+            return None
+        with span(f"partial {file.name}") as s:
+            stats = pd.read_parquet(path)
+            s.add(rows=len(stats), bytes_read=path.stat().st_size)
+        return stats.set_index(self.by) if len(stats) else _empty(self.by)
+
+    def save(self, file, stats):
+        path = self._path(file)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first so that concurrent runs never read half a partial
+        temporary = path.with_suffix(f".{os.getpid()}.tmp")
+        stats.reset_index().to_parquet(temporary, index=False)
+        temporary.replace(path)
+        self.hashes.save()
+
+
+def aggregate(
+    files, by, columns, prepare=None, dropna=True, batch_rows=BATCH_ROWS, sql_columns=None, sql_where=None
+):
+    """Grouped sufficient statistics over the files, from the stored per-file partials where possible.
+
+    Args:
+        files: parquet files to scan
+        by: names of the group key columns
+        columns: columns to read, must contain the group keys that prepare does not add
+        prepare: optional function that takes and returns a batch DataFrame, to filter rows or
+            derive group keys
+        dropna: drop the rows with a missing group key
+        batch_rows: rows per record batch
+        sql_columns: for the duckdb engine, the keys that prepare adds as {name: SQL expression}
+        sql_where: for the duckdb engine, the SQL condition of the rows that prepare keeps
+
+    Returns:
+        DataFrame indexed by the group keys with one column per statistic, sorted by the keys
+    """
+    if os.environ.get("DBSTATS_ENGINE", "pandas") == "duckdb":
+        if prepare is not None and sql_columns is None and sql_where is None:
+            raise ValueError("the duckdb engine needs sql_columns or sql_where in place of prepare")
+        from dbstats import duckdb_engine
+
+        return duckdb_engine.aggregate(files, by, columns, dropna, sql_columns, sql_where)
+
+    store = None
+    if os.environ.get("DBSTATS_PARTIALS", "on") != "off":
+        store = PartialStore(by, columns, prepare, dropna)
+    partials = []
+    for file in files:
+        stats = store.load(file) if store else None
+        if stats is None:
+            stats = aggregate_file(file, by, columns, prepare, dropna, batch_rows)
+            if store:
+                store.save(file, stats)
+        partials.append(stats)
+    stats = merge(partials, dropna)
+    return _empty(by) if stats.empty else stats
+
+
+def select(stats, level, value):
+    """The statistics of one value of a group key level, without that level and without missing values of the
+    other keys."""
+    selected = stats[stats.index.get_level_values(level) == value].droplevel(level)
+    return selected[selected.index.to_frame().notna().all(axis=1).to_numpy()]
+
+
+def total(stats, level, dropna=True):
+    """The statistics summed over a group key level, missing values of the other keys are dropped unless
+    dropna=False."""
+    keep = [name for name in stats.index.names if name != level]
+    return stats.groupby(level=keep, dropna=dropna).sum()
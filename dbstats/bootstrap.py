@@ -0,0 +1,117 @@
+"""Confidence intervals for the per-group statistics of dbstats.aggregate.
+
+The questions only keep sums and counts per group, not the stops themselves, but that is enough:
+
+- Mean delays get a Poisson bootstrap over the delay bucket counts of dbstats.sketch. In a Poisson
+  bootstrap every stop is drawn Poisson(1) times instead of resampling exactly n stops, so the stops of
+  a bucket with count c are drawn Poisson(c) times in total and a replicate is one Poisson draw per
+  (group, bucket). All groups are resampled at once: the buckets are sorted by group, and the weighted
+  sums of each replicate are np.add.reduceat over the group offsets, in chunks of at most CHUNK_DRAWS
+  numbers. Groups with ANALYTIC_FROM delays or more, where the mean is close to normal, get the normal
+  interval from the variance of their buckets instead, so the runtime is bounded by the number of
+  buckets of the small groups times REPLICATES, however many stops there are.
+- Rates (cancellations) get the Wilson score interval, which is analytic and stays within [0, 1] for
+  small groups and rates near 0. Its low end is exactly 0 without successes and its high end exactly 1
+  when every trial is a success.
+
+    stats = aggregate(files, by=["station", "delay_bucket"], columns=[...], prepare=add_delay_buckets)
+    intervals = mean_interval(stats["delay_count"], "delay_bucket")
+    low, high = rate_interval(totals["canceled"], totals["rows"])
+
+The delays of a bucket count with its representative value (exact below dbstats.sketch.EXACT_LIMIT
+minutes, within RELATIVE_ACCURACY beyond), and the draws use a fixed seed, so the same statistics give
+the same intervals.
+"""
+
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+from dbstats.sketch import bucket_values
+
+REPLICATES = 200
+CONFIDENCE = 0.95
+# Groups with at least this many delays get the normal interval instead of the bootstrap
+ANALYTIC_FROM = 1000
+# Poisson numbers drawn at once, bounds the memory of a chunk of replicates
+CHUNK_DRAWS = 1 << 23
+
+
+def mean_interval(counts, level="delay_bucket", confidence=CONFIDENCE, replicates=REPLICATES, seed=0):
+    """Interval of the mean delay per group from bucket counts: Poisson bootstrap percentiles for groups with
+    fewer than ANALYTIC_FROM delays, the normal interval for the larger ones.
+
+    Args:
+        counts: Series of counts indexed by the group keys and the bucket level, like the delay_count
+            statistic of an aggregation that includes delay_bucket in its keys
+        level: name of the bucket level
+        confidence: coverage of the interval
+        replicates: number of bootstrap replicates
+        seed: seed of the Poisson draws
+
+    Returns:
+        DataFrame indexed by the group keys with the columns ci_low and ci_high, groups without delays or
+        with a missing key are left out
+    """
+    groups = [name for name in counts.index.names if name != level]
+    counts = counts[(counts > 0).to_numpy() & counts.index.to_frame().notna().all(axis=1).to_numpy()]
+    counts = counts.sort_index(level=[*groups, level])
+    keys = counts.index.droplevel(level)
+    if not len(counts):
+        return pd.DataFrame({"ci_low": [], "ci_high": []}, index=keys)
+    group_ids = keys.factorize()[0]
+    # The buckets are sorted by group, every group starts where its id changes
+    starts = np.r_[True, group_ids[1:] != group_ids[:-1]]
+    offsets = np.flatnonzero(starts)
+    values = bucket_values(counts.index.get_level_values(level))
+    weights = counts.to_numpy(dtype="float64")
+
+    # Normal interval from the variance of the bucket histogram, used for the large groups
+    n = np.add.reduceat(weights, offsets)
+    mean = np.add.reduceat(weights * values, offsets) / n
+    variance = np.add.reduceat(weights * (values - mean[group_ids]) ** 2, offsets) / n
+    spread = NormalDist().inv_cdf(1 - (1 - confidence) / 2) * np.sqrt(variance / n)
+    low, high = mean - spread, mean + spread
+
+    # The small groups, where the mean is not normal yet, are bootstrapped all at once
+    small = n < ANALYTIC_FROM
+    if small.any():
+        cells = small[group_ids]
+        low[small], high[small] = _bootstrap(
+            values[cells], weights[cells], np.flatnonzero(starts[cells]), confidence, replicates, seed
+        )
+    return pd.DataFrame({"ci_low": low, "ci_high": high}, index=keys.unique())
+
+
+def _bootstrap(values, counts, offsets, confidence, replicates, seed):
+    """Percentile interval of the mean per group, over Poisson replicates of the bucket counts."""
+    rng = np.random.default_rng(seed)
+    means = np.empty((len(offsets), replicates))
+    chunk = max(CHUNK_DRAWS // len(counts), 1)
+    for start in range(0, replicates, chunk):
+        size = min(chunk, replicates - start)
+        draws = rng.poisson(counts[:, None], size=(len(counts), size)).astype("float64")
+        weights = np.add.reduceat(draws, offsets, axis=0)
+        sums = np.add.reduceat(draws * values[:, None], offsets, axis=0)
+        # A replicate that drew no stop of a group has no mean, it is left out of the percentiles
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means[:, start : start + size] = sums / weights
+    tail = (1 - confidence) / 2
+    return np.nanquantile(means, [tail, 1 - tail], axis=1)
+
+
+def rate_interval(successes, trials, confidence=CONFIDENCE):
+    """Wilson score interval of the rates successes / trials.
+
+    Returns:
+        (low, high) like successes, NaN where there are no trials
+    """
+    z = NormalDist().inv_cdf(1 - (1 - confidence) / 2)
+    trials = trials.where(trials > 0)
+    rate = successes / trials
+    centre = (rate + z**2 / (2 * trials)) / (1 + z**2 / trials)
+    spread = z / (1 + z**2 / trials) * np.sqrt(rate * (1 - rate) / trials + z**2 / (4 * trials**2))
+    low, high = (centre - spread).clip(lower=0), (centre + spread).clip(upper=1)
+    # Exact at the borders, the formula leaves rounding noise like 1e-17 there
+    return low.mask(successes == 0, 0).where(trials.notna()), high.mask(successes == trials, 1)
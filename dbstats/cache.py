@@ -0,0 +1,243 @@
+"""Build cache for the question outputs, keyed on a fingerprint of everything a question reads.
+
+The fingerprint of a question covers
+- its calculations.py and every local module it imports, recursively (dbstats.taxonomy, the
+  other dbstats modules, ...),
+- the content hashes of the monthly files it selects with month_files(last=N); a script that
+  does not select its months with a literal last depends on all files in the data directory,
+- the versions of the libraries that shape the results,
+- the OUTPUT_ENV variables, which select the engine, the precompressed siblings and the plots.
+
+After a successful run the files in the question's data directory are stored content-addressed
+under build/cache. When the fingerprint is unchanged on the next run they are restored instead
+of running the script, and files in the data directory that are not part of the outputs are removed.
+Every file of the cache is written to a temporary file and renamed into place. An index or entry
+that does not parse counts as a miss, and a blob whose content does not match its hash is dropped
+instead of restored.
+"""
+
+import ast
+import hashlib
+import json
+import os
+import shutil
+from importlib import metadata
+from pathlib import Path
+
+from dbstats.months import DATA_DIR, month_files
+from dbstats.output import atomic_writer
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+CACHE_DIR = Path("build") / "cache"
+LIBRARIES = ["pandas", "numpy", "pyarrow", "matplotlib"]
+# Environment variables that change what a question writes
+OUTPUT_ENV = ["DBSTATS_ENGINE", "DBSTATS_PRECOMPRESS", "DBSTATS_RENDER"]
+
+
+def _read_json(path):
+    """The JSON in path, None if it does not exist or does not parse."""
+    try:
+        return json.loads(Path(path).read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _write_json(path, data, indent=None):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with atomic_writer(path) as f:
+        f.write(json.dumps(data, indent=indent).encode("utf-8"))
+
+
+class HashIndex:
+    """sha256 of files, remembered by path, size and mtime so unchanged files are hashed once."""
+
+    def __init__(self, path=None):
+        self.path = Path(path or CACHE_DIR / "hashes.json")
+        entries = _read_json(self.path)
+        self.entries = entries if isinstance(entries, dict) else {}
+        self.changed = False
+
+    def __call__(self, file):
+        file = Path(file)
+        stat = file.stat()
+        key = str(file.resolve())
+        entry = self.entries.get(key)
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            return entry["sha256"]
+        digest = file_hash(file)
+        self.entries[key] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest}
+        self.changed = True
+        return digest
+
+    def save(self):
+        """Write the entries, merged with the ones other processes saved since this index was loaded."""
+        if self.changed:
+            saved = _read_json(self.path)
+            if isinstance(saved, dict):
+                self.entries = {**saved, **self.entries}
+            _write_json(self.path, self.entries)
+            self.changed = False
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with Path(path).open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _resolve_module(name, search_dirs):
+    """Files of a local module and its parent packages, empty for third-party modules."""
+    parts = name.split(".")
+    for directory in search_dirs:
+        files = []
+        for i in range(1, len(parts) + 1):
+            base = directory.joinpath(*parts[:i])
+            if (base / "__init__.py").exists():
+                files.append(base / "__init__.py")
+            elif base.with_suffix(".py").exists():
+                files.append(base.with_suffix(".py"))
+            else:
+                break
+        if len(files) == len(parts):
+            return files
+    return []
+
+
+def local_sources(script):
+    """The script and all local modules it imports, recursively."""
+    script = Path(script).resolve()
+    search_dirs = [script.parent, REPO_ROOT]
+    sources = []
+    pending = [script]
+    while pending:
+        source = pending.pop()
+        if source in sources:
+            continue
+        sources.append(source)
+        for node in ast.walk(ast.parse(source.read_text(encoding="utf-8"))):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module and node.level == 0:
+                names = [node.module] + [f"{node.module}.{alias.name}" for alias in node.names]
+            else:
+                continue
+            for name in names:
+                pending.extend(_resolve_module(name, [source.parent, *search_dirs]))
+    return sorted(sources)
+
+
+def selected_months(script, data_dir=DATA_DIR):
+    """The monthly files the script reads, from its month_files(last=N) calls."""
+    lasts = []
+    for node in ast.walk(ast.parse(Path(script).read_text(encoding="utf-8"))):
+        if isinstance(node, ast.Call) and getattr(node.func, "id", None) == "month_files":
+            last = next((kw.value for kw in node.keywords if kw.arg == "last"), None)
+            if last is None and node.args:
+                last = node.args[0]
+            lasts.append(last.value if isinstance(last, ast.Constant) else None)
+    if not lasts or None in lasts:
+        return month_files(data_dir=data_dir)
+    return month_files(last=max(lasts), data_dir=data_dir)
+
+
+def fingerprint(script, hashes, data_dir=DATA_DIR, env=None):
+    """Hash over the sources, input months, library versions and OUTPUT_ENV of a question script.
+
+    Args:
+        script: the calculations.py of the question
+        hashes: HashIndex for the sources and monthly files
+        data_dir: directory with the monthly files
+        env: the environment the script runs with, os.environ if None
+    """
+    env = os.environ if env is None else env
+    sources = {}
+    for source in local_sources(script):
+        name = str(source.relative_to(REPO_ROOT)) if source.is_relative_to(REPO_ROOT) else source.name
+        sources[name] = hashes(source)
+    inputs = {file.name: hashes(file) for file in selected_months(script, data_dir)}
+    libraries = {}
+    for library in LIBRARIES:
+        try:
+            libraries[library] = metadata.version(library)
+        except metadata.PackageNotFoundError:
+            libraries[library] = None
+    environment = {name: env.get(name) for name in OUTPUT_ENV}
+    payload = json.dumps(
+        {"sources": sources, "inputs": inputs, "libraries": libraries, "environment": environment},
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class OutputCache:
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.cache_dir = Path(cache_dir)
+        self.hashes = HashIndex(self.cache_dir / "hashes.json")
+
+    def _entry_file(self, name):
+        return self.cache_dir / "questions" / f"{name}.json"
+
+    def _blob(self, digest):
+        return self.cache_dir / "blobs" / digest[:2] / digest
+
+    def restore(self, name, output_dir, fingerprint):
+        """Restore the outputs stored for this fingerprint, False if there are none.
+
+        Files in output_dir that are not part of the outputs are removed.
+        """
+        entry = _read_json(self._entry_file(name))
+        if not isinstance(entry, dict) or entry.get("fingerprint") != fingerprint:
+            return False
+        output_dir = Path(output_dir)
+        for relative, digest in entry["outputs"].items():
+            target = output_dir / relative
+            if target.exists() and self.hashes(target) == digest:
+                continue
+            blob = self._blob(digest)
+            if not blob.exists():
+                return False
+            # A blob that does not match its name is never copied into the outputs
+            if self.hashes(blob) != digest:
+                blob.unlink()
+                self.hashes.save()
+                return False
+        # Files of another fingerprint that this one does not write, e.g. the plots of a removed chart
+        if output_dir.exists():
+            for file in sorted(output_dir.rglob("*"), reverse=True):
+                if file.is_dir():
+                    if not any(file.iterdir()):
+                        file.rmdir()
+                elif file.relative_to(output_dir).as_posix() not in entry["outputs"]:
+                    file.unlink()
+        for relative, digest in entry["outputs"].items():
+            target = output_dir / relative
+            if target.exists() and self.hashes(target) == digest:
+                continue
+            target.parent.mkdir(parents=True, exist_ok=True)
+            self._copy(self._blob(digest), target)
+        self.hashes.save()
+        return True
+
+    def store(self, name, output_dir, fingerprint):
+        """Remember the current files in output_dir as the outputs for this fingerprint."""
+        output_dir = Path(output_dir)
+        outputs = {}
+        for file in sorted(output_dir.rglob("*")):
+            if not file.is_file():
+                continue
+            digest = self.hashes(file)
+            blob = self._blob(digest)
+            if not blob.exists():
+                blob.parent.mkdir(parents=True, exist_ok=True)
+                self._copy(file, blob)
+            outputs[file.relative_to(output_dir).as_posix()] = digest
+        _write_json(self._entry_file(name), {"fingerprint": fingerprint, "outputs": outputs}, indent=1)
+        self.hashes.save()
+
+    @staticmethod
+    def _copy(source, target):
+        with source.open("rb") as f, atomic_writer(target) as out:
+            shutil.copyfileobj(f, out)
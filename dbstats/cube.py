@@ -0,0 +1,258 @@
+"""Precomputed cube of stop statistics per station, hour of day, weekday and train type category.
+
+build() aggregates the monthly files with dbstats.aggregate (so the per-month partials are reused) by
+station, hour, weekday (0 is Monday) and train type category of dbstats.taxonomy, and stores the
+sufficient statistics of every non-empty cell:
+
+- stops: number of stops,
+- canceled: canceled stops,
+- delay_sum and delay_count: the delays of the stops that were not canceled,
+- punctual: stops that were not canceled and less than 6 minutes late.
+
+Most stations only have stops in a fraction of the 672 cells of 24 hours, 7 weekdays and 4 categories,
+so the cube is stored sparse in one compressed npz file (build/cube/cube.npz): the coordinates of the
+cells sorted by station, with the station names and categories as lookup tables. A station is then a
+contiguous range of cells, and any slice or marginal is a mask and an np.bincount over the cells.
+
+The per-month partials are keyed on this module and dbstats.taxonomy among others, so a train type that
+moves to another category rebuilds them:
+
+    cube = Cube.load()
+    cube.slice(station="Köln Hbf", by=["weekday", "hour"])
+    cube.slice(category="Fernverkehr", hour=range(6, 10), by=["station"])
+
+The slices come with average_delay, punctuality and cancellation_rate; to_json() writes one as
+records.
+"""
+
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from dbstats.aggregate import aggregate
+from dbstats.months import month_of
+from dbstats.output import write_json
+from dbstats.taxonomy import DEFAULT_CATEGORY, LONG_DISTANCE, OTHER, S_BAHN, category_expression, classify
+from dbstats.trace import span
+
+CUBE_FILE = Path("build") / "cube" / "cube.npz"
+DIMENSIONS = ["station", "hour", "weekday", "category"]
+CATEGORY_ORDER = [LONG_DISTANCE, DEFAULT_CATEGORY, S_BAHN, OTHER]
+STATISTICS = ["stops", "canceled", "delay_sum", "delay_count", "punctual"]
+COLUMNS = ["station", "time", "train_type", "is_canceled", "delay_in_min"]
+# add_cube_keys() for the duckdb engine of dbstats.aggregate
+SQL_COLUMNS = {"hour": "hour(time)", "weekday": "isodow(time) - 1", "category": category_expression()}
+SQL_WHERE = "time IS NOT NULL"
+# The statistics of dbstats.aggregate behind the STATISTICS of the cube
+SOURCES = {
+    "stops": "rows",
+    "canceled": "canceled",
+    "delay_sum": "delay_sum",
+    "delay_count": "delay_count",
+    "punctual": "punctual",
+}
+
+
+def add_cube_keys(df):
+    """prepare function for aggregate(): hour, weekday and train type category of the stops with a time."""
+    df = df[df["time"].notna()]
+    return df.assign(
+        hour=df["time"].dt.hour,
+        weekday=df["time"].dt.dayofweek,
+        category=classify(df["train_type"])["train_type_category"].to_numpy(),
+    )
+
+
+def _values(value):
+    """A filter value as a list, None stays None."""
+    if value is None or isinstance(value, (list, tuple, range, np.ndarray, pd.Index)):
+        return value
+    return [value]
+
+
+class Cube:
+    def __init__(self, stations, station, hour, weekday, category, statistics, months=()):
+        """A cube from the coordinates and statistics of its cells, sorted by station.
+
+        Args:
+            stations: the station names, station holds the positions in it
+            station, hour, weekday, category: arrays with the coordinates of every cell, category as the
+                position in CATEGORY_ORDER
+            statistics: dict of the STATISTICS to arrays with the values of every cell
+            months: YYYY-MM of the months the cube covers
+        """
+        self.stations = np.asarray(stations, dtype=str)
+        self.coordinates = {"station": station, "hour": hour, "weekday": weekday, "category": category}
+        self.statistics = statistics
+        self.months = list(months)
+        self.sizes = {
+            "station": len(self.stations),
+            "hour": 24,
+            "weekday": 7,
+            "category": len(CATEGORY_ORDER),
+        }
+        self.labels = {
+            "station": self.stations,
+            "hour": np.arange(24),
+            "weekday": np.arange(7),
+            "category": np.array(CATEGORY_ORDER),
+        }
+        self._station_codes = {name: code for code, name in enumerate(self.stations)}
+        # The cells of station i are offsets[i]:offsets[i + 1]
+        self._offsets = np.searchsorted(station, np.arange(len(self.stations) + 1))
+
+    @classmethod
+    def from_stats(cls, stats, months=()):
+        """The cube of aggregate() statistics grouped by the DIMENSIONS."""
+        stats = stats[stats["rows"] > 0]
+        keys = stats.index.to_frame(index=False)
+        stations, station = np.unique(keys["station"].astype(str).to_numpy(), return_inverse=True)
+        category = pd.Categorical(keys["category"], categories=CATEGORY_ORDER).codes
+        order = np.argsort(station, kind="stable")
+        return cls(
+            stations,
+            station[order].astype("int32"),
+            keys["hour"].to_numpy()[order].astype("uint8"),
+            keys["weekday"].to_numpy()[order].astype("uint8"),
+            category[order].astype("uint8"),
+            {
+                name: stats[source].to_numpy()[order].astype("float64" if name == "delay_sum" else "int64")
+                for name, source in SOURCES.items()
+            },
+            months,
+        )
+
+    @classmethod
+    def load(cls, path=CUBE_FILE):
+        """The cube stored by save()."""
+        with span("load cube") as s, np.load(path) as data:
+            cube = cls(
+                data["stations"],
+                *(data[dimension] for dimension in DIMENSIONS),
+                {name: data[name] for name in STATISTICS},
+                data["months"].tolist(),
+            )
+            s.add(rows=len(cube), bytes_read=Path(path).stat().st_size)
+        return cube
+
+    def save(self, path=CUBE_FILE):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # np.savez_compressed adds .npz to names without it, the temporary file keeps the suffix
+        temporary = path.with_name(f"{path.stem}.{os.getpid()}.tmp.npz")
+        with span("write cube") as s:
+            np.savez_compressed(
+                temporary,
+                stations=self.stations,
+                months=np.array(self.months, dtype=str),
+                **self.coordinates,
+                **self.statistics,
+            )
+            temporary.replace(path)
+            s.wrote(path)
+
+    def __len__(self):
+        return len(self.coordinates["station"])
+
+    def _cells(self, station):
+        """Positions of the cells of the given stations, all cells for None."""
+        if station is None:
+            return slice(None)
+        codes = [self._station_codes[name] for name in station if name in self._station_codes]
+        return np.concatenate(
+            [np.arange(self._offsets[code], self._offsets[code + 1]) for code in codes] or [np.empty(0, int)]
+        )
+
+    def slice(self, station=None, hour=None, weekday=None, category=None, by=()):
+        """The statistics of the cells matching the filters, summed up per by.
+
+        Args:
+            station, hour, weekday, category: a value or a list of values to keep, everything if None
+            by: the DIMENSIONS to keep, the others are summed up; nothing for the total of the slice
+
+        Returns:
+            DataFrame indexed by the by dimensions (one row without by) with the STATISTICS, average_delay,
+            punctuality and cancellation_rate, only the groups with stops
+        """
+        by = list(by)
+        unknown = set(by) - set(DIMENSIONS)
+        if unknown:
+            raise ValueError(f"unknown dimensions {sorted(unknown)}, the cube has {DIMENSIONS}")
+        cells = self._cells(_values(station))
+        coordinates = {name: values[cells] for name, values in self.coordinates.items()}
+        statistics = {name: values[cells] for name, values in self.statistics.items()}
+
+        keep = np.ones(len(coordinates["hour"]), dtype=bool)
+        for name, value in (("hour", hour), ("weekday", weekday), ("category", category)):
+            value = _values(value)
+            if value is not None:
+                if name == "category":
+                    value = [CATEGORY_ORDER.index(item) for item in value if item in CATEGORY_ORDER]
+                keep &= np.isin(coordinates[name], value)
+
+        # One flat index per group of the by dimensions, the statistics are summed per index
+        sizes = [self.sizes[name] for name in by]
+        if by:
+            flat = np.ravel_multi_index([coordinates[name][keep] for name in by], sizes)
+        else:
+            flat = np.zeros(keep.sum(), dtype="int64")
+        groups = int(np.prod(sizes))
+        sums = {
+            name: np.bincount(flat, weights=values[keep], minlength=groups)
+            for name, values in statistics.items()
+        }
+        present = np.flatnonzero(sums["stops"] > 0)
+        if by:
+            positions = np.unravel_index(present, sizes)
+            index = pd.MultiIndex.from_arrays(
+                [self.labels[name][position] for name, position in zip(by, positions)], names=by
+            )
+            if len(by) == 1:
+                index = index.get_level_values(0)
+        else:
+            index = pd.RangeIndex(len(present))
+        result = pd.DataFrame(
+            {
+                name: values[present] if name == "delay_sum" else values[present].astype("int64")
+                for name, values in sums.items()
+            },
+            index=index,
+        )
+        valid = result["stops"] - result["canceled"]
+        result["average_delay"] = result["delay_sum"] / result["delay_count"]
+        result["punctuality"] = result["punctual"] / valid.where(valid > 0)
+        result["cancellation_rate"] = result["canceled"] / result["stops"]
+        return result
+
+    def to_json(self, path, by=DIMENSIONS, **filters):
+        """Write a slice as JSON: the months of the cube and the records of the slice."""
+        records = self.slice(by=by, **filters).round(4).reset_index()
+        data = {
+            "months": self.months,
+            "dimensions": list(by),
+            "filters": {name: list(_values(value)) for name, value in filters.items() if value is not None},
+            "records": json.loads(records.to_json(orient="records", force_ascii=False)),
+        }
+        with span("write cube json") as s:
+            write_json(path, data)
+            s.wrote(path)
+
+
+def build(files, path=CUBE_FILE):
+    """Aggregate the files into the cube and store it, returns the cube."""
+    files = list(files)
+    with span("aggregate cube"):
+        stats = aggregate(
+            files,
+            by=DIMENSIONS,
+            columns=COLUMNS,
+            prepare=add_cube_keys,
+            sql_columns=SQL_COLUMNS,
+            sql_where=SQL_WHERE,
+        )
+    cube = Cube.from_stats(stats, [month_of(file) for file in files])
+    cube.save(path)
+    return cube
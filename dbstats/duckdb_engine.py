@@ -0,0 +1,89 @@
+"""DuckDB engine for dbstats.aggregate, selected with DBSTATS_ENGINE=duckdb.
+
+The sufficient statistics of batch_stats() are computed by a single GROUP BY over all parquet files.
+DuckDB reads only the needed columns, runs on all cores and spills to build/duckdb when the groups do
+not fit into its memory limit (DBSTATS_DUCKDB_MEMORY, e.g. 4GB, DuckDB's default if not set), so windows
+of many months do not have to fit into memory. The result has the same index, columns and order as the
+pandas engine; the per-month partials are not used.
+
+duckdb is an optional dependency, it is only imported when the engine is selected.
+"""
+
+import os
+from pathlib import Path
+
+import duckdb
+
+from dbstats.aggregate import PUNCTUAL_BELOW, _empty
+from dbstats.trace import parquet_bytes, span
+
+TEMP_DIR = Path("build") / "duckdb"
+CANCELED = "coalesce(is_canceled, false)"
+
+
+def _name(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def statistics(columns):
+    """SQL aggregates of the statistics that batch_stats() computes for the columns, in the same order."""
+    selects = ["count(*) AS rows"]
+    if "is_canceled" in columns:
+        selects += [
+            f"count(*) FILTER (WHERE {CANCELED}) AS canceled",
+            f"count(*) FILTER (WHERE NOT {CANCELED}) AS valid",
+        ]
+    if "delay_in_min" in columns:
+        selects += [
+            "count(delay_in_min) AS delay_count_all",
+            "coalesce(sum(delay_in_min), 0)::DOUBLE AS delay_sum_all",
+        ]
+        if "is_canceled" in columns:
+            selects += [
+                f"count(delay_in_min) FILTER (WHERE NOT {CANCELED}) AS delay_count",
+                f"coalesce(sum(delay_in_min) FILTER (WHERE NOT {CANCELED}), 0)::DOUBLE AS delay_sum",
+                f"count(*) FILTER (WHERE NOT {CANCELED} AND delay_in_min < {PUNCTUAL_BELOW}) AS punctual",
+            ]
+    return selects
+
+
+def query(by, columns, dropna=True, sql_columns=None, sql_where=None):
+    """The SQL of an aggregation over the files passed as the list parameter $files."""
+    derived = [f"{expression} AS {_name(name)}" for name, expression in (sql_columns or {}).items()]
+    source = f"SELECT {', '.join([*map(_name, columns), *derived])} FROM read_parquet($files)"
+    if sql_where:
+        source += f" WHERE {sql_where}"
+    keys = ", ".join(map(_name, by))
+    having = " AND ".join(f"{_name(key)} IS NOT NULL" for key in by) if dropna else "true"
+    return (
+        f"WITH source AS ({source}) SELECT {keys}, {', '.join(statistics(columns))} "
+        f"FROM source WHERE {having} GROUP BY {keys}"
+    )
+
+
+def connect():
+    TEMP_DIR.mkdir(parents=True, exist_ok=True)
+    connection = duckdb.connect()
+    connection.execute(f"SET temp_directory = '{TEMP_DIR.resolve()}'")
+    connection.execute("SET preserve_insertion_order = false")
+    if os.environ.get("DBSTATS_DUCKDB_MEMORY"):
+        connection.execute(f"SET memory_limit = '{os.environ['DBSTATS_DUCKDB_MEMORY']}'")
+    return connection
+
+
+def aggregate(files, by, columns, dropna=True, sql_columns=None, sql_where=None):
+    """Grouped sufficient statistics over the files, like dbstats.aggregate.aggregate()."""
+    files = [str(file) for file in files]
+    if not files:
+        return _empty(by)
+    with span(f"duckdb {', '.join(by)}") as s:
+        s.add(bytes_read=sum(parquet_bytes(Path(file), columns) for file in files))
+        with connect() as connection:
+            stats = connection.execute(
+                query(by, columns, dropna, sql_columns, sql_where), {"files": files}
+            ).df()
+        s.add(rows=len(stats))
+    if stats.empty:
+        return _empty(by)
+    # Sorted like the groupby of the pandas engine, missing keys last
+    return stats.set_index(by).sort_index()
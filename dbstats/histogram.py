@@ -0,0 +1,208 @@
+"""Delay histograms per train type, counted with a single np.bincount per record batch.
+
+Every stop that was not canceled and has a delay is counted in a (train type, delay minute) cell;
+delays outside [MIN_DELAY, MAX_DELAY] are clipped to the edge minutes. Next to the counts the
+histogram keeps the number of rows, canceled and not canceled stops and the exact delay sum per
+train type, so means are not affected by the clipping. Distributions over any bins, cumulative
+curves and punctuality at any threshold all follow from these arrays:
+
+    histogram = DelayHistogram.from_files(month_files(last=3))
+    histogram.punctuality(6, "ICE")
+    histogram.cumulative()
+
+Like the aggregate() statistics, the histogram of every month is stored under build/partials and
+reused while the month's content does not change; DBSTATS_PARTIALS=off always scans the files.
+"""
+
+import hashlib
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from dbstats.aggregate import BATCH_ROWS, PARTIALS_DIR, iter_batches
+from dbstats.cache import HashIndex
+from dbstats.trace import span
+
+MIN_DELAY = -60
+MAX_DELAY = 720
+WIDTH = MAX_DELAY - MIN_DELAY + 1
+COLUMNS = ["train_type", "delay_in_min", "is_canceled"]
+# Name of the rows without a train type
+MISSING = ""
+
+
+class DelayHistogram:
+    def __init__(self):
+        self.types = []
+        self._codes = {}
+        self.rows = np.zeros(0, dtype="int64")
+        self.canceled = np.zeros(0, dtype="int64")
+        self.not_canceled = np.zeros(0, dtype="int64")
+        self.delay_sum = np.zeros(0, dtype="float64")
+        self.counts = np.zeros((0, WIDTH), dtype="int64")
+
+    def _grow(self, names):
+        """Codes of the train type names, new names get new rows in the arrays."""
+        for name in names:
+            if name not in self._codes:
+                self._codes[name] = len(self.types)
+                self.types.append(name)
+        missing = len(self.types) - len(self.rows)
+        if missing:
+            self.rows = np.concatenate([self.rows, np.zeros(missing, dtype="int64")])
+            self.canceled = np.concatenate([self.canceled, np.zeros(missing, dtype="int64")])
+            self.not_canceled = np.concatenate([self.not_canceled, np.zeros(missing, dtype="int64")])
+            self.delay_sum = np.concatenate([self.delay_sum, np.zeros(missing)])
+            self.counts = np.concatenate([self.counts, np.zeros((missing, WIDTH), dtype="int64")])
+        return np.array([self._codes[name] for name in names], dtype="int64")
+
+    def update(self, df):
+        """Count the rows of a DataFrame with the COLUMNS."""
+        codes, names = pd.factorize(df["train_type"], use_na_sentinel=False)
+        names = [MISSING if pd.isna(name) else name for name in names]
+        codes = self._grow(names)[codes]
+        n = len(self.types)
+
+        canceled = df["is_canceled"].fillna(False).to_numpy(dtype=bool)
+        delay = df["delay_in_min"].to_numpy(dtype="float64")
+        counted = ~canceled & ~np.isnan(delay)
+        minutes = np.clip(delay[counted], MIN_DELAY, MAX_DELAY).astype("int64") - MIN_DELAY
+
+        self.rows += np.bincount(codes, minlength=n)
+        self.canceled += np.bincount(codes[canceled], minlength=n)
+        self.not_canceled += np.bincount(codes[~canceled], minlength=n)
+        self.delay_sum += np.bincount(codes[counted], weights=delay[counted], minlength=n)
+        cells = np.bincount(codes[counted] * WIDTH + minutes, minlength=n * WIDTH)
+        self.counts += cells.reshape(n, WIDTH)
+        return self
+
+    def merge(self, other):
+        """Add the counts of another histogram."""
+        codes = self._grow(other.types)
+        np.add.at(self.rows, codes, other.rows)
+        np.add.at(self.canceled, codes, other.canceled)
+        np.add.at(self.not_canceled, codes, other.not_canceled)
+        np.add.at(self.delay_sum, codes, other.delay_sum)
+        np.add.at(self.counts, codes, other.counts)
+        return self
+
+    def _select(self, array, train_type):
+        """Sum over all train types for None, else the row of the train type (zeros if unknown)."""
+        if train_type is None:
+            return array.sum(axis=0)
+        if train_type not in self._codes:
+            return np.zeros(array.shape[1:], dtype=array.dtype)
+        return array[self._codes[train_type]]
+
+    def totals(self, train_type=None):
+        """rows, canceled, not_canceled, delay_count and delay_sum of a train type, all types for None."""
+        return {
+            "rows": int(self._select(self.rows, train_type)),
+            "canceled": int(self._select(self.canceled, train_type)),
+            "not_canceled": int(self._select(self.not_canceled, train_type)),
+            "delay_count": int(self._select(self.counts, train_type).sum()),
+            "delay_sum": float(self._select(self.delay_sum, train_type)),
+        }
+
+    def delay_counts(self, train_type=None):
+        """Series of stop counts indexed by the delay minute."""
+        return pd.Series(self._select(self.counts, train_type), index=np.arange(MIN_DELAY, MAX_DELAY + 1))
+
+    def mean(self, train_type=None):
+        totals = self.totals(train_type)
+        return totals["delay_sum"] / totals["delay_count"] if totals["delay_count"] else np.nan
+
+    def punctuality(self, threshold, train_type=None):
+        """Share of the stops that were not canceled with less than threshold minutes delay."""
+        counts = self.delay_counts(train_type)
+        not_canceled = self._select(self.not_canceled, train_type)
+        return counts[counts.index < threshold].sum() / not_canceled if not_canceled else np.nan
+
+    def distribution(self, bins, train_type=None):
+        """Shares of the delays per bin, right-inclusive like pd.cut, in bin order."""
+        counts = self.delay_counts(train_type)
+        cumulative = np.concatenate([[0], counts.cumsum().to_numpy()])
+        # Number of delays <= each edge
+        positions = np.clip(np.floor(np.asarray(bins, dtype="float64")) - MIN_DELAY + 1, 0, WIDTH)
+        per_bin = np.diff(cumulative[positions.astype("int64")])
+        return per_bin / per_bin.sum() if per_bin.sum() else per_bin * np.nan
+
+    def cumulative(self, train_type=None):
+        """Share of the stops that were not canceled with at most each delay, for the delays that occur."""
+        counts = self.delay_counts(train_type)
+        not_canceled = self._select(self.not_canceled, train_type)
+        return (counts.cumsum() / not_canceled)[counts > 0]
+
+    def to_json(self):
+        """Dict for JSON with the totals and the counts between the first and last delay per train type."""
+        train_types = {}
+        for code, name in enumerate(self.types):
+            counts = self.counts[code]
+            nonzero = np.flatnonzero(counts)
+            first, last = (nonzero[0], nonzero[-1]) if len(nonzero) else (0, -1)
+            train_types[name] = {
+                **self.totals(name),
+                "first_delay": int(first + MIN_DELAY),
+                "counts": counts[first : last + 1].tolist(),
+            }
+        return {"min_delay": MIN_DELAY, "max_delay": MAX_DELAY, "train_types": train_types}
+
+    def save(self, path):
+        np.savez_compressed(
+            path,
+            types=np.array(self.types, dtype=str),
+            rows=self.rows,
+            canceled=self.canceled,
+            not_canceled=self.not_canceled,
+            delay_sum=self.delay_sum,
+            counts=self.counts,
+        )
+
+    @classmethod
+    def load(cls, path):
+        histogram = cls()
+        with np.load(path) as data:
+            histogram._grow(data["types"].tolist())
+            histogram.rows = data["rows"]
+            histogram.canceled = data["canceled"]
+            histogram.not_canceled = data["not_canceled"]
+            histogram.delay_sum = data["delay_sum"]
+            histogram.counts = data["counts"]
+        return histogram
+
+    @classmethod
+    def from_file(cls, file, batch_rows=BATCH_ROWS):
+        histogram = cls()
+        for df in iter_batches(file, COLUMNS, batch_rows):
+            histogram.update(df)
+        return histogram
+
+    @classmethod
+    def from_files(cls, files, batch_rows=BATCH_ROWS):
+        """Histogram of the files, from the stored per-month histograms where possible."""
+        store_dir = None
+        if os.environ.get("DBSTATS_PARTIALS", "on") != "off":
+            engine = hashlib.sha256(Path(__file__).read_bytes()).hexdigest()[:16]
+            store_dir = PARTIALS_DIR / f"histogram-{engine}"
+            hashes = HashIndex()
+
+        histogram = cls()
+        for file in files:
+            path = store_dir / f"{hashes(file)}.npz" if store_dir else None
+            if path is not None and path.exists():
+                with span(f"partial {file.name}") as s:
+                    month = cls.load(path)
+                    s.add(bytes_read=path.stat().st_size)
+            else:
+                month = cls.from_file(file, batch_rows)
+                if path is not None:
+                    path.parent.mkdir(parents=True, exist_ok=True)
+                    # np.savez adds .npz to names without it, so the temporary name has to end in .npz
+                    temporary = path.with_name(f"{path.stem}.{os.getpid()}.tmp.npz")
+                    month.save(temporary)
+                    temporary.replace(path)
+                    hashes.save()
+            histogram.merge(month)
+        return histogram
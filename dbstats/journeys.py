@@ -0,0 +1,202 @@
+"""Journey planning with the Connection Scan Algorithm, scored with the historical delays.
+
+The timetable of a day is a set of connections, one per segment of dbstats.segments (a train going
+from one stop to the next), with the planned departure and arrival times. They are sorted by departure
+once, into flat arrays, and a query scans them from the first connection at or after the departure
+time: a connection can be used if its trip was already boarded or the train is at its departure stop
+at least min_transfer minutes before it leaves. The scan ends as soon as the connections depart after
+the best arrival at the target found so far.
+
+The reliability of an itinerary comes from the delays and cancellations over the months of segments:
+every transfer succeeds with the probability that the arrival delay of the incoming train minus the
+departure delay of the outgoing train stays within the planned slack minus min_transfer, computed from
+the delay distributions of those trains at the transfer station (falling back to all trains at the
+station, then to all trains). Every leg is canceled with the historical rate of its train.
+
+    timetable = Timetable.from_segments(read_segments(["2024-09"]), "2024-09-16")
+    reliability = Reliability.from_segments(read_segments())
+    journey = timetable.earliest_arrival("Köln Hbf", "Berlin Hbf", "2024-09-16 08:00")
+    reliability.score(journey)
+"""
+
+from itertools import pairwise
+
+import numpy as np
+import pandas as pd
+
+MIN_TRANSFER = pd.Timedelta(minutes=3)
+# Delay distributions are kept per minute from 0 (or early) up to MAX_DELAY
+MAX_DELAY = 180
+# A distribution needs this many samples, otherwise the next more general one is used
+MIN_SAMPLES = 20
+INF = np.iinfo("int64").max
+
+
+class Timetable:
+    def __init__(self, connections):
+        """Connections from a segments DataFrame, planned times only, sorted by departure."""
+        connections = connections.dropna(
+            subset=["departure_planned", "arrival_planned", "from_station", "to_station"]
+        )
+        connections = connections[connections["arrival_planned"] >= connections["departure_planned"]]
+        connections = connections.sort_values(["departure_planned", "arrival_planned"], kind="stable")
+        stations = pd.concat([connections["from_station"].astype(str), connections["to_station"].astype(str)])
+        _, self.stations = pd.factorize(stations)
+        self.station_codes = {station: code for code, station in enumerate(self.stations)}
+        trip, self.trip_ids = pd.factorize(connections["ride_id"].astype(str))
+
+        self.departure = connections["departure_planned"].to_numpy(dtype="datetime64[ns]").astype("int64")
+        self.arrival = connections["arrival_planned"].to_numpy(dtype="datetime64[ns]").astype("int64")
+        self.from_stop = self.stations.get_indexer(connections["from_station"].astype(str))
+        self.to_stop = self.stations.get_indexer(connections["to_station"].astype(str))
+        self.trip = trip
+        self.train_name = connections["train_name"].astype(str).to_numpy()
+        # The scan reads single elements, which is much faster from lists than from numpy arrays
+        self._arrays = (
+            self.departure.tolist(),
+            self.arrival.tolist(),
+            self.from_stop.tolist(),
+            self.to_stop.tolist(),
+            self.trip.tolist(),
+        )
+
+    @classmethod
+    def from_segments(cls, segments, day, overnight=pd.Timedelta(hours=6)):
+        """The connections departing on day, and until overnight into the next day for late journeys."""
+        start = pd.Timestamp(day).normalize()
+        departure = segments["departure_planned"]
+        return cls(segments[(departure >= start) & (departure < start + pd.Timedelta(days=1) + overnight)])
+
+    def __len__(self):
+        return len(self.departure)
+
+    def earliest_arrival(self, source, target, departure_time, min_transfer=MIN_TRANSFER):
+        """The itinerary that arrives at target first when leaving source at departure_time or later.
+
+        Returns:
+            list of legs (dicts with train_name, ride_id, from_station, to_station, departure and arrival,
+            planned), empty if the target cannot be reached within the timetable
+        """
+        if source not in self.station_codes or target not in self.station_codes:
+            return []
+        source, target = self.station_codes[source], self.station_codes[target]
+        transfer = int(pd.Timedelta(min_transfer).value)
+        departure, arrival, from_stop, to_stop, trip = self._arrays
+
+        # earliest[stop]: earliest time a train can be boarded at stop, the arrival there plus the transfer
+        earliest = [INF] * len(self.stations)
+        earliest[source] = int(pd.Timestamp(departure_time).value)
+        # boarded_at[trip]: connection where the trip was boarded, -1 if not reachable
+        boarded_at = [-1] * len(self.trip_ids)
+        # leg[stop]: (first, last) connection of the leg that arrives at stop first
+        leg = [None] * len(self.stations)
+
+        first = int(np.searchsorted(self.departure, earliest[source]))
+        for c in range(first, len(departure)):
+            # Nothing that leaves after the best arrival at the target can improve it
+            if departure[c] + transfer >= earliest[target]:
+                break
+            t = trip[c]
+            if boarded_at[t] < 0 and earliest[from_stop[c]] <= departure[c]:
+                boarded_at[t] = c
+            if boarded_at[t] >= 0 and arrival[c] + transfer < earliest[to_stop[c]]:
+                earliest[to_stop[c]] = arrival[c] + transfer
+                leg[to_stop[c]] = (boarded_at[t], c)
+
+        if leg[target] is None:
+            return []
+        legs = []
+        stop = target
+        while stop != source:
+            board, alight = leg[stop]
+            legs.append(self._leg(board, alight))
+            stop = from_stop[board]
+        return legs[::-1]
+
+    def _leg(self, board, alight):
+        return {
+            "train_name": self.train_name[board],
+            "ride_id": self.trip_ids[self.trip[board]],
+            "from_station": self.stations[self.from_stop[board]],
+            "to_station": self.stations[self.to_stop[alight]],
+            "departure": pd.Timestamp(self.departure[board]),
+            "arrival": pd.Timestamp(self.arrival[alight]),
+        }
+
+
+def _histograms(keys, delays, min_samples=MIN_SAMPLES):
+    """Delay histograms per key, for the keys with at least min_samples delays."""
+    codes, names = pd.factorize(keys)
+    known = (codes >= 0) & ~np.isnan(delays)
+    codes, minutes = codes[known], np.clip(np.rint(delays[known]), 0, MAX_DELAY).astype("int64")
+    counts = np.bincount(codes * (MAX_DELAY + 1) + minutes, minlength=len(names) * (MAX_DELAY + 1))
+    counts = counts.reshape(len(names), MAX_DELAY + 1)
+    totals = counts.sum(axis=1)
+    enough = totals >= min_samples
+    return {name: counts[code] / totals[code] for code, name in enumerate(names) if enough[code]}
+
+
+class Reliability:
+    def __init__(self, arrival, departure, cancellation):
+        """Delay distributions keyed by (train_name, station), station and 0 for all trains."""
+        self.arrival = arrival
+        self.departure = departure
+        self.cancellation = cancellation
+
+    @classmethod
+    def from_segments(cls, segments):
+        """Distributions and cancellation rates from segments with the train, station and delay columns."""
+        train = segments["train_name"].astype(str).to_numpy()
+        from_station = segments["from_station"].astype(str).to_numpy()
+        to_station = segments["to_station"].astype(str).to_numpy()
+        canceled = segments["is_canceled"].to_numpy(bool)
+        arrival_delay = np.where(canceled, np.nan, segments["arrival_delay_min"].to_numpy("float64"))
+        departure_delay = np.where(canceled, np.nan, segments["departure_delay_min"].to_numpy("float64"))
+
+        distributions = []
+        for stations, delays in ((to_station, arrival_delay), (from_station, departure_delay)):
+            histograms = _histograms(pd.MultiIndex.from_arrays([train, stations]), delays)
+            histograms.update(_histograms(stations, delays))
+            histograms.update(_histograms(np.zeros(len(delays), dtype="int64"), delays, 1))
+            distributions.append(histograms)
+        cancellation = pd.Series(canceled).groupby(train).mean().to_dict()
+        return cls(*distributions, cancellation)
+
+    def _distribution(self, histograms, train_name, station):
+        for key in ((train_name, station), station, 0):
+            if key in histograms:
+                return histograms[key]
+        return np.eye(1, MAX_DELAY + 1)[0]
+
+    def transfer_probability(self, incoming, outgoing, min_transfer=MIN_TRANSFER):
+        """Probability to make the transfer from leg incoming to leg outgoing at the same station."""
+        slack = (
+            outgoing["departure"] - incoming["arrival"] - pd.Timedelta(min_transfer)
+        ).total_seconds() / 60
+        station = incoming["to_station"]
+        arrival = self._distribution(self.arrival, incoming["train_name"], station)
+        departure = self._distribution(self.departure, outgoing["train_name"], station)
+        # P(arrival delay - departure delay <= slack), summed over the departure delays
+        cumulative = np.cumsum(arrival)
+        limit = np.floor(slack + np.arange(MAX_DELAY + 1)).astype("int64")
+        reached = np.where(limit < 0, 0.0, cumulative[np.clip(limit, 0, MAX_DELAY)])
+        return float(np.dot(departure, reached))
+
+    def score(self, legs, min_transfer=MIN_TRANSFER):
+        """The itinerary with the probability to complete it and the expected delay at the destination."""
+        not_canceled = [1 - self.cancellation.get(leg["train_name"], 0.0) for leg in legs]
+        transfers = [
+            self.transfer_probability(incoming, outgoing, min_transfer)
+            for incoming, outgoing in pairwise(legs)
+        ]
+        expected_delay = np.nan
+        if legs:
+            last = self._distribution(self.arrival, legs[-1]["train_name"], legs[-1]["to_station"])
+            expected_delay = float(np.dot(last, np.arange(MAX_DELAY + 1)))
+        return {
+            "legs": legs,
+            "transfers": len(transfers),
+            "transfer_probabilities": transfers,
+            "reliability": float(np.prod(not_canceled) * np.prod(transfers)),
+            "expected_arrival_delay": expected_delay,
+        }
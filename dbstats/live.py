@@ -0,0 +1,305 @@
+"""Live ingestion: stop events arriving as small files, folded into running statistics.
+
+A producer drops chunk files of stop events (the columns of dbstats.schema.EVENT_SCHEMA, as parquet or
+CSV) into an incoming directory, named <produced_ns>-<sequence>.<suffix> and renamed into place once
+complete, so a half written chunk is never read. tail() picks up the new files and LiveStats adds them
+up as the sufficient statistics of dbstats.aggregate, per micro-batch:
+
+- stations: station, train type and delay bucket (average delay, percentiles, cancellation rate),
+- train_types: train type,
+- hours: train type, day and hour.
+
+Every refresh interval the statistics are turned into JSON files in the output directory, written
+atomically with dbstats.output, plus status.json with the ingest throughput and latency. The latency of an
+event is the time from its chunk being produced to the statistics that include it being published.
+Consumed files are left in place: restarting the ingest replays the directory and rebuilds the same
+statistics.
+
+produce() is a stand-in for a real feed: it replays the stop events of a month in time order at a
+given rate of events per second.
+"""
+
+import json
+import os
+import time
+from collections import deque
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from dbstats.aggregate import COMPACT_EVERY, batch_stats, merge, total
+from dbstats.output import write_json
+from dbstats.schema import EVENT_SCHEMA, read_csv, read_parquet
+from dbstats.sketch import QUANTILES, delay_buckets, quantiles
+from dbstats.taxonomy import MAIN_TRAIN_TYPES
+from dbstats.trace import span
+
+LIVE_DIR = Path("build") / "live"
+REFRESH = 5.0
+POLL = 0.2
+# Latencies of the most recent chunks kept for the percentiles
+LATENCY_WINDOW = 10_000
+AGGREGATIONS = {
+    "stations": ["station", "train_type", "delay_bucket"],
+    "train_types": ["train_type"],
+    "hours": ["train_type", "day", "hour"],
+}
+
+
+def tail(incoming, seen):
+    """The chunk files in incoming that are not in seen yet, oldest first; adds them to seen.
+
+    Returns:
+        list of (produced_ns, path), the time from the file name or its modification time for files
+        that were not named by a producer
+    """
+    new = []
+    with os.scandir(incoming) as entries:
+        for entry in entries:
+            if entry.name in seen or not entry.name.endswith((".parquet", ".csv")):
+                continue
+            seen.add(entry.name)
+            prefix = entry.name.split("-", 1)[0]
+            produced = int(prefix) if prefix.isdigit() else entry.stat().st_mtime_ns
+            new.append((produced, Path(entry.path)))
+    return sorted(new)
+
+
+def weighted_percentiles(values, weights, percentiles):
+    """Percentiles (0 to 100) of values that each stand for weights events."""
+    order = np.argsort(values)
+    values, cumulative = np.asarray(values)[order], np.cumsum(np.asarray(weights)[order])
+    ranks = np.asarray(percentiles) / 100 * cumulative[-1]
+    return values[np.minimum(np.searchsorted(cumulative, ranks), len(values) - 1)]
+
+
+def read_chunk(path):
+    """A chunk file with the declared column types."""
+    if path.suffix == ".csv":
+        return read_csv(path)
+    return read_parquet(path)
+
+
+class LiveStats:
+    def __init__(self):
+        self.partials = {name: [] for name in AGGREGATIONS}
+        self.events = 0
+        self.last_event = None
+
+    def add(self, df):
+        """Add the statistics of a micro-batch of stop events."""
+        if not len(df):
+            return
+        df = df.assign(
+            delay_bucket=delay_buckets(df["delay_in_min"]),
+            day=df["time"].dt.floor("D"),
+            hour=df["time"].dt.hour,
+        )
+        for name, by in AGGREGATIONS.items():
+            partials = self.partials[name]
+            partials.append(batch_stats(df, by, dropna=False))
+            # Merged every few batches, so that a micro-batch costs about its own size
+            if len(partials) >= COMPACT_EVERY:
+                self.partials[name] = [merge(partials, dropna=False)]
+        self.events += len(df)
+        latest = df["time"].max()
+        if pd.notna(latest) and (self.last_event is None or latest > self.last_event):
+            self.last_event = latest
+
+    def totals(self, name):
+        """The statistics of an aggregation over everything added so far."""
+        partials = self.partials[name]
+        if len(partials) > 1:
+            self.partials[name] = partials = [merge(partials, dropna=False)]
+        return partials[0] if partials else None
+
+
+def _records(df):
+    """Rows of a DataFrame as JSON records, NaN as null."""
+    return json.loads(df.to_json(orient="records", date_format="iso", force_ascii=False))
+
+
+def station_table(stats):
+    """Per station the statistics of all trains and of every train type, like questions/bahnhof."""
+    delay_counts = stats["delay_count"]
+    stats = total(stats, "delay_bucket", dropna=False)
+
+    def statistics(sums, counts):
+        return (
+            pd.DataFrame(
+                {
+                    "average_delay": (sums["delay_sum"] / sums["delay_count"]).round(2),
+                    "cancellation_rate": (sums["canceled"] / sums["rows"]).round(2),
+                    "sample_size": sums["rows"],
+                }
+            )
+            .join(quantiles(counts).round(2))
+            .reset_index()
+        )
+
+    all_trains = statistics(total(stats, "train_type"), total(delay_counts, "train_type"))
+    all_trains["train_type"] = "alle Züge"
+    per_type = statistics(stats, delay_counts).dropna(subset=["station", "train_type"])
+    combined = pd.concat([all_trains, per_type], ignore_index=True).dropna(subset=["station"])
+    combined = combined.sort_values(["station", "sample_size"], ascending=[True, False])
+    columns = ["station", "train_type", "average_delay", *QUANTILES, "cancellation_rate", "sample_size"]
+    table = {}
+    for record in _records(combined[columns]):
+        table.setdefault(record.pop("station"), []).append(record)
+    return table
+
+
+def train_type_table(stats):
+    """Average delay, punctuality and cancellation rate per train type."""
+    stats = stats[stats.index.notna()]
+    table = pd.DataFrame(
+        {
+            "average_delay": (stats["delay_sum"] / stats["delay_count"]).round(2),
+            "punctuality": (stats["punctual"] / stats["valid"]).round(4),
+            "cancellation_rate": (stats["canceled"] / stats["rows"]).round(4),
+            "sample_size": stats["rows"],
+        }
+    )
+    return _records(table.sort_values("sample_size", ascending=False).reset_index())
+
+
+def hour_table(stats):
+    """Stops, average delay, punctuality and cancellation rate per day and hour, for all trains and the main
+    train types."""
+    stats = stats[stats.index.get_level_values("day").notna()]
+    tables = {"all": stats.groupby(level=["day", "hour"]).sum()}
+    for train_type in MAIN_TRAIN_TYPES:
+        selected = stats[stats.index.get_level_values("train_type") == train_type]
+        tables[train_type] = selected.droplevel("train_type")
+    return {
+        name: _records(
+            pd.DataFrame(
+                {
+                    "stops": sums["rows"],
+                    "average_delay": (sums["delay_sum"] / sums["delay_count"]).round(2),
+                    "punctuality": (sums["punctual"] / sums["valid"]).round(4),
+                    "cancellation_rate": (sums["canceled"] / sums["rows"]).round(4),
+                }
+            )
+            .sort_index()
+            .reset_index()
+            .astype({"hour": "int64"})
+        )
+        for name, sums in tables.items()
+    }
+
+
+class LiveIngest:
+    def __init__(self, incoming, out_dir=LIVE_DIR, refresh=REFRESH):
+        self.incoming = Path(incoming)
+        self.incoming.mkdir(parents=True, exist_ok=True)
+        self.out_dir = Path(out_dir)
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        self.refresh = refresh
+        self.stats = LiveStats()
+        self.seen = set()
+        self.started = time.perf_counter()
+        self.busy = 0.0
+        self.batches = 0
+        # (events, produced_ns) of the chunks added since the last publish, (latency, events) once published
+        self.unpublished = []
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.last_publish = None
+
+    def poll(self):
+        """Read and add the new chunk files as one micro-batch, returns the number of events."""
+        files = tail(self.incoming, self.seen)
+        if not files:
+            return 0
+        started = time.perf_counter()
+        with span("live batch") as s:
+            chunks = [read_chunk(path) for _, path in files]
+            batch = pd.concat(chunks, ignore_index=True)
+            self.stats.add(batch)
+            s.add(rows=len(batch))
+        self.unpublished.extend((len(chunk), produced) for chunk, (produced, _) in zip(chunks, files))
+        self.batches += 1
+        self.busy += time.perf_counter() - started
+        return len(batch)
+
+    def publish(self):
+        """Write the JSON files of the current statistics and status.json."""
+        started = time.perf_counter()
+        with span("live publish") as s:
+            for name, table in (
+                ("stations", station_table),
+                ("train_types", train_type_table),
+                ("hours", hour_table),
+            ):
+                stats = self.stats.totals(name)
+                if stats is not None:
+                    path = self.out_dir / f"{name}.json"
+                    write_json(path, table(stats))
+                    s.wrote(path)
+        published = time.time_ns()
+        self.latencies.extend(((published - produced) / 1e9, events) for events, produced in self.unpublished)
+        self.unpublished = []
+        self.busy += time.perf_counter() - started
+        self.last_publish = time.perf_counter()
+        write_json(self.out_dir / "status.json", self.status())
+
+    def status(self):
+        """Events, throughput and latency percentiles of the ingest so far."""
+        elapsed = time.perf_counter() - self.started
+        p50 = p99 = None
+        if self.latencies:
+            latencies, weights = zip(*self.latencies)
+            p50, p99 = (
+                round(float(value), 3) for value in weighted_percentiles(latencies, weights, [50, 99])
+            )
+        return {
+            "events": self.stats.events,
+            "batches": self.batches,
+            "files": len(self.seen),
+            "last_event": None if self.stats.last_event is None else self.stats.last_event.isoformat(),
+            "events_per_second": self.stats.events / elapsed if elapsed else 0.0,
+            # Events per second of time spent ingesting and publishing, what one core sustains
+            "capacity_per_second": self.stats.events / self.busy if self.busy else None,
+            "busy_share": self.busy / elapsed if elapsed else 0.0,
+            "latency_p50_s": p50,
+            "latency_p99_s": p99,
+        }
+
+    def step(self):
+        """Poll once and publish if the refresh interval has passed, returns the events read."""
+        events = self.poll()
+        if self.last_publish is None or time.perf_counter() - self.last_publish >= self.refresh:
+            self.publish()
+        return events
+
+
+def produce(events, incoming, rate, interval=1.0, suffix=".parquet", limit=None):
+    """Write the stop events to incoming in time order, rate events per second in chunks every interval.
+
+    Args:
+        events: DataFrame with the EVENT_SCHEMA columns
+        incoming: the directory the ingest tails
+        rate: events per second
+        interval: seconds between chunks
+        suffix: ".parquet" or ".csv"
+        limit: stop after this many events, all if None
+    """
+    incoming = Path(incoming)
+    incoming.mkdir(parents=True, exist_ok=True)
+    events = events[list(EVENT_SCHEMA)].sort_values("time", kind="stable", ignore_index=True)
+    if limit is not None:
+        events = events.iloc[:limit]
+    per_chunk = max(int(rate * interval), 1)
+    started = time.perf_counter()
+    for sequence, start in enumerate(range(0, len(events), per_chunk)):
+        chunk = events.iloc[start : start + per_chunk]
+        name = f"{time.time_ns()}-{sequence:08d}{suffix}"
+        temporary = incoming / f".{name}.tmp"
+        if suffix == ".csv":
+            chunk.to_csv(temporary, index=False)
+        else:
+            chunk.to_parquet(temporary, index=False)
+        temporary.replace(incoming / name)
+        # Keep to the schedule, chunk i is due at i * interval
+        time.sleep(max(started + (sequence + 1) * interval - time.perf_counter(), 0))
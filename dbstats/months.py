@@ -0,0 +1,60 @@
+"""Selection of the monthly data files the question scripts read."""
+
+from pathlib import Path
+
+import pandas as pd
+
+from dbstats.trace import read_parquet
+
+# download_data.sh saves the monthly releases as data/data-YYYY-MM.parquet, the scripts run from the repo root.
+DATA_DIR = Path("data")
+# A ride whose last stop in a file is this close to the last event of the file may continue in the next one
+CARRY_OVER = pd.Timedelta(hours=12)
+
+
+def month_files(last=None, data_dir=DATA_DIR):
+    """The monthly files in chronological order, only the last ones if last is given.
+
+    The build cache (dbstats.cache) reads the literal value of last from the scripts to know which
+    files a question depends on, so pass it as a constant.
+    """
+    files = sorted(Path(data_dir).iterdir())
+    return files[-last:] if last else files
+
+
+def month_of(file):
+    """YYYY-MM of a data-YYYY-MM.parquet file."""
+    return Path(file).stem.removeprefix("data-")
+
+
+def stitched_months(
+    files, columns, ride_column="train_line_ride_id", time_column="time", carry_over=CARRY_OVER
+):
+    """The rows of the monthly files one month at a time, with all stops of a ride in the same month.
+
+    Rides that run over the end of a file (night trains around midnight of the last day) are held back
+    and yielded with the next file, so grouping by ride_column per month neither splits them nor counts
+    them twice. A ride is held back if its last stop is within carry_over of the last event of the file;
+    only those rides are kept in memory between files, the ones that do not continue are released with
+    the next file. The last file is yielded with everything that is left.
+
+    Args:
+        files: the monthly parquet files in chronological order, e.g. month_files(last=3)
+        columns: the columns to read, ride_column and time_column are added if missing
+
+    Yields:
+        (file, DataFrame) with the rows of the file and the rides carried over from the previous one
+    """
+    read = list(dict.fromkeys([*columns, ride_column, time_column]))
+    held = None
+    for i, file in enumerate(files):
+        df = read_parquet(file, columns=read)
+        if held is not None:
+            df = pd.concat([held, df], ignore_index=True)
+        if i == len(files) - 1:
+            yield file, df
+            break
+        last_stop = df.groupby(ride_column)[time_column].transform("max")
+        open_rides = (last_stop >= df[time_column].max() - carry_over).to_numpy()
+        held = df[open_rides].reset_index(drop=True)
+        yield file, df[~open_rides].reset_index(drop=True)
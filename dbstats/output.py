@@ -0,0 +1,149 @@
+"""Atomic, compact writer for the JSON outputs of the questions.
+
+write_json() encodes the data once and then
+- skips the write when the file already has exactly that content, so unchanged outputs keep their
+  modification time and do not show up as changes,
+- writes to a temporary file in the same directory and renames it into place, so a failed or
+  interrupted run never leaves a half written file behind,
+- optionally writes precompressed siblings (<name>.gz, <name>.br) for static hosting, chosen with
+  compress or DBSTATS_PRECOMPRESS=gz,br. Siblings that are not requested are removed when the content
+  changes, so they are never stale.
+
+The JSON is compact by default (no indentation and no spaces after separators), which is what makes the
+standard library encoder take its C implementation, and non-ASCII characters are written as UTF-8.
+DataFrames are written as records by the pandas encoder. brotli is an optional dependency, it is only
+imported when .br siblings are requested.
+
+    write_json(save_dir / "stats.json", {"stations": stations})
+    write_json(save_dir / "trains.json", train_stats, compress=["gz", "br"])
+
+Large files that are written piece by piece use atomic_writer(), which also hashes and counts the bytes
+on the way:
+
+    with atomic_writer(out) as f:
+        df.to_csv(f, index=False)
+    digest, size = f.sha256.hexdigest(), f.size
+"""
+
+import gzip
+import hashlib
+import io
+import json
+import os
+from contextlib import contextmanager
+from pathlib import Path
+
+import pandas as pd
+
+COMPRESSIONS = ["gz", "br"]
+
+
+def precompress():
+    """The compressions selected with DBSTATS_PRECOMPRESS, e.g. gz,br."""
+    selected = [name.strip() for name in os.environ.get("DBSTATS_PRECOMPRESS", "").split(",") if name.strip()]
+    unknown = set(selected) - set(COMPRESSIONS)
+    if unknown:
+        raise ValueError(f"unknown compressions {sorted(unknown)} in DBSTATS_PRECOMPRESS, use {COMPRESSIONS}")
+    return selected
+
+
+def encode(data, indent=None, default=None):
+    """JSON of data as UTF-8 bytes, DataFrames as a list of records."""
+    if isinstance(data, pd.DataFrame):
+        return data.to_json(orient="records", force_ascii=False, indent=indent or 0).encode("utf-8")
+    separators = (",", ":") if indent is None else (",", ": ")
+    return json.dumps(data, ensure_ascii=False, indent=indent, separators=separators, default=default).encode(
+        "utf-8"
+    )
+
+
+def compressed(content, compression):
+    """content compressed as gz or br, the same bytes for the same content."""
+    if compression == "gz":
+        return gzip.compress(content, compresslevel=9, mtime=0)
+    if compression == "br":
+        import brotli
+
+        return brotli.compress(content, quality=11)
+    raise ValueError(f"unknown compression {compression}, use {COMPRESSIONS}")
+
+
+def _unchanged(path, content):
+    try:
+        return path.stat().st_size == len(content) and path.read_bytes() == content
+    except FileNotFoundError:
+        return False
+
+
+class HashingFile(io.RawIOBase):
+    """Binary file that passes the bytes written on to raw and keeps their sha256 and count."""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.sha256.update(data)
+        self.size += len(data)
+        return self.raw.write(data)
+
+
+@contextmanager
+def atomic_writer(path):
+    """A HashingFile for path, written to a temporary file that replaces path when the block succeeds."""
+    path = Path(path)
+    # Written next to the target and renamed, a reader never sees a half written file
+    temporary = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        with temporary.open("wb") as raw:
+            yield HashingFile(raw)
+        temporary.replace(path)
+    finally:
+        temporary.unlink(missing_ok=True)
+
+
+def _replace(path, content):
+    with atomic_writer(path) as f:
+        f.write(content)
+
+
+def write_bytes(path, content, compress=None):
+    """Write content to path atomically unless it is already there, returns whether anything was written.
+
+    Args:
+        path: the output file
+        content: bytes to write
+        compress: list of COMPRESSIONS to write as siblings, DBSTATS_PRECOMPRESS if None
+    """
+    path = Path(path)
+    compress = precompress() if compress is None else list(compress)
+    siblings = {name: path.with_name(f"{path.name}.{name}") for name in COMPRESSIONS}
+    changed = not _unchanged(path, content)
+    if changed:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        for name, sibling in siblings.items():
+            if name not in compress:
+                sibling.unlink(missing_ok=True)
+        _replace(path, content)
+    for name in compress:
+        if changed or not siblings[name].exists():
+            _replace(siblings[name], compressed(content, name))
+            changed = True
+    return changed
+
+
+def write_json(path, data, indent=None, compress=None, default=None):
+    """Write data as JSON to path atomically unless it has not changed, returns whether anything was written.
+
+    Args:
+        path: the output file
+        data: anything json.dumps() takes, or a DataFrame to write as records
+        indent: indentation for readable files, compact if None
+        compress: list of COMPRESSIONS to write as siblings, DBSTATS_PRECOMPRESS if None
+        default: function for the objects json.dumps() cannot encode
+    """
+    return write_bytes(path, encode(data, indent, default), compress)
@@ -0,0 +1,87 @@
+"""Stores derived from the monthly files, one parquet partition per month in <store>/month=YYYY-MM/.
+
+write_partitions() computes a DataFrame per month and only rebuilds the months whose inputs changed since
+the last build. <store>/_manifest.json remembers per month the source file, its content hash and the key
+of the partition: the hashes of the module of the compute function and the local modules it imports, of
+the file, and with stitch also of the file before it and whether it was the last file. A partition is
+written to a temporary file and renamed into place, so readers never see half of one; names starting
+with _ are skipped by pyarrow datasets.
+
+    write_partitions(files, SEGMENTS_DIR, month_segments, COLUMNS, "segments", stitch=True)
+"""
+
+import hashlib
+import inspect
+import json
+from pathlib import Path
+
+from dbstats.cache import HashIndex, local_sources
+from dbstats.months import month_of, stitched_months
+from dbstats.trace import read_parquet, span
+
+
+def _describe(df):
+    return {"rows": len(df)}
+
+
+def write_partitions(files, store_dir, compute, columns, name, stitch=False, describe=_describe, force=False):
+    """Write compute() of every month whose inputs changed since the last build, returns those months.
+
+    Args:
+        files: the monthly parquet files in chronological order
+        store_dir: directory of the partitions and the manifest
+        compute: function of the DataFrame of a month to the DataFrame to store
+        columns: the columns compute() needs
+        name: what the store holds, for the traces and the progress output
+        stitch: read the months with stitched_months(), so rides that cross the end of a month are in the
+            partition of the month they end in
+        describe: function of a stored DataFrame to the statistics kept in the manifest
+        force: rebuild every month
+    """
+    files = list(files)
+    store_dir = Path(store_dir)
+    manifest_file = store_dir / "_manifest.json"
+    manifest = json.loads(manifest_file.read_text()) if manifest_file.exists() else {}
+    hashes = HashIndex()
+    code = [hashes(source) for source in local_sources(inspect.getsourcefile(compute))]
+    digests = [hashes(file) for file in files]
+    keys = []
+    for i, digest in enumerate(digests):
+        # A stitched month holds rides of the month before, and hands its open ones on unless it is the last
+        neighbours = [digests[i - 1] if i else None, i == len(files) - 1] if stitch else []
+        keys.append(hashlib.sha256(json.dumps([code, digest, *neighbours]).encode()).hexdigest()[:16])
+    pending = [
+        i
+        for i, file in enumerate(files)
+        if force
+        or manifest.get(month_of(file), {}).get("key") != keys[i]
+        or not (store_dir / f"month={month_of(file)}").exists()
+    ]
+    # The rides carried over into the first pending month come from the month before it
+    start = max(pending[0] - 1, 0) if pending else len(files)
+    stitched = stitched_months(files[start:], columns) if stitch else None
+    written = []
+    for i, file in enumerate(files):
+        month = month_of(file)
+        partition = store_dir / f"month={month}"
+        if stitch and start <= i <= pending[-1]:
+            df = next(stitched)[1]
+        if i not in pending:
+            print(f"{file.name}: unchanged, keeping {partition}")
+            continue
+        if not stitch:
+            df = read_parquet(file, columns=columns)
+        with span(f"{name} {month}", rows=len(df)):
+            result = compute(df)
+        partition.mkdir(parents=True, exist_ok=True)
+        with span(f"write {partition.name}", rows=len(result)) as s:
+            temporary = partition / "_part-0.parquet.tmp"
+            result.to_parquet(temporary, index=False)
+            temporary.replace(partition / "part-0.parquet")
+            s.wrote(partition / "part-0.parquet")
+        manifest[month] = {"source": file.name, "sha256": digests[i], "key": keys[i], **describe(result)}
+        manifest_file.write_text(json.dumps(manifest, indent=2, sort_keys=True))
+        hashes.save()
+        print(f"{file.name} → {partition} | {name}: {len(result):,}")
+        written.append(month)
+    return written
@@ -0,0 +1,214 @@
+"""Plot specs: the question scripts describe their charts as data, a render stage draws them.
+
+A spec is a JSON-serializable dict with the figure settings, the axes settings and a list of series
+(bar, line or scatter). emit() writes it as <name>.plot.json next to the PNG it describes, so the
+charts can also be drawn client-side from the data alone, and then, depending on DBSTATS_RENDER,
+- "inline" (default): renders the PNG right away,
+- "queue": appends the spec path to DBSTATS_RENDER_QUEUE for render_specs() to draw later in a
+  process pool, which is what run_all_calculations.py does,
+- "none": only writes the spec.
+"""
+
+import json
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from dbstats.output import write_json
+from dbstats.trace import span
+
+SPEC_SUFFIX = ".plot.json"
+
+
+def _plain(values):
+    """Lists of JSON values from arrays, Series and Indexes, NaN becomes None."""
+    if hasattr(values, "tolist"):
+        values = values.tolist()
+    return [None if isinstance(v, float) and math.isnan(v) else v for v in values]
+
+
+def _json_default(value):
+    """numpy arrays and scalars in the axes settings."""
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def figure(output, figsize=(12, 6), dpi=150, **axes):
+    """A new spec for the PNG at output, keyword arguments are axes settings.
+
+    Axes settings: title, xlabel, ylabel, right_ylabel, xlim, ylim, xticks ({"positions" and optionally
+    "labels", "rotation", "ha"}), xtick_rotation, yformat ("percent" or "thousands"), ylocator, legend (kwargs
+    for ax.legend), grid (kwargs for ax.grid).
+    """
+    return {
+        "output": Path(output).name,
+        "path": str(output),
+        "figsize": list(figsize),
+        "dpi": dpi,
+        "axes": axes,
+        "series": [],
+    }
+
+
+def bar(x, height, width=0.8, axis="left", value_labels=None, **style):
+    """Bars, value_labels ({"format": "{:.2f}", "x_offset": 0}) writes the height above each bar."""
+    return {
+        "kind": "bar",
+        "x": _plain(x),
+        "y": _plain(height),
+        "width": width,
+        "axis": axis,
+        "value_labels": value_labels,
+        "style": style,
+    }
+
+
+def line(x, y, axis="left", **style):
+    return {"kind": "line", "x": _plain(x), "y": _plain(y), "axis": axis, "style": style}
+
+
+def scatter(x, y, sizes=None, axis="left", **style):
+    sizes = None if sizes is None else _plain(sizes)
+    return {"kind": "scatter", "x": _plain(x), "y": _plain(y), "sizes": sizes, "axis": axis, "style": style}
+
+
+def spec_path(output):
+    output = Path(output)
+    return output.with_name(output.stem + SPEC_SUFFIX)
+
+
+def emit(spec):
+    """Write the spec next to its PNG and render or queue it according to DBSTATS_RENDER."""
+    path = spec_path(spec.pop("path"))
+    write_json(path, spec, default=_json_default)
+    mode = os.environ.get("DBSTATS_RENDER", "inline")
+    if mode == "inline":
+        with span(f"render {spec['output']}") as s:
+            render(path)
+            s.wrote(path.with_name(spec["output"]))
+    elif mode == "queue":
+        with open(os.environ["DBSTATS_RENDER_QUEUE"], "a", encoding="utf-8") as f:
+            f.write(f"{path.resolve()}\n")
+    return path
+
+
+def _formatter(name):
+    import matplotlib.pyplot as plt
+
+    if name == "percent":
+        return plt.FuncFormatter(lambda x, _: f"{int(x)}%")
+    if name == "thousands":
+        return plt.FuncFormatter(lambda x, _: format(int(x), ","))
+    raise ValueError(f"Unknown yformat: {name}")
+
+
+def _values(values):
+    return [np.nan if v is None else v for v in values]
+
+
+def render(path):
+    """Draw the spec at path and save the PNG next to it."""
+    import matplotlib.pyplot as plt
+
+    path = Path(path)
+    with path.open(encoding="utf-8") as f:
+        spec = json.load(f)
+    settings = spec["axes"]
+    fig, ax = plt.subplots(figsize=spec["figsize"])
+    axes = {"left": ax}
+    if any(series["axis"] == "right" for series in spec["series"]):
+        axes["right"] = ax.twinx()
+
+    for series in spec["series"]:
+        target = axes[series["axis"]]
+        x, y = _values(series["x"]), _values(series["y"])
+        if series["kind"] == "bar":
+            bars = target.bar(x, y, series["width"], **series["style"])
+            labels = series["value_labels"]
+            if labels:
+                for b in bars:
+                    target.text(
+                        b.get_x() + b.get_width() / 2.0 + labels.get("x_offset", 0),
+                        b.get_height(),
+                        labels["format"].format(b.get_height()),
+                        ha="center",
+                        va="bottom",
+                    )
+        elif series["kind"] == "line":
+            target.plot(x, y, **series["style"])
+        elif series["kind"] == "scatter":
+            target.scatter(x, y, s=series["sizes"], **series["style"])
+        else:
+            raise ValueError(f"Unknown series kind: {series['kind']}")
+
+    if "title" in settings:
+        ax.set_title(settings["title"])
+    if "xlabel" in settings:
+        ax.set_xlabel(settings["xlabel"])
+    if "ylabel" in settings:
+        ax.set_ylabel(settings["ylabel"])
+    if "right_ylabel" in settings:
+        axes["right"].set_ylabel(settings["right_ylabel"])
+    if "xlim" in settings:
+        ax.set_xlim(*settings["xlim"])
+    if "ylim" in settings:
+        ax.set_ylim(*settings["ylim"])
+    if "xticks" in settings:
+        ticks = settings["xticks"]
+        ax.set_xticks(ticks["positions"])
+        if "labels" in ticks:
+            ax.set_xticklabels(
+                ticks["labels"], rotation=ticks.get("rotation", 0), ha=ticks.get("ha", "center")
+            )
+    if "xtick_rotation" in settings:
+        plt.setp(ax.get_xticklabels(), rotation=settings["xtick_rotation"])
+    if "yformat" in settings:
+        ax.yaxis.set_major_formatter(_formatter(settings["yformat"]))
+    if "ylocator" in settings:
+        ax.yaxis.set_major_locator(plt.MultipleLocator(settings["ylocator"]))
+    if "grid" in settings:
+        ax.grid(True, **settings["grid"])
+    if "legend" in settings:
+        # One legend for both axes, drawn on the top one.
+        handles, labels = [], []
+        for target in axes.values():
+            target_handles, target_labels = target.get_legend_handles_labels()
+            handles += target_handles
+            labels += target_labels
+        list(axes.values())[-1].legend(handles, labels, **settings["legend"])
+
+    fig.tight_layout()
+    fig.savefig(path.with_name(spec["output"]), dpi=spec["dpi"], bbox_inches="tight")
+    plt.close(fig)
+    return path.with_name(spec["output"])
+
+
+def _init_worker():
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot
+
+
+def _render_one(path):
+    try:
+        return path, render(path), None
+    except Exception as e:
+        return path, None, f"{type(e).__name__}: {e}"
+
+
+def render_specs(paths, workers=None):
+    """Render specs in a process pool with the Agg backend loaded, returns {spec path: error}."""
+    paths = [Path(p) for p in dict.fromkeys(paths)]
+    errors = {}
+    if not paths:
+        return errors
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        for path, _, error in pool.map(_render_one, paths):
+            if error:
+                errors[path] = error
+    return errors
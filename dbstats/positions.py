@@ -0,0 +1,211 @@
+"""Train positions at fixed time steps, interpolated between the stations for the map.
+
+Every ride is split into intervals: dwelling at a stop (arrival to departure, the train stands at the
+station) and running between consecutive stops (departure to the next arrival, the train moves on a
+straight line between the two stations). For every multiple of the step the position of each train
+is the linear interpolation within the interval that contains it, computed for all intervals at once
+with np.repeat. Times are the actual ones where known and the planned ones otherwise, canceled stops
+and stations without coordinates in station_cache/stations_index.csv are left out.
+
+The snapshots are written per window of WINDOW_STEPS steps as little-endian binary blocks that the
+browser reads with typed arrays, next to an index.json:
+
+    positions-YYYY-MM/index.json   step_ms, window_steps, the bounding box for the coordinates, the
+                                   train names and ride ids, and per window its start_ms, file and rows
+    positions-YYYY-MM/<start_ms>.bin
+        uint32[window_steps + 1]   row offsets of the steps, step i has the rows offsets[i]:offsets[i + 1]
+        uint32[rows]               index of the train in index.json
+        uint16[rows] x, y          lon and lat, scaled linearly from the bounding box to 0..65535
+        int16[rows]                current delay in minutes
+"""
+
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from dbstats.trace import span
+
+STATION_INDEX = Path(__file__).resolve().parent.parent / "station_cache" / "stations_index.csv"
+STEP = pd.Timedelta(seconds=30)
+# 120 steps of 30 s, one file per hour
+WINDOW_STEPS = 120
+COLUMNS = [
+    "station",
+    "train_name",
+    "train_line_ride_id",
+    "train_line_station_num",
+    "is_canceled",
+    "arrival_planned_time",
+    "arrival_change_time",
+    "departure_planned_time",
+    "departure_change_time",
+]
+SCALE = 65535
+
+
+def station_coordinates(path=STATION_INDEX):
+    """DataFrame of lat and lon indexed by station name."""
+    stations = pd.read_csv(path, usecols=["name", "lat", "lon"]).dropna()
+    return stations.drop_duplicates("name").set_index("name")
+
+
+def _ns(times):
+    return pd.to_datetime(times).to_numpy(dtype="datetime64[ns]").astype("int64")
+
+
+def intervals(df, coordinates):
+    """The dwelling and running intervals of the rides in a DataFrame with the COLUMNS.
+
+    Returns:
+        dict of arrays: ride (code into rides), start, end (ns), from_lat, from_lon, to_lat, to_lon and
+        delay, plus rides and train_names, the ride ids and train names of the ride codes
+    """
+    df = df[~df["is_canceled"].fillna(False).astype(bool) & df["station"].isin(coordinates.index)]
+    ride_codes, ride_ids = pd.factorize(df["train_line_ride_id"])
+    order = np.lexsort((df["train_line_station_num"].to_numpy(), ride_codes))
+    order = order[ride_codes[order] >= 0]
+    df = df.iloc[order]
+    ride_codes = ride_codes[order]
+
+    arrival_planned, departure_planned = _ns(df["arrival_planned_time"]), _ns(df["departure_planned_time"])
+    arrival = np.where(df["arrival_change_time"].notna(), _ns(df["arrival_change_time"]), arrival_planned)
+    departure = np.where(
+        df["departure_change_time"].notna(), _ns(df["departure_change_time"]), departure_planned
+    )
+    nat = np.iinfo("int64").min
+    with np.errstate(invalid="ignore"):
+        arrival_delay = np.where(
+            (arrival != nat) & (arrival_planned != nat), (arrival - arrival_planned) / 6e10, np.nan
+        )
+        departure_delay = np.where(
+            (departure != nat) & (departure_planned != nat), (departure - departure_planned) / 6e10, np.nan
+        )
+    location = coordinates.loc[df["station"]]
+    lat, lon = location["lat"].to_numpy(), location["lon"].to_numpy()
+
+    # Dwelling at a stop with both times, running from a stop to the next stop of the same ride
+    dwell = (arrival != nat) & (departure != nat)
+    run = np.flatnonzero((ride_codes[:-1] == ride_codes[1:]) & (departure[:-1] != nat) & (arrival[1:] != nat))
+    dwell = np.flatnonzero(dwell)
+    ride = np.concatenate([ride_codes[dwell], ride_codes[run]])
+    start = np.concatenate([arrival[dwell], departure[run]])
+    end = np.concatenate(
+        [np.maximum(departure[dwell], arrival[dwell]), np.maximum(arrival[run + 1], departure[run])]
+    )
+    delay = np.concatenate(
+        [
+            np.where(np.isnan(arrival_delay[dwell]), departure_delay[dwell], arrival_delay[dwell]),
+            departure_delay[run],
+        ]
+    )
+    return {
+        "ride": ride,
+        "start": start,
+        "end": end,
+        "from_lat": np.concatenate([lat[dwell], lat[run]]),
+        "from_lon": np.concatenate([lon[dwell], lon[run]]),
+        "to_lat": np.concatenate([lat[dwell], lat[run + 1]]),
+        "to_lon": np.concatenate([lon[dwell], lon[run + 1]]),
+        "delay": delay,
+        "rides": ride_ids,
+        "train_names": df["train_name"].to_numpy()[np.searchsorted(ride_codes, np.arange(len(ride_ids)))],
+    }
+
+
+def snapshot(spans, first, steps, step=STEP):
+    """Positions of the trains at first + i * step for i in range(steps), from the intervals in spans.
+
+    Returns:
+        step, ride, lat, lon and delay arrays, sorted by step and ride
+    """
+    step_ns = int(pd.Timedelta(step).value)
+    # Steps covered by each interval, [first_step, last_step] clipped to the window
+    first_step = np.maximum(-((first - spans["start"]) // step_ns), 0)
+    last_step = np.minimum((spans["end"] - first) // step_ns, steps - 1)
+    counts = np.maximum(last_step - first_step + 1, 0)
+    interval = np.repeat(np.arange(len(counts)), counts)
+    # Position of every row within its interval: 0, 1, ... counts - 1
+    within = np.arange(len(interval)) - np.repeat(np.cumsum(counts) - counts, counts)
+    steps_of_rows = first_step[interval] + within
+
+    t = first + steps_of_rows * step_ns
+    duration = (spans["end"] - spans["start"])[interval]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        fraction = np.where(duration > 0, (t - spans["start"][interval]) / duration, 0.0)
+    lat = spans["from_lat"][interval] + fraction * (spans["to_lat"][interval] - spans["from_lat"][interval])
+    lon = spans["from_lon"][interval] + fraction * (spans["to_lon"][interval] - spans["from_lon"][interval])
+
+    ride = spans["ride"][interval]
+    # A train that arrives exactly at a step is in two intervals, keep one row per train and step
+    order = np.lexsort((ride, steps_of_rows))
+    keep = np.ones(len(order), dtype=bool)
+    keep[1:] = (steps_of_rows[order][1:] != steps_of_rows[order][:-1]) | (ride[order][1:] != ride[order][:-1])
+    order = order[keep]
+    return steps_of_rows[order], ride[order], lat[order], lon[order], spans["delay"][interval][order]
+
+
+def write_snapshots(df, out_dir, coordinates=None, step=STEP, window_steps=WINDOW_STEPS):
+    """Write the position snapshots of the rides in df to out_dir, returns the number of windows."""
+    coordinates = station_coordinates() if coordinates is None else coordinates
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    with span("position intervals", rows=len(df)) as s:
+        spans = intervals(df, coordinates)
+        s.add(rows=len(spans["ride"]))
+    if not len(spans["ride"]):
+        return 0
+
+    step_ns = int(pd.Timedelta(step).value)
+    window_ns = step_ns * window_steps
+    lat_min, lat_max = float(coordinates["lat"].min()), float(coordinates["lat"].max())
+    lon_min, lon_max = float(coordinates["lon"].min()), float(coordinates["lon"].max())
+
+    # Intervals sorted by start, snapshot() keeps the first interval of a train at a step
+    order = np.argsort(spans["start"], kind="stable")
+    spans = {
+        key: value[order] if key not in ("rides", "train_names") else value for key, value in spans.items()
+    }
+    # Every interval is listed once for each window it overlaps, sorted by window, so a window is a slice
+    # of the intervals it needs however long the longest interval of the month is
+    begin = int(spans["start"][0]) // window_ns * window_ns
+    first_window = (spans["start"] - begin) // window_ns
+    counts = (spans["end"] - begin) // window_ns - first_window + 1
+    interval = np.repeat(np.arange(len(counts)), counts)
+    bucket = first_window[interval] + np.arange(len(interval)) - np.repeat(np.cumsum(counts) - counts, counts)
+    order = np.argsort(bucket, kind="stable")
+    interval, bucket = interval[order], bucket[order]
+    n_windows = int(bucket[-1]) + 1
+    bounds = np.searchsorted(bucket, np.arange(n_windows + 1))
+    windows = []
+    with span("position snapshots") as s:
+        for number in range(n_windows):
+            first = begin + number * window_ns
+            rows = interval[bounds[number] : bounds[number + 1]]
+            window = {key: value[rows] for key, value in spans.items() if key not in ("rides", "train_names")}
+            steps, ride, lat, lon, delay = snapshot(window, first, window_steps, step)
+            if not len(steps):
+                continue
+            offsets = np.searchsorted(steps, np.arange(window_steps + 1)).astype("<u4")
+            x = np.rint((lon - lon_min) / (lon_max - lon_min) * SCALE).astype("<u2")
+            y = np.rint((lat - lat_min) / (lat_max - lat_min) * SCALE).astype("<u2")
+            delay = np.clip(np.nan_to_num(delay), -32768, 32767).astype("<i2")
+            name = f"{first // 1_000_000}.bin"
+            with open(out_dir / name, "wb") as fh:
+                for array in (offsets, ride.astype("<u4"), x, y, delay):
+                    fh.write(array.tobytes())
+            s.add(rows=len(steps))
+            windows.append({"start_ms": first // 1_000_000, "file": name, "rows": len(steps)})
+
+    index = {
+        "step_ms": step_ns // 1_000_000,
+        "window_steps": window_steps,
+        "bbox": {"lat_min": lat_min, "lat_max": lat_max, "lon_min": lon_min, "lon_max": lon_max},
+        "scale": SCALE,
+        "trains": [None if pd.isna(name) else name for name in spans["train_names"]],
+        "rides": spans["rides"].tolist(),
+        "windows": windows,
+    }
+    (out_dir / "index.json").write_text(json.dumps(index, separators=(",", ":")), encoding="utf-8")
+    return len(windows)
@@ -0,0 +1,302 @@
+"""Discrete-event replay of the stop events of a month.
+
+Every ride is a sequence of stops sorted by train_line_station_num. The replay keeps one pending event
+per active ride in a heap: arriving at a stop schedules the departure from it, departing schedules the
+arrival at the next stop, so the heap only ever holds the rides that are currently running and the
+events come out in time order. Canceled stops are skipped, times are the actual ones where known and
+the planned ones otherwise.
+
+The network state lives in numpy arrays indexed by ride and station, not in per-train objects:
+- ride_status (WAITING, DWELLING, EN_ROUTE, FINISHED), ride_station (the station a ride is at or
+  coming from), ride_next_station, ride_delay (current delay in minutes),
+- station_dwelling (trains at the station right now), station_dwell_sum and station_dwells (minutes
+  and number of finished dwells), station_arrival_delay_sum and station_arrivals.
+
+    replay = Replay.from_files(month_files(last=1))
+    replay.jump(pd.Timestamp("2024-09-15 08:00"))
+    replay.summary()
+    for state in replay.play(speed=3600, step=pd.Timedelta(minutes=5)):
+        ...
+
+Jumping backwards restores the last checkpoint before the target (taken every checkpoint_every of
+replay time) and replays from there.
+"""
+
+import heapq
+import time
+
+import numpy as np
+import pandas as pd
+
+from dbstats.trace import read_parquet, span
+
+COLUMNS = [
+    "station",
+    "train_name",
+    "train_type",
+    "train_line_ride_id",
+    "train_line_station_num",
+    "is_canceled",
+    "arrival_planned_time",
+    "arrival_change_time",
+    "departure_planned_time",
+    "departure_change_time",
+]
+
+WAITING, DWELLING, EN_ROUTE, FINISHED = 0, 1, 2, 3
+STATUS_NAMES = np.array(["waiting", "dwelling", "en_route", "finished"])
+ARRIVE, DEPART = 0, 1
+NAT = np.iinfo("int64").min
+# Arrays that make up the replay state, copied into every checkpoint
+STATE = [
+    "ride_status",
+    "ride_stop",
+    "ride_station",
+    "ride_next_station",
+    "ride_delay",
+    "station_dwelling",
+    "station_dwell_sum",
+    "station_dwells",
+    "station_arrival_delay_sum",
+    "station_arrivals",
+]
+
+
+def _ns(actual, planned):
+    """Nanosecond timestamps, the actual time where known and the planned one otherwise."""
+    return actual.fillna(planned).to_numpy(dtype="datetime64[ns]").astype("int64")
+
+
+class Replay:
+    def __init__(self, stops, checkpoint_every=pd.Timedelta(hours=6)):
+        """Replay of a DataFrame of stops with the COLUMNS."""
+        timed = stops[
+            ["arrival_planned_time", "arrival_change_time", "departure_planned_time", "departure_change_time"]
+        ]
+        stops = stops[~stops["is_canceled"].fillna(False).astype(bool) & timed.notna().any(axis=1)]
+        ride_codes, self.ride_ids = pd.factorize(stops["train_line_ride_id"])
+        station_codes, self.stations = pd.factorize(stops["station"])
+        order = np.lexsort((stops["train_line_station_num"].to_numpy(), ride_codes))
+        order = order[ride_codes[order] >= 0]
+        stops = stops.iloc[order]
+
+        # Stops sorted by ride, ride r owns the stops ride_start[r]:ride_start[r + 1]
+        self.stop_ride = ride_codes[order]
+        self.stop_station = station_codes[order]
+        self.arrival = _ns(stops["arrival_change_time"], stops["arrival_planned_time"])
+        self.departure = _ns(stops["departure_change_time"], stops["departure_planned_time"])
+        arrival_planned = stops["arrival_planned_time"].to_numpy(dtype="datetime64[ns]").astype("int64")
+        departure_planned = stops["departure_planned_time"].to_numpy(dtype="datetime64[ns]").astype("int64")
+        self.arrival_delay = np.where(
+            (self.arrival != NAT) & (arrival_planned != NAT), (self.arrival - arrival_planned) / 6e10, np.nan
+        ).astype("float32")
+        self.departure_delay = np.where(
+            (self.departure != NAT) & (departure_planned != NAT),
+            (self.departure - departure_planned) / 6e10,
+            np.nan,
+        ).astype("float32")
+        self.ride_start = np.searchsorted(self.stop_ride, np.arange(len(self.ride_ids) + 1))
+        first = self.ride_start[:-1]
+        self.ride_train_name = stops["train_name"].to_numpy()[first]
+        self.ride_train_type = stops["train_type"].to_numpy()[first]
+
+        # An arrival without a time happens at the departure time and vice versa, the first stop of a ride
+        # usually has no arrival and the last no departure. The event loop reads single elements, which is
+        # much faster from lists than from numpy arrays.
+        self.arrival_event = np.where(self.arrival != NAT, self.arrival, self.departure)
+        self.departure_event = np.where(self.departure != NAT, self.departure, self.arrival)
+        self._stops = (
+            self.stop_ride.tolist(),
+            self.stop_station.tolist(),
+            self.arrival_event.tolist(),
+            self.departure_event.tolist(),
+            self.arrival_delay.tolist(),
+            self.departure_delay.tolist(),
+            ((self.arrival != NAT) & (self.departure != NAT)).tolist(),
+            self.ride_start.tolist(),
+        )
+
+        self.checkpoint_every = int(pd.Timedelta(checkpoint_every).value)
+        self.reset()
+
+    @classmethod
+    def from_files(cls, files, **kwargs):
+        with span("load stops"):
+            stops = pd.concat([read_parquet(file, columns=COLUMNS) for file in files], ignore_index=True)
+        with span("build replay", rows=len(stops)):
+            return cls(stops, **kwargs)
+
+    def reset(self):
+        """Back to before the first event."""
+        n_rides, n_stations = len(self.ride_ids), len(self.stations)
+        self.ride_status = np.full(n_rides, WAITING, dtype="int8")
+        self.ride_stop = self.ride_start[:-1].copy()
+        self.ride_station = np.full(n_rides, -1, dtype="int32")
+        self.ride_next_station = np.full(n_rides, -1, dtype="int32")
+        self.ride_delay = np.full(n_rides, np.nan, dtype="float32")
+        self.station_dwelling = np.zeros(n_stations, dtype="int32")
+        self.station_dwell_sum = np.zeros(n_stations, dtype="float64")
+        self.station_dwells = np.zeros(n_stations, dtype="int64")
+        self.station_arrival_delay_sum = np.zeros(n_stations, dtype="float64")
+        self.station_arrivals = np.zeros(n_stations, dtype="int64")
+        self.events_processed = 0
+
+        # Every ride starts with the arrival at its first stop
+        first = self.ride_start[:-1][self.ride_start[:-1] < self.ride_start[1:]]
+        self._heap = list(zip(self.arrival_event[first].tolist(), first.tolist(), [ARRIVE] * len(first)))
+        heapq.heapify(self._heap)
+        self.clock = self._heap[0][0] - 1 if self._heap else 0
+        self._checkpoints = {}
+        self._checkpoint()
+        self._next_checkpoint = self.clock + self.checkpoint_every
+
+    def _checkpoint(self):
+        arrays = {name: getattr(self, name).copy() for name in STATE}
+        self._checkpoints[self.clock] = (self.events_processed, arrays, list(self._heap))
+
+    def _restore(self, clock):
+        self.clock = clock
+        self.events_processed, arrays, heap = self._checkpoints[clock]
+        for name, value in arrays.items():
+            setattr(self, name, value.copy())
+        self._heap = list(heap)
+        self._next_checkpoint = clock + self.checkpoint_every
+
+    def run_until(self, timestamp):
+        """Process all events up to and including timestamp, returns the number of events processed."""
+        until = int(pd.Timestamp(timestamp).value)
+        ride_of, station_of, arrival, departure, arrival_delay, departure_delay, dwell_known, ride_start = (
+            self._stops
+        )
+        status, ride_stop, ride_station, ride_next_station, ride_delay = (
+            self.ride_status,
+            self.ride_stop,
+            self.ride_station,
+            self.ride_next_station,
+            self.ride_delay,
+        )
+        dwelling, dwell_sum, dwells = self.station_dwelling, self.station_dwell_sum, self.station_dwells
+        arrival_delay_sum, arrivals = self.station_arrival_delay_sum, self.station_arrivals
+        heap, heappush, heappop = self._heap, heapq.heappush, heapq.heappop
+
+        processed = 0
+        while heap and heap[0][0] <= until:
+            if heap[0][0] >= self._next_checkpoint:
+                # The state before the first event at or after the checkpoint time
+                self.clock = self._next_checkpoint
+                if self.clock not in self._checkpoints:
+                    self.events_processed += processed
+                    processed = 0
+                    self._checkpoint()
+                self._next_checkpoint += self.checkpoint_every
+                continue
+            t, stop, kind = heappop(heap)
+            ride, station = ride_of[stop], station_of[stop]
+            if kind == ARRIVE:
+                status[ride] = DWELLING
+                ride_stop[ride] = stop
+                ride_station[ride] = station
+                ride_next_station[ride] = -1
+                delay = arrival_delay[stop]
+                if delay == delay:
+                    ride_delay[ride] = delay
+                    arrival_delay_sum[station] += delay
+                    arrivals[station] += 1
+                dwelling[station] += 1
+                heappush(heap, (max(departure[stop], t), stop, DEPART))
+            else:
+                if status[ride] == DWELLING:
+                    dwelling[station] -= 1
+                    if dwell_known[stop]:
+                        dwell_sum[station] += (t - arrival[stop]) / 6e10
+                        dwells[station] += 1
+                delay = departure_delay[stop]
+                if delay == delay:
+                    ride_delay[ride] = delay
+                ride_station[ride] = station
+                following = stop + 1
+                if following < ride_start[ride + 1]:
+                    status[ride] = EN_ROUTE
+                    ride_stop[ride] = stop
+                    ride_next_station[ride] = station_of[following]
+                    heappush(heap, (max(arrival[following], t), following, ARRIVE))
+                else:
+                    status[ride] = FINISHED
+                    ride_next_station[ride] = -1
+            self.clock = t
+            processed += 1
+        self.events_processed += processed
+        self.clock = max(self.clock, until)
+        return processed
+
+    def jump(self, timestamp):
+        """Move the replay to timestamp, forwards by replaying events and backwards from a checkpoint."""
+        target = int(pd.Timestamp(timestamp).value)
+        if target < self.clock:
+            self._restore(
+                max((clock for clock in self._checkpoints if clock <= target), default=min(self._checkpoints))
+            )
+        return self.run_until(timestamp)
+
+    def play(self, speed=None, step=pd.Timedelta(minutes=1), until=None):
+        """Advance by step at a time and yield the summary after every step.
+
+        Args:
+            speed: replay seconds per wall clock second, None for as fast as possible
+            step: replay time per step
+            until: stop at this timestamp, after the last event if None
+        """
+        step_ns = int(pd.Timedelta(step).value)
+        end = int(pd.Timestamp(until).value) if until is not None else None
+        while self._heap and (end is None or self.clock < end):
+            started = time.perf_counter()
+            target = self.clock + step_ns if end is None else min(self.clock + step_ns, end)
+            self.run_until(pd.Timestamp(target))
+            yield self.summary()
+            if speed:
+                time.sleep(max(0.0, step_ns / 1e9 / speed - (time.perf_counter() - started)))
+
+    @property
+    def timestamp(self):
+        return pd.Timestamp(self.clock)
+
+    def summary(self):
+        """Counts and average delay of the running trains at the current time."""
+        running = (self.ride_status == DWELLING) | (self.ride_status == EN_ROUTE)
+        return {
+            "time": self.timestamp,
+            "en_route": int((self.ride_status == EN_ROUTE).sum()),
+            "dwelling": int((self.ride_status == DWELLING).sum()),
+            "finished": int((self.ride_status == FINISHED).sum()),
+            "average_delay": float(np.nanmean(self.ride_delay[running])) if running.any() else np.nan,
+            "events_processed": self.events_processed,
+        }
+
+    def trains(self):
+        """DataFrame of the trains that are running at the current time."""
+        ride = np.flatnonzero((self.ride_status == DWELLING) | (self.ride_status == EN_ROUTE))
+        station, next_station = self.ride_station[ride], self.ride_next_station[ride]
+        return pd.DataFrame(
+            {
+                "ride_id": self.ride_ids[ride],
+                "train_name": self.ride_train_name[ride],
+                "train_type": self.ride_train_type[ride],
+                "status": STATUS_NAMES[self.ride_status[ride]],
+                "station": np.where(station >= 0, self.stations[np.maximum(station, 0)], None),
+                "next_station": np.where(next_station >= 0, self.stations[np.maximum(next_station, 0)], None),
+                "delay_in_min": self.ride_delay[ride],
+            }
+        )
+
+    def station_state(self):
+        """DataFrame per station with the trains there now, the average dwell and arrival delay so far."""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return pd.DataFrame(
+                {
+                    "station": self.stations,
+                    "dwelling": self.station_dwelling,
+                    "average_dwell_min": self.station_dwell_sum / self.station_dwells,
+                    "average_arrival_delay": self.station_arrival_delay_sum / self.station_arrivals,
+                    "arrivals": self.station_arrivals,
+                }
+            )
@@ -0,0 +1,110 @@
+"""Samples of the monthly parquet files, drawn before the rows are converted to pandas.
+
+Two sampling units:
+- RIDE (default): a ride is in the sample if the seeded hash of its train_line_ride_id falls below the
+  fraction, so rides stay whole (all their stops or none) and a seed selects the same rides in every run
+  and every month. The file is read in record batches and the rows outside the sample are dropped before
+  they become pandas objects, memory is bounded by the sample.
+- ROW_GROUP: every row group of a file draws a number from the seeded generator, the row groups that
+  cannot be in the sample are not read at all. This saves the I/O too, but it is only as fine as the
+  row groups of the file (a file written as a single row group is read whole or skipped) and the rides
+  at the borders of the row groups are cut.
+
+stratify gives train types their own fraction, e.g. {"ICE": 1.0, "IC": 0.5} to keep all ICE and half of
+the IC rides in a 5 % sample. A row is kept if the draw of its unit is below the fraction of its train
+type, so the sample of a type does not depend on the fractions of the others. Stratified samples get a
+sample_weight column, 1 / fraction of the row, to weight estimates back to all rows.
+
+    df = read_sample(path, 0.1, seed=42, stratify={"ICE": 0.5})
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from dbstats.trace import parquet_bytes, span
+
+RIDE, ROW_GROUP = "ride", "row_group"
+RIDE_COLUMN = "train_line_ride_id"
+TYPE_COLUMN = "train_type"
+BATCH_ROWS = 262_144
+
+
+def ride_draws(rides, seed=0):
+    """A number in [0, 1) per ride id of an Arrow array, the same for the same ride and seed."""
+    # Every ride has about 10 stops, hash the distinct ids only
+    encoded = pc.dictionary_encode(rides, null_encoding="encode")
+    # pd.util.hash_array takes a key of 16 characters
+    hashes = pd.util.hash_array(
+        encoded.dictionary.to_numpy(zero_copy_only=False).astype(object), hash_key=f"{seed:016x}"[-16:]
+    )
+    # The top 53 bits, exactly representable as a float below 1
+    return (hashes >> np.uint64(11))[encoded.indices.to_numpy()] / 2.0**53
+
+
+def _fractions(data, fraction, stratify):
+    """The sampling fraction of every row of an Arrow table or record batch."""
+    if not stratify:
+        return np.full(data.num_rows, float(fraction))
+    types = pd.Series(data[TYPE_COLUMN].to_numpy(zero_copy_only=False))
+    return types.map(stratify).fillna(fraction).to_numpy(dtype="float64")
+
+
+def read_sample(path, fraction, seed=0, unit=RIDE, columns=None, stratify=None):
+    """A sample of the rows of a parquet file as a DataFrame.
+
+    Args:
+        path: the parquet file
+        fraction: share of the rides (or row groups) to keep, between 0 and 1
+        seed: the same seed draws the same sample
+        unit: RIDE to keep whole rides, ROW_GROUP to skip reading the row groups outside the sample
+        columns: the columns to read, all if None; the ride and train type columns are added when needed
+        stratify: dict of train type to fraction, the other train types are sampled with fraction
+    """
+    if unit not in (RIDE, ROW_GROUP):
+        raise ValueError(f"unknown sampling unit {unit}")
+    path = Path(path)
+    parquet = pq.ParquetFile(path)
+    needed = ([RIDE_COLUMN] if unit == RIDE else []) + ([TYPE_COLUMN] if stratify else [])
+    read = None if columns is None else list(dict.fromkeys([*columns, *needed]))
+    highest = max([fraction, *stratify.values()]) if stratify else fraction
+
+    with span(f"sample {path.name}") as s:
+        if unit == ROW_GROUP:
+            draws = np.random.default_rng(seed).random(parquet.num_row_groups)
+            groups = np.flatnonzero(draws < highest).tolist()
+            table = parquet.read_row_groups(groups, columns=read)
+            sizes = [parquet.metadata.row_group(group).num_rows for group in groups]
+            row_fractions = _fractions(table, fraction, stratify)
+            keep = np.repeat(draws[groups], sizes) < row_fractions
+            table, row_fractions = table.filter(pa.array(keep)), row_fractions[keep]
+            s.add(bytes_read=parquet_bytes(path, read, groups))
+        else:
+            batches = []
+            kept_fractions = []
+            for batch in parquet.iter_batches(batch_size=BATCH_ROWS, columns=read):
+                fractions = _fractions(batch, fraction, stratify)
+                keep = ride_draws(batch[RIDE_COLUMN], seed) < fractions
+                batches.append(batch.filter(pa.array(keep)))
+                kept_fractions.append(fractions[keep])
+            schema = parquet.schema_arrow
+            if read is not None:
+                schema = pa.schema([schema.field(name) for name in read], metadata=schema.metadata)
+            table = pa.Table.from_batches(batches, schema=schema)
+            row_fractions = np.concatenate(kept_fractions) if kept_fractions else np.empty(0)
+            s.add(bytes_read=parquet_bytes(path, read))
+        df = table.to_pandas()
+        if stratify:
+            df["sample_weight"] = 1 / row_fractions
+        s.add(rows=len(df))
+    return df
+
+
+def read_samples(files, fraction, seed=0, unit=RIDE, columns=None, stratify=None):
+    """The samples of several files in one DataFrame, with one seed so rides over two files stay whole."""
+    samples = [read_sample(file, fraction, seed, unit, columns, stratify) for file in files]
+    return pd.concat(samples, ignore_index=True)
@@ -0,0 +1,212 @@
+"""Declared schema of the stop events and typed readers for the CSV and parquet files.
+
+EVENT_SCHEMA lists every column of the monthly releases with its type; PREPARED_SCHEMA adds the
+timestamp and ts_ms columns that prep_months.py puts in front of the events-YYYY-MM.csv files. Times
+are naive local time of Germany (Europe/Berlin) as in the releases. The readers do not localize them,
+they are written and parsed with TIMESTAMP_FORMAT as they are, and hours and days are local ones.
+
+The readers parse the declared types directly with pyarrow's CSV reader, instead of letting pandas
+infer types and parse dates value by value. If a file has values that do not parse, it is read again
+with every declared column as a string and converted with vectorized Arrow kernels (pc.strptime with
+the declared format, regex validation before casting numbers). A row is bad when a value does not
+convert or a REQUIRED column is empty; bad rows are dropped in bulk and written with the reason to
+build/quarantine/<file name>.bad.csv, so a few broken rows never fail or silently change a whole month.
+
+write_csv() formats the timestamps once per distinct value, pandas' to_csv formats datetime columns
+value by value and takes about twice as long as for the same values as strings.
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+
+from dbstats.trace import span
+
+STRING, INT, BOOL, TIMESTAMP = "string", "int64", "bool", "timestamp"
+EVENT_SCHEMA = {
+    "station": STRING,
+    "train_name": STRING,
+    "final_station_name": STRING,
+    "delay_in_min": INT,
+    "time": TIMESTAMP,
+    "is_canceled": BOOL,
+    "train_type": STRING,
+    "train_line_ride_id": STRING,
+    "train_line_station_num": INT,
+    "arrival_planned_time": TIMESTAMP,
+    "arrival_change_time": TIMESTAMP,
+    "departure_planned_time": TIMESTAMP,
+    "departure_change_time": TIMESTAMP,
+}
+PREPARED_SCHEMA = {"timestamp": TIMESTAMP, "ts_ms": INT, **EVENT_SCHEMA}
+# The time every event is sorted by, events without it are quarantined
+EVENT_TIME = "time"
+REQUIRED = [EVENT_TIME]
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+ARROW_TYPES = {STRING: pa.string(), INT: pa.int64(), BOOL: pa.bool_(), TIMESTAMP: pa.timestamp("ns")}
+QUARANTINE_DIR = Path("build") / "quarantine"
+
+_INTEGER = r"^[+-]?\d+(\.0*)?$"
+_TRUE, _FALSE = ["True", "true", "1"], ["False", "false", "0"]
+
+
+def _timestamps(values):
+    parsed = pc.strptime(values, format=TIMESTAMP_FORMAT, unit="ns", error_is_null=True)
+    # Fractional seconds and ISO 8601 with a T do not match the format, parse the few of those separately
+    retry = pc.and_(pc.is_valid(values), pc.is_null(parsed)).to_numpy(zero_copy_only=False)
+    if retry.any():
+        positions = np.flatnonzero(retry)
+        again = pd.to_datetime(
+            pd.Series(values.take(positions).to_pylist()), format="ISO8601", errors="coerce"
+        )
+        parsed = parsed.to_numpy(zero_copy_only=False).astype("datetime64[ns]")
+        parsed[positions] = again.to_numpy(dtype="datetime64[ns]")
+        parsed = pa.array(parsed, type=pa.timestamp("ns"))
+    return parsed
+
+
+def convert(values, kind):
+    """The values of a string column as the declared type, null where they do not convert."""
+    values = pc.utf8_trim_whitespace(values)
+    if kind == STRING:
+        return values
+    if kind == INT:
+        valid = pc.match_substring_regex(values, _INTEGER)
+        numbers = pc.if_else(valid, values, pa.scalar(None, pa.string()))
+        return pc.cast(pc.cast(numbers, pa.float64()), pa.int64())
+    if kind == BOOL:
+        known = pc.is_in(values, pa.array(_TRUE + _FALSE))
+        return pc.if_else(known, pc.is_in(values, pa.array(_TRUE)), pa.scalar(None, pa.bool_()))
+    if kind == TIMESTAMP:
+        return _timestamps(values)
+    raise ValueError(f"unknown column type {kind}")
+
+
+def conform(table, schema=EVENT_SCHEMA, required=REQUIRED):
+    """Convert the declared columns of an Arrow table, returns the table and a DataFrame of the bad rows.
+
+    String columns are converted with convert(), typed ones cast to the declared type. Columns that are
+    not in the schema are kept as they are. The bad rows keep their values as read, with bad_column the
+    first column that did not convert.
+    """
+    missing = [name for name in required if name in schema and name not in table.column_names]
+    if missing:
+        raise ValueError(f"missing required columns {missing}")
+    bad = np.zeros(table.num_rows, dtype=bool)
+    reasons = np.full(table.num_rows, "", dtype=object)
+    columns = {}
+    for name in table.column_names:
+        values = table[name].combine_chunks()
+        if name not in schema:
+            columns[name] = values
+            continue
+        kind = schema[name]
+        if pa.types.is_string(values.type) or pa.types.is_large_string(values.type):
+            converted = convert(values, kind)
+            failed = pc.and_(pc.is_valid(pc.utf8_trim_whitespace(values)), pc.is_null(converted))
+        else:
+            converted = values.cast(ARROW_TYPES[kind])
+            failed = pa.array(np.zeros(len(values), dtype=bool))
+        empty = pc.is_null(converted) if name in required else pa.array(np.zeros(len(values), dtype=bool))
+        failed = pc.or_(failed, empty).to_numpy(zero_copy_only=False)
+        reasons[failed & ~bad] = name
+        bad |= failed
+        columns[name] = converted
+    rejected = table.filter(pa.array(bad)).to_pandas()
+    rejected.insert(0, "bad_column", reasons[bad])
+    return pa.table(columns).filter(pa.array(~bad)), rejected
+
+
+def quarantine(rejected, source, quarantine_dir=QUARANTINE_DIR):
+    """Write the bad rows of a file to quarantine_dir, returns the path or None without bad rows."""
+    if rejected.empty:
+        return None
+    quarantine_dir = Path(quarantine_dir)
+    quarantine_dir.mkdir(parents=True, exist_ok=True)
+    path = quarantine_dir / f"{Path(source).stem}.bad.csv"
+    rejected.to_csv(path, index=False, date_format=TIMESTAMP_FORMAT)
+    return path
+
+
+def _to_pandas(table):
+    # Nullable integers for the columns with missing values, so that they are not turned into floats
+    df = table.to_pandas(types_mapper={pa.int64(): pd.Int64Dtype()}.get)
+    for name in df.columns[(df.dtypes == pd.Int64Dtype()).to_numpy()]:
+        if not df[name].hasnans:
+            df[name] = df[name].astype("int64")
+    return df
+
+
+def read_csv(path, schema=EVENT_SCHEMA, required=REQUIRED, quarantine_dir=QUARANTINE_DIR):
+    """A CSV file as a DataFrame with the declared types, bad rows go to quarantine_dir."""
+    path = Path(path)
+    with span(f"read {path.name}", bytes_read=path.stat().st_size) as s:
+        try:
+            table = pacsv.read_csv(
+                path,
+                convert_options=pacsv.ConvertOptions(
+                    column_types={name: ARROW_TYPES[kind] for name, kind in schema.items()},
+                    timestamp_parsers=[TIMESTAMP_FORMAT, pacsv.ISO8601],
+                    true_values=_TRUE,
+                    false_values=_FALSE,
+                    strings_can_be_null=True,
+                ),
+            )
+        except pa.ArrowInvalid:
+            # Some values do not parse, read everything as strings and find the bad rows in conform()
+            table = pacsv.read_csv(
+                path,
+                convert_options=pacsv.ConvertOptions(
+                    column_types={name: pa.string() for name in schema}, strings_can_be_null=True
+                ),
+            )
+        s.add(rows=table.num_rows)
+    with span("conform", rows=table.num_rows):
+        table, rejected = conform(table, schema, required)
+    _report(path, rejected, quarantine_dir)
+    return _to_pandas(table)
+
+
+def read_parquet(path, schema=EVENT_SCHEMA, required=REQUIRED, quarantine_dir=QUARANTINE_DIR):
+    """A parquet file as a DataFrame with the declared types, bad rows go to quarantine_dir."""
+    path = Path(path)
+    with span(f"read {path.name}", bytes_read=path.stat().st_size) as s:
+        table = pq.read_table(path)
+        s.add(rows=table.num_rows)
+    with span("conform", rows=table.num_rows):
+        table, rejected = conform(table, schema, required)
+    _report(path, rejected, quarantine_dir)
+    return _to_pandas(table)
+
+
+def format_timestamps(values):
+    """Datetime values as TIMESTAMP_FORMAT strings (None for NaT), formatted once per distinct value."""
+    codes, uniques = pd.factorize(np.asarray(values, dtype="datetime64[s]"))
+    text = np.datetime_as_string(uniques, unit="s")
+    if len(text):
+        # YYYY-MM-DDTHH:MM:SS, the T at position 10 becomes the space of TIMESTAMP_FORMAT
+        text.view("<U1").reshape(len(text), -1)[:, 10] = " "
+    return np.append(text.astype(object), None)[codes]
+
+
+def write_csv(df, path, header=True):
+    """Write a DataFrame like df.to_csv(path, index=False), with the timestamps in TIMESTAMP_FORMAT."""
+    formatted = {
+        name: format_timestamps(df[name])
+        for name in df.columns
+        if pd.api.types.is_datetime64_any_dtype(df[name])
+    }
+    df.assign(**formatted).to_csv(path, index=False, header=header)
+
+
+def _report(path, rejected, quarantine_dir):
+    written = quarantine(rejected, path, quarantine_dir)
+    if written is not None:
+        counts = rejected["bad_column"].value_counts()
+        details = ", ".join(f"{name}: {count:,}" for name, count in counts.items())
+        print(f"⚠️  {path.name}: quarantined {len(rejected):,} bad rows ({details}) in {written}")
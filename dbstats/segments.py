@@ -0,0 +1,123 @@
+"""Stop-to-stop segments: one row per pair of consecutive stops of a ride.
+
+Each month is sorted once by (train_line_ride_id, train_line_station_num); consecutive rows of the same
+ride become a segment with
+- ride_id, train_name, train_type, from_station_num,
+- from_station and to_station,
+- departure_planned, departure_actual (at from_station) and arrival_planned, arrival_actual (at
+  to_station),
+- planned_run_min, actual_run_min and delay_gain_min (actual minus planned run time: positive when
+  the train lost time on the segment, negative when it recovered some),
+- departure_delay_min and arrival_delay_min,
+- is_canceled, when either stop was canceled.
+
+The segments are stored as parquet partitioned by month under build/segments/month=YYYY-MM/, with
+the station and train columns dictionary encoded. The months are read with
+dbstats.months.stitched_months(), so a ride that crosses the end of a month is kept whole in the
+partition of the month it ends in. A partition is rebuilt when this code, its file or the file before
+it changed, or when a newer month was added after it. Analyses are plain groupbys over read_segments():
+
+    segments = read_segments(columns=["from_station", "to_station", "delay_gain_min", "is_canceled"])
+    segments[~segments["is_canceled"]].groupby(["from_station", "to_station"])["delay_gain_min"].mean()
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow.dataset as ds
+
+from dbstats.partitions import write_partitions
+from dbstats.trace import span
+
+SEGMENTS_DIR = Path("build") / "segments"
+COLUMNS = [
+    "station",
+    "train_name",
+    "train_type",
+    "train_line_ride_id",
+    "train_line_station_num",
+    "is_canceled",
+    "arrival_planned_time",
+    "arrival_change_time",
+    "departure_planned_time",
+    "departure_change_time",
+]
+CATEGORICAL = ["ride_id", "train_name", "train_type", "from_station", "to_station"]
+
+
+def _minutes(delta):
+    return (delta.dt.total_seconds() / 60).astype("float32")
+
+
+def month_segments(df):
+    """The segments of the rides in a DataFrame with the COLUMNS."""
+    ride_codes, _ = pd.factorize(df["train_line_ride_id"])
+    order = np.lexsort((df["train_line_station_num"].to_numpy(), ride_codes))
+    df = df.iloc[order].reset_index(drop=True)
+    ride_codes = ride_codes[order]
+
+    # A segment starts at every row that is followed by a row of the same ride
+    starts = np.flatnonzero((ride_codes[:-1] == ride_codes[1:]) & (ride_codes[:-1] >= 0))
+    start, end = df.iloc[starts].reset_index(drop=True), df.iloc[starts + 1].reset_index(drop=True)
+
+    segments = pd.DataFrame(
+        {
+            "ride_id": start["train_line_ride_id"],
+            "train_name": start["train_name"],
+            "train_type": start["train_type"],
+            "from_station_num": start["train_line_station_num"],
+            "from_station": start["station"],
+            "to_station": end["station"],
+            "departure_planned": start["departure_planned_time"],
+            "departure_actual": start["departure_change_time"],
+            "arrival_planned": end["arrival_planned_time"],
+            "arrival_actual": end["arrival_change_time"],
+        }
+    )
+    segments["planned_run_min"] = _minutes(segments["arrival_planned"] - segments["departure_planned"])
+    segments["actual_run_min"] = _minutes(segments["arrival_actual"] - segments["departure_actual"])
+    segments["delay_gain_min"] = segments["actual_run_min"] - segments["planned_run_min"]
+    segments["departure_delay_min"] = _minutes(segments["departure_actual"] - segments["departure_planned"])
+    segments["arrival_delay_min"] = _minutes(segments["arrival_actual"] - segments["arrival_planned"])
+    canceled = df["is_canceled"].fillna(False).to_numpy(bool)
+    segments["is_canceled"] = canceled[starts] | canceled[starts + 1]
+    for column in CATEGORICAL:
+        segments[column] = segments[column].astype("category")
+    return segments
+
+
+def build(files, segments_dir=SEGMENTS_DIR, force=False):
+    """Write the segments of every month whose inputs changed since the last build, returns those months.
+
+    The months are stitched, see dbstats.partitions.write_partitions().
+    """
+    return write_partitions(
+        files,
+        segments_dir,
+        month_segments,
+        COLUMNS,
+        "segments",
+        stitch=True,
+        describe=lambda segments: {"segments": len(segments)},
+        force=force,
+    )
+
+
+def read_segments(months=None, columns=None, where=None, segments_dir=SEGMENTS_DIR):
+    """The segments of the given months (all for None) as a DataFrame.
+
+    Args:
+        months: list of YYYY-MM strings
+        columns: columns to read, all if None
+        where: optional pyarrow.dataset filter expression, e.g. ds.field("train_type") == "ICE"
+        segments_dir: directory written by build()
+    """
+    dataset = ds.dataset(segments_dir, format="parquet", partitioning="hive")
+    if months is not None:
+        month_filter = ds.field("month").isin(list(months))
+        where = month_filter if where is None else month_filter & where
+    with span("read segments") as s:
+        table = dataset.to_table(columns=columns, filter=where)
+        s.add(rows=table.num_rows)
+    return table.to_pandas()
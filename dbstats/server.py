@@ -0,0 +1,224 @@
+"""Local HTTP query service over the JSON outputs of the question scripts.
+
+The tables are loaded once into dictionaries, so a query is a lookup instead of downloading a whole
+file:
+- stations: station → the per train type statistics of questions/bahnhof and the average delay, stop
+  count and percentiles of questions/verspaetung_pro_bahnhof,
+- direct: (from, to) → the direct trains of questions/direkter_zug,
+- trains: train_name → the statistics of questions/zugverbindung.
+
+Routes (GET, JSON):
+    /stations/<name>                   one station
+    /top/stations?k=10&by=average_delay&order=desc
+    /direct?from=<station>&to=<station>
+    /direct/<from>                     destinations with direct trains from a station
+    /trains/<name>                     one train
+    /top/trains?k=10&by=avg_delay&order=desc
+    /stations, /trains                 all rows, streamed as JSON lines
+    /_stats                            cache hits and misses
+
+The server is plain asyncio with HTTP/1.1 keep-alive. Rendered responses are kept in an LRU cache keyed
+by the request target; the streamed listings are written in chunks with chunked transfer encoding.
+"""
+
+import asyncio
+import json
+from collections import OrderedDict
+from pathlib import Path
+from urllib.parse import parse_qs, unquote, urlsplit
+
+QUESTIONS_DIR = Path(__file__).resolve().parent.parent / "questions"
+CACHE_SIZE = 4096
+# Rows per chunk of a streamed response
+STREAM_ROWS = 500
+
+
+def _read(path):
+    return json.loads(Path(path).read_text(encoding="utf-8"))
+
+
+class Tables:
+    def __init__(self, stations, direct, trains):
+        self.stations = stations
+        self.direct = direct
+        self.destinations = {}
+        for origin, destination in direct:
+            self.destinations.setdefault(origin, []).append(destination)
+        self.trains = trains
+        self._orders = {}
+
+    @classmethod
+    def load(cls, questions_dir=QUESTIONS_DIR):
+        """Read the tables from the data directories of the questions, missing ones stay empty."""
+        questions_dir = Path(questions_dir)
+        stations = {}
+        bahnhof = questions_dir / "bahnhof" / "data" / "Bahnhof_Statistiken.json"
+        if bahnhof.exists():
+            for station, train_types in _read(bahnhof).items():
+                stations[station] = {"station": station, "train_types": train_types}
+        per_station = (
+            questions_dir
+            / "verspaetung_pro_bahnhof"
+            / "data"
+            / "Durchschnittliche Verspätungen an Bahnhöfen und Anzahl an Halten.json"
+        )
+        if per_station.exists():
+            for row in _read(per_station):
+                stations.setdefault(row["station"], {"station": row["station"]}).update(row)
+
+        direct = {}
+        direkter_zug = questions_dir / "direkter_zug" / "data"
+        overview = direkter_zug / "direkte_zuege_uebersicht.json"
+        if overview.exists():
+            for origin, destinations in _read(overview).items():
+                for destination, file in destinations.items():
+                    path = direkter_zug / "alle_direkten_zuege" / file
+                    if path.exists():
+                        direct[(origin, destination)] = _read(path)
+
+        trains = {}
+        zugverbindung = questions_dir / "zugverbindung" / "data" / "long_distance_train_stats.json"
+        if zugverbindung.exists():
+            trains = {row["train_name"]: row for row in _read(zugverbindung)}
+        return cls(stations, direct, trains)
+
+    def top(self, table, by, k, descending=True):
+        """The k rows of a table with the largest (or smallest) value of by, rows without it are left out."""
+        rows = getattr(self, table)
+        key = (table, by)
+        if key not in self._orders:
+            # Sorted once per table and field, every top-k query after that is a slice
+            ranked = [
+                row for row in rows.values() if isinstance(row.get(by), (int, float)) and row[by] == row[by]
+            ]
+            self._orders[key] = sorted(ranked, key=lambda row: row[by])
+        order = self._orders[key]
+        return order[: -k - 1 : -1] if descending else order[:k]
+
+
+class LRUCache:
+    def __init__(self, maxsize=CACHE_SIZE):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        if key in self._items:
+            self._items.move_to_end(key)
+            self.hits += 1
+            return self._items[key]
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        self._items[key] = value
+        self._items.move_to_end(key)
+        if len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+
+class NotFound(Exception):
+    pass
+
+
+class QueryServer:
+    def __init__(self, tables, cache_size=CACHE_SIZE):
+        self.tables = tables
+        self.cache = LRUCache(cache_size)
+
+    def answer(self, target):
+        """The JSON body for a request target, raises NotFound for unknown routes and keys."""
+        url = urlsplit(target)
+        parts = [unquote(part) for part in url.path.strip("/").split("/")]
+        query = {name: values[0] for name, values in parse_qs(url.query).items()}
+        tables = self.tables
+
+        # Under its own prefix, so no station or train name is taken by the ranking
+        if parts[0] == "top" and len(parts) == 2 and parts[1] in ("stations", "trains"):
+            default = "average_delay" if parts[1] == "stations" else "avg_delay"
+            k = int(query.get("k", 10))
+            return tables.top(parts[1], query.get("by", default), k, query.get("order", "desc") == "desc")
+        if parts[0] == "stations" and len(parts) == 2 and parts[1] in tables.stations:
+            return tables.stations[parts[1]]
+        if parts[0] == "trains" and len(parts) == 2 and parts[1] in tables.trains:
+            return tables.trains[parts[1]]
+        if parts == ["direct"] and (query.get("from"), query.get("to")) in tables.direct:
+            return {
+                "from": query["from"],
+                "to": query["to"],
+                "trains": tables.direct[(query["from"], query["to"])],
+            }
+        if parts[0] == "direct" and len(parts) == 2 and parts[1] in tables.destinations:
+            return {"from": parts[1], "destinations": tables.destinations[parts[1]]}
+        if parts == ["_stats"]:
+            return {"hits": self.cache.hits, "misses": self.cache.misses, "cached": len(self.cache._items)}
+        raise NotFound(target)
+
+    async def _respond(self, writer, status, body, keep_alive):
+        connection = "keep-alive" if keep_alive else "close"
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+            f"Connection: {connection}\r\n\r\n".encode()
+            + body
+        )
+        await writer.drain()
+
+    async def _stream(self, writer, rows, keep_alive):
+        """All rows as JSON lines, STREAM_ROWS per chunk."""
+        connection = "keep-alive" if keep_alive else "close"
+        writer.write(
+            "HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\nTransfer-Encoding: chunked\r\n"
+            f"Connection: {connection}\r\n\r\n".encode()
+        )
+        for start in range(0, len(rows), STREAM_ROWS):
+            chunk = "".join(
+                json.dumps(row, ensure_ascii=False) + "\n" for row in rows[start : start + STREAM_ROWS]
+            )
+            data = chunk.encode()
+            writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            await writer.drain()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request = await reader.readuntil(b"\r\n\r\n")
+                lines = request.decode("latin-1").split("\r\n")
+                method, target, version = lines[0].split(" ", 2)
+                # Header names are case-insensitive, connection: close is as common as Connection: close
+                headers = {
+                    name.strip().lower(): value.strip()
+                    for name, value in (line.split(":", 1) for line in lines[1:] if ":" in line)
+                }
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                path = urlsplit(target).path.strip("/")
+
+                if method != "GET":
+                    await self._respond(writer, "405 Method Not Allowed", b'{"error":"GET only"}', keep_alive)
+                elif path in ("stations", "trains"):
+                    await self._stream(writer, list(getattr(self.tables, path).values()), keep_alive)
+                else:
+                    body = self.cache.get(target)
+                    status = "200 OK"
+                    if body is None:
+                        try:
+                            body = json.dumps(self.answer(target), ensure_ascii=False).encode()
+                            if not target.startswith("/_stats"):
+                                self.cache.put(target, body)
+                        except (NotFound, ValueError):
+                            status, body = "404 Not Found", b'{"error":"not found"}'
+                    await self._respond(writer, status, body, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8765):
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f"serving on http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
@@ -0,0 +1,87 @@
+"""Mergeable delay quantile sketches.
+
+Delays are whole minutes, so instead of a t-digest or KLL sketch the delays are counted per bucket:
+one bucket per minute up to EXACT_LIMIT minutes early or late, and beyond that logarithmic buckets
+whose representative value is within RELATIVE_ACCURACY of every delay in the bucket (as in DDSketch).
+A sketch is then a count per (group, bucket), which adds up across batches, months and processes
+like any other statistic of dbstats.aggregate:
+
+    stats = aggregate(files, by=["station", "delay_bucket"], columns=[...], prepare=add_delay_buckets)
+    percentiles = quantiles(stats["delay_count"], "delay_bucket")
+
+Quantiles are nearest-rank over the delays of stops that were not canceled: the smallest delay with at
+least the given share of stops at or below it. Below EXACT_LIMIT they are exact.
+"""
+
+import numpy as np
+import pandas as pd
+
+EXACT_LIMIT = 60
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+QUANTILES = {"p50": 0.5, "p90": 0.9, "p99": 0.99}
+# delay_buckets() as SQL, the delay_bucket key for the duckdb engine of dbstats.aggregate
+DELAY_BUCKET_SQL = (
+    "CASE WHEN delay_in_min IS NULL THEN 0 "
+    f"WHEN abs(delay_in_min) <= {EXACT_LIMIT} THEN round_even(delay_in_min, 0) "
+    f"ELSE sign(delay_in_min) * ({EXACT_LIMIT} + ceil(ln(abs(delay_in_min) / {EXACT_LIMIT}) / "
+    f"ln({GAMMA!r}))) "
+    "END::BIGINT"
+)
+
+
+def delay_buckets(delay):
+    """Bucket numbers of delays, the delay itself up to EXACT_LIMIT minutes.
+
+    Missing delays end up in bucket 0, they are not counted in delay_count anyway.
+    """
+    delay = np.asarray(delay, dtype="float64")
+    magnitude = np.abs(delay)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_bucket = EXACT_LIMIT + np.ceil(np.log(magnitude / EXACT_LIMIT) / np.log(GAMMA))
+        buckets = np.where(magnitude <= EXACT_LIMIT, np.rint(delay), np.sign(delay) * log_bucket)
+    return np.nan_to_num(buckets, nan=0).astype("int64")
+
+
+def bucket_values(buckets):
+    """Representative delay of each bucket."""
+    buckets = np.asarray(buckets, dtype="float64")
+    magnitude = np.abs(buckets)
+    estimate = 2 * EXACT_LIMIT * GAMMA ** (magnitude - EXACT_LIMIT) / (GAMMA + 1)
+    return np.where(magnitude <= EXACT_LIMIT, buckets, np.sign(buckets) * estimate)
+
+
+def add_delay_buckets(df):
+    """prepare function for aggregate() that adds the delay_bucket group key."""
+    return df.assign(delay_bucket=delay_buckets(df["delay_in_min"]))
+
+
+def quantiles(counts, level="delay_bucket", percentiles=QUANTILES):
+    """Quantiles per group from bucket counts.
+
+    Args:
+        counts: Series of counts indexed by the group keys and the bucket level, like the
+            delay_count statistic of an aggregation that includes delay_bucket in its keys
+        level: name of the bucket level
+        percentiles: output column names and the quantiles they hold
+
+    Returns:
+        DataFrame indexed by the group keys with one column per quantile, groups without delays or with a
+        missing key are left out
+    """
+    groups = [name for name in counts.index.names if name != level]
+    counts = counts[(counts > 0).to_numpy() & counts.index.to_frame().notna().all(axis=1).to_numpy()]
+    counts = counts.sort_index(level=[*groups, level])
+    keys = counts.index.droplevel(level)
+    group_ids = keys.factorize()[0]
+    cumulative = counts.groupby(group_ids).cumsum().to_numpy()
+    totals = counts.groupby(group_ids).transform("sum").to_numpy()
+    values = bucket_values(counts.index.get_level_values(level))
+
+    result = pd.DataFrame(index=keys.unique())
+    for name, q in percentiles.items():
+        # First bucket per group where the cumulative count reaches the rank of the quantile
+        reached = cumulative >= np.maximum(np.ceil(q * totals - 1e-9), 1)
+        first = pd.Series(values[reached]).groupby(group_ids[reached]).first()
+        result[name] = first.to_numpy()
+    return result
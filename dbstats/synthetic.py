@@ -0,0 +1,209 @@
+"""Deterministic synthetic monthly data with the schema of the real releases.
+
+The question scripts read the monthly parquet files from
+https://github.com/piebro/deutsche-bahn-data. This module generates files with the same
+columns and dtypes so the scripts can be run and benchmarked without downloading anything.
+
+Rides follow fixed lines (a train name with a fixed sequence of stations), so station pairs,
+ride progressions and train statistics repeat the way they do in the real data.
+"""
+
+import csv
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+STATION_INDEX = Path(__file__).resolve().parent.parent / "station_cache" / "stations_index.csv"
+
+# train_type -> (share of lines, min stops, max stops, min minutes between stops, max minutes)
+TRAIN_TYPES = {
+    "ICE": (0.08, 6, 16, 15, 60),
+    "IC": (0.05, 6, 14, 15, 45),
+    "EC": (0.01, 6, 12, 15, 45),
+    "FLX": (0.01, 4, 10, 20, 60),
+    "RE": (0.18, 6, 20, 4, 15),
+    "RB": (0.30, 8, 25, 2, 8),
+    "S": (0.25, 10, 30, 2, 5),
+    "ME": (0.04, 6, 15, 4, 12),
+    "ERB": (0.04, 6, 15, 3, 10),
+    "Bus": (0.04, 5, 20, 2, 6),
+}
+
+COLUMNS = [
+    "station",
+    "train_name",
+    "final_station_name",
+    "delay_in_min",
+    "time",
+    "is_canceled",
+    "train_type",
+    "train_line_ride_id",
+    "train_line_station_num",
+    "arrival_planned_time",
+    "arrival_change_time",
+    "departure_planned_time",
+    "departure_change_time",
+]
+
+
+def station_names(limit: int | None = None) -> list[str]:
+    """Station names from the station cache, ordered west to east, or generated names."""
+    if STATION_INDEX.exists():
+        with STATION_INDEX.open(encoding="utf-8") as f:
+            rows = sorted(csv.DictReader(f), key=lambda r: float(r["lon"]))
+        names = [r["name"] for r in rows]
+    else:
+        names = [f"Bahnhof {i:04d}" for i in range(5000)]
+    return names[:limit] if limit else names
+
+
+def _make_lines(rng: np.random.Generator, n_lines: int, n_stations: int) -> dict:
+    types = list(TRAIN_TYPES)
+    shares = np.array([TRAIN_TYPES[t][0] for t in types])
+    type_idx = rng.choice(len(types), size=n_lines, p=shares / shares.sum())
+    # Every train type gets at least one line so small samples still contain all of them.
+    type_idx[: len(types)] = np.arange(min(len(types), n_lines))
+
+    min_stops = np.array([TRAIN_TYPES[t][1] for t in types])[type_idx]
+    max_stops = np.array([TRAIN_TYPES[t][2] for t in types])[type_idx]
+    n_stops = rng.integers(min_stops, max_stops + 1)
+
+    # Each line runs along a corridor of the west-to-east station order, long-distance
+    # lines skip more stations between stops than regional ones.
+    long_distance = np.array([TRAIN_TYPES[t][3] for t in types])[type_idx] >= 15
+    step = np.where(long_distance, rng.integers(3, 12, n_lines), rng.integers(1, 3, n_lines))
+    start = rng.integers(0, np.maximum(n_stations - n_stops * step, 1))
+
+    offsets = np.concatenate([[0], np.cumsum(n_stops)])
+    stop_in_line = np.arange(offsets[-1]) - np.repeat(offsets[:-1], n_stops)
+    line_of_stop = np.repeat(np.arange(n_lines), n_stops)
+    stations = (start[line_of_stop] + stop_in_line * step[line_of_stop]) % n_stations
+
+    lo = np.array([TRAIN_TYPES[t][3] for t in types])[type_idx][line_of_stop]
+    hi = np.array([TRAIN_TYPES[t][4] for t in types])[type_idx][line_of_stop]
+    run_minutes = np.where(stop_in_line == 0, 0, rng.integers(lo, hi + 1))
+    dwell_minutes = rng.integers(1, 4, offsets[-1])
+    arrival_offset = np.cumsum(run_minutes + dwell_minutes) - dwell_minutes
+    arrival_offset -= np.repeat(arrival_offset[offsets[:-1]], n_stops)
+
+    return {
+        "type": np.array(types)[type_idx],
+        "number": rng.permutation(np.arange(1, 100 * n_lines + 1))[:n_lines],
+        "n_stops": n_stops,
+        "offsets": offsets,
+        "stations": stations,
+        "arrival_offset": arrival_offset,
+        "departure_offset": arrival_offset + dwell_minutes,
+    }
+
+
+def generate_month(
+    month: str,
+    rows: int = 100_000,
+    rides: int | None = None,
+    seed: int = 0,
+    stations: list[str] | None = None,
+) -> pd.DataFrame:
+    """Generate one month of stop events.
+
+    Args:
+        month: Month as "YYYY-MM".
+        rows: Approximate number of stop events, ignored if rides is given.
+        rides: Number of train rides; derived from rows if None.
+        seed: Seed for the random generator, the same arguments always give the same data.
+        stations: Station names to use, defaults to the station cache.
+
+    Returns:
+        DataFrame with the columns of the real monthly releases, sorted by time.
+    """
+    year, mon = (int(x) for x in month.split("-"))
+    rng = np.random.default_rng([seed, year, mon])
+    stations = np.array(stations if stations is not None else station_names())
+
+    if rides is None:
+        rides = max(1, rows // 12)
+    n_lines = max(10, rides // 40)
+    lines = _make_lines(rng, n_lines, len(stations))
+
+    month_start = pd.Timestamp(year=year, month=mon, day=1)
+    month_minutes = int((month_start + pd.offsets.MonthBegin(1) - month_start).total_seconds() // 60)
+
+    ride_line = rng.integers(0, n_lines, rides)
+    ride_line[: min(n_lines, rides)] = np.arange(min(n_lines, rides))
+    ride_start = rng.integers(4 * 60, month_minutes - 2 * 60, rides)
+    ride_stops = lines["n_stops"][ride_line]
+
+    ride_offsets = np.concatenate([[0], np.cumsum(ride_stops)])
+    ride = np.repeat(np.arange(rides), ride_stops)
+    stop_num = np.arange(ride_offsets[-1]) - ride_offsets[:-1][ride]
+    line_stop = lines["offsets"][ride_line][ride] + stop_num
+    is_first = stop_num == 0
+    is_last = stop_num == ride_stops[ride] - 1
+
+    # Delays build up along a ride: a start delay plus mostly small, sometimes large, increments.
+    increments = rng.choice([-1, 0, 1, 2, 5, 15], size=len(ride), p=[0.1, 0.65, 0.18, 0.04, 0.02, 0.01])
+    increments[is_first] = rng.exponential(2.0, is_first.sum()).astype(int)
+    delay = np.cumsum(increments)
+    delay -= np.repeat(delay[ride_offsets[:-1]] - increments[ride_offsets[:-1]], ride_stops)
+    delay = np.maximum(delay, 0)
+
+    ride_canceled = rng.random(rides) < 0.01
+    is_canceled = ride_canceled[ride] | (rng.random(len(ride)) < 0.015)
+
+    start = month_start + pd.to_timedelta(ride_start[ride], unit="min")
+    arrival_planned = start + pd.to_timedelta(lines["arrival_offset"][line_stop], unit="min")
+    departure_planned = start + pd.to_timedelta(lines["departure_offset"][line_stop], unit="min")
+    arrival_planned = arrival_planned.where(~is_first, pd.NaT)
+    departure_planned = departure_planned.where(~is_last, pd.NaT)
+    delay_delta = pd.to_timedelta(delay, unit="min")
+
+    line_type = lines["type"][ride_line]
+    train_name = np.char.add(np.char.add(line_type, " "), lines["number"][ride_line].astype(str))
+    final_station = stations[lines["stations"][lines["offsets"][ride_line] + ride_stops - 1]]
+    ride_id = np.array([f"{line}-{month}-{i:07d}" for i, line in enumerate(ride_line)], dtype=object)
+
+    df = pd.DataFrame(
+        {
+            "station": stations[lines["stations"][line_stop]].astype(object),
+            "train_name": train_name[ride].astype(object),
+            "final_station_name": final_station[ride].astype(object),
+            "delay_in_min": delay.astype("int64"),
+            "time": arrival_planned.where(~is_first, departure_planned),
+            "is_canceled": is_canceled,
+            "train_type": line_type[ride].astype(object),
+            "train_line_ride_id": ride_id[ride],
+            "train_line_station_num": (stop_num + 1).astype("int64"),
+            "arrival_planned_time": arrival_planned,
+            "arrival_change_time": arrival_planned + delay_delta,
+            "departure_planned_time": departure_planned,
+            "departure_change_time": departure_planned + delay_delta,
+        },
+        columns=COLUMNS,
+    )
+    time_columns = [c for c in COLUMNS if c == "time" or c.endswith("_time")]
+    df[time_columns] = df[time_columns].astype("datetime64[ns]")
+    return df.sort_values("time", kind="stable", ignore_index=True)
+
+
+def month_range(first: str, count: int) -> list[str]:
+    """The month tags ("YYYY-MM") of count consecutive months starting at first."""
+    return [str(p) for p in pd.period_range(first, periods=count, freq="M")]
+
+
+def write_months(
+    out_dir: Path,
+    months: list[str],
+    rows: int = 100_000,
+    rides: int | None = None,
+    seed: int = 0,
+) -> list[Path]:
+    """Write data-YYYY-MM.parquet files like download_data.sh does and return their paths."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    names = station_names()
+    paths = []
+    for month in months:
+        path = out_dir / f"data-{month}.parquet"
+        generate_month(month, rows=rows, rides=rides, seed=seed, stations=names).to_parquet(path, index=False)
+        paths.append(path)
+    return paths
@@ -0,0 +1,197 @@
+"""Train type taxonomy: full names, categories and groups of the train_type codes.
+
+The tables are compiled into lookup arrays over the codes of the distinct train types of a column, so
+classifying millions of rows costs one lookup per distinct value plus an array take:
+
+    df = df.join(classify(df["train_type"]))
+    df[df["in_long_distance_connections"]]
+"""
+
+import numpy as np
+import pandas as pd
+
+TRAIN_TYPE_NAMES = {
+    "AKN": "AKN Eisenbahn",
+    "ALX": "alex",
+    "ASTB": "Autoschleuse Tauernbahn",
+    "BE": "Bentheimer Eisenbahn",
+    "BEX": "Bördeexpress",
+    "BOB": "Bodensee-Oberschwaben-Bahn",
+    "BRB": "Bayerische Regiobahn",
+    "Bus": "Bus",
+    "CAT": "City Airport Train",
+    "CB": "CB",
+    "CBG": "CBG",
+    "CJX": "Cityjet xpress",
+    "D": "Schnellzug",
+    "DBK": "DBK",
+    "DRV": "Schnellzug für Reiseveranstalter",
+    "EC": "EuroCity",
+    "ECE": "ECE",
+    "EN": "EuroNight",
+    "ENO": "ENNO",
+    "ERB": "Eurobahn",
+    "ES": "ES",
+    "EST": "Eurostar",
+    "EVB": "EVB",
+    "FEX": "Flughafen-Express",
+    "FLX": "Flixtrain",
+    "GABW": "Arverio Baden-Württemberg",
+    "GABY": "Arverio Bayern",
+    "HBX": "Harz-Berlin-Express",
+    "HLB": "Hessische Landesbahn",
+    "HzL": "Hohenzollerische Landesbahn AG",
+    "IC": "Intercity",
+    "ICE": "Intercity-Express",
+    "IRE": "Interregio-Express",
+    "ME": "Metronom",
+    "MEX": "Metropolexpress",
+    "MRB": "Mitteldeutsche Regiobahn",
+    "N": "N",
+    "NBE": "Nordbahn Eisenbahngesellschaft",
+    "NJ": "Nightjet",
+    "NOB": "Nord-Ostsee-Bahn",
+    "NWB": "NordWestBahn",
+    "OE": "Ostdeutsche Eisenbahn",
+    "OPB": "OPB",
+    "R": "Regionalzug",
+    "RB": "Regionalbahn",
+    "RDC": "RDC",
+    "RE": "Regional-Express",
+    "REX": "Regional-Express",
+    "RGJ": "Regiojet",
+    "RJ": "Railjet",
+    "RJX": "Railjet xpress",
+    "RRB": "RRB",
+    "RS": "Regio-S-Bahn Bremen/Niedersachsen",
+    "RT": "RegioTram",
+    "RTB": "Rurtalbahn GmbH",
+    "S": "S-Bahn",
+    "SAB": "Schwäbische Alb-Bahn",
+    "SB": "Städtebahn Sachsen",
+    "SBB": "Schweizerische Bundesbahnen",
+    "SC": "SuperCity",
+    "SE": "Städtebahn Sachsen",
+    "STB": "STB",
+    "STN": "STN",
+    "SVG": "SVG",
+    "SWE": "Südwestdeutsche Landesverkehrs-Gesellschaft",
+    "TEL": "TEL",
+    "TGV": "TGV",
+    "TL": "TL",
+    "TLX": "TLX",
+    "TRI": "TRI",
+    "UEX": "UEX",
+    "VIA": "VIA",
+    "WB": "WESTbahn",
+    "WEST": "WESTbahn",
+    "WFB": "Westfalenbahn",
+    "ag": "ag",
+    "erx": "erixX - Der Heidesprinter",
+}
+
+# The train types the questions show on their own next to all trains, everything else is OTHER
+MAIN_TRAIN_TYPES = ["ICE", "IC", "RE", "RB", "S"]
+OTHER = "Sonstige"
+
+LONG_DISTANCE = "Fernverkehr"
+REGIONAL = "Regionalverkehr"
+S_BAHN = "S-Bahn"
+CATEGORIES = {
+    **dict.fromkeys(
+        [
+            "D",
+            "DRV",
+            "EC",
+            "ECE",
+            "EN",
+            "EST",
+            "FLX",
+            "IC",
+            "ICE",
+            "NJ",
+            "RGJ",
+            "RJ",
+            "RJX",
+            "SC",
+            "TGV",
+            "WB",
+            "WEST",
+        ],
+        LONG_DISTANCE,
+    ),
+    **dict.fromkeys(["S", "RS"], S_BAHN),
+    **dict.fromkeys(["ASTB", "Bus"], OTHER),
+}
+# Train types with a name that are not listed above are regional trains, unknown ones are OTHER
+DEFAULT_CATEGORY = REGIONAL
+
+# Named sets of train types, classify() adds an in_<name> column for each
+GROUPS = {
+    "long_distance_connections": ["ICE", "IC", "FLX", "EC"],
+}
+
+
+def _codes(train_type):
+    """Codes and distinct values of a column, missing values get the code len(values)."""
+    if isinstance(train_type.dtype, pd.CategoricalDtype):
+        codes = train_type.cat.codes.to_numpy()
+        values = list(train_type.cat.categories)
+    else:
+        codes, values = pd.factorize(train_type)
+        values = list(values)
+    return np.where(codes < 0, len(values), codes), values
+
+
+def classify(train_type, groups=GROUPS):
+    """Name, category, main type and group membership of every row of a train_type column.
+
+    Args:
+        train_type: Series of train type codes, categorical or not
+        groups: named sets of train types to add membership columns for
+
+    Returns:
+        DataFrame with the index of train_type and the columns train_type_name (NaN for unknown types),
+        train_type_category, train_type_main (the type for MAIN_TRAIN_TYPES, else OTHER) and one
+        boolean in_<group> column per group
+    """
+    codes, values = _codes(train_type)
+    # One extra slot at the end for missing train types
+    names = np.array([TRAIN_TYPE_NAMES.get(value, np.nan) for value in values] + [np.nan], dtype=object)
+    categories = np.array(
+        [CATEGORIES.get(value, DEFAULT_CATEGORY if value in TRAIN_TYPE_NAMES else OTHER) for value in values]
+        + [OTHER],
+        dtype=object,
+    )
+    main = np.array(
+        [value if value in MAIN_TRAIN_TYPES else OTHER for value in values] + [OTHER], dtype=object
+    )
+
+    columns = {
+        "train_type_name": names[codes],
+        "train_type_category": categories[codes],
+        "train_type_main": main[codes],
+    }
+    for group, members in groups.items():
+        columns[f"in_{group}"] = np.array([value in members for value in values] + [False])[codes]
+    return pd.DataFrame(columns, index=train_type.index)
+
+
+def group_condition(group, column="train_type"):
+    """SQL condition for the rows whose train type is in a group, like the in_<group> column of classify()."""
+    values = ", ".join("'" + value.replace("'", "''") + "'" for value in GROUPS[group])
+    return f"{column} IN ({values})"
+
+
+def category_expression(column="train_type"):
+    """SQL expression of the category of a train type, like the train_type_category column of classify()."""
+
+    def values(types):
+        return ", ".join("'" + value.replace("'", "''") + "'" for value in types)
+
+    members = {}
+    for train_type, category in CATEGORIES.items():
+        members.setdefault(category, []).append(train_type)
+    cases = [f"WHEN {column} IN ({values(types)}) THEN '{category}'" for category, types in members.items()]
+    named = values(sorted(TRAIN_TYPE_NAMES))
+    return f"CASE {' '.join(cases)} WHEN {column} IN ({named}) THEN '{DEFAULT_CATEGORY}' ELSE '{OTHER}' END"
@@ -0,0 +1,211 @@
+"""Lightweight timing spans for the calculation scripts and data tools.
+
+Usage:
+    with span("groupby station", rows=len(df)):
+        ...
+
+    with span("write json") as s:
+        ...
+        s.wrote(path)
+
+Spans cost two clock reads when tracing is off. Tracing is enabled by setting DBSTATS_TRACE to a
+directory; every process then writes a Chrome trace file (open in chrome://tracing or
+https://ui.perfetto.dev) with the duration, rows and bytes read and written of each span when it
+exits. DBSTATS_PROFILE=cprofile additionally writes a cProfile .prof file, DBSTATS_PROFILE=sample a
+collapsed stack file (for flamegraph.pl or speedscope) sampled every DBSTATS_SAMPLE_MS milliseconds.
+"""
+
+import atexit
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from pathlib import Path
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+TRACE_DIR = os.environ.get("DBSTATS_TRACE")
+PROFILE = os.environ.get("DBSTATS_PROFILE")
+
+_events = []
+_stack = []
+_epoch_us = time.time_ns() // 1000 - time.perf_counter_ns() // 1000
+
+
+class Span:
+    def __init__(self, name, **args):
+        self.name = name
+        self.args = args
+        self.rows = args.pop("rows", None)
+        self.bytes_read = args.pop("bytes_read", 0)
+        self.bytes_written = args.pop("bytes_written", 0)
+        self.start_ns = None
+        self.duration_s = None
+
+    def __enter__(self):
+        _stack.append(self)
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        end_ns = time.perf_counter_ns()
+        self.duration_s = (end_ns - self.start_ns) / 1e9
+        _stack.pop()
+        if _stack:
+            # Bytes count towards the enclosing spans as well, so top-level stages add up.
+            _stack[-1].bytes_read += self.bytes_read
+            _stack[-1].bytes_written += self.bytes_written
+        if TRACE_DIR:
+            args = dict(self.args, depth=len(_stack))
+            if self.rows is not None:
+                args["rows"] = int(self.rows)
+            if self.bytes_read:
+                args["bytes_read"] = int(self.bytes_read)
+            if self.bytes_written:
+                args["bytes_written"] = int(self.bytes_written)
+            _events.append(
+                {
+                    "name": self.name,
+                    "ph": "X",
+                    "ts": _epoch_us + self.start_ns // 1000,
+                    "dur": (end_ns - self.start_ns) // 1000,
+                    "pid": os.getpid(),
+                    "tid": threading.get_ident(),
+                    "args": args,
+                }
+            )
+        return False
+
+    def add(self, rows=None, bytes_read=0, bytes_written=0):
+        if rows is not None:
+            self.rows = (self.rows or 0) + rows
+        self.bytes_read += bytes_read
+        self.bytes_written += bytes_written
+
+    def wrote(self, *paths):
+        """Count the size of files this span has written."""
+        for path in paths:
+            self.bytes_written += Path(path).stat().st_size
+
+
+def span(name, **args):
+    """Time a block of code, keyword arguments end up in the trace (rows, bytes_read, ...)."""
+    return Span(name, **args)
+
+
+def current():
+    """The innermost open span, or None."""
+    return _stack[-1] if _stack else None
+
+
+def read_parquet(path, columns=None):
+    """pd.read_parquet inside a span that records rows and the compressed bytes of the columns read."""
+    path = Path(path)
+    with span(f"read {path.name}") as s:
+        df = pd.read_parquet(path, columns=columns)
+        s.add(rows=len(df), bytes_read=parquet_bytes(path, columns))
+    return df
+
+
+def parquet_bytes(path, columns=None, row_groups=None):
+    """Compressed size of the given columns and row groups of a parquet file, the whole file if neither."""
+    if columns is None and row_groups is None:
+        return Path(path).stat().st_size
+    metadata = pq.ParquetFile(path).metadata
+    wanted = None if columns is None else set(columns)
+    total = 0
+    for i in range(metadata.num_row_groups) if row_groups is None else row_groups:
+        row_group = metadata.row_group(i)
+        for j in range(row_group.num_columns):
+            column = row_group.column(j)
+            if wanted is None or column.path_in_schema in wanted:
+                total += column.total_compressed_size
+    return total
+
+
+def trace_name():
+    """Name of the trace file: the question folder for calculations.py, else the script name."""
+    script = Path(sys.argv[0]).resolve() if sys.argv and sys.argv[0] else Path("python")
+    return os.environ.get("DBSTATS_TRACE_NAME") or (
+        script.parent.name if script.name == "calculations.py" else script.stem
+    )
+
+
+class _Sampler(threading.Thread):
+    """Samples the main thread's stack and counts collapsed stacks."""
+
+    def __init__(self, interval_s):
+        super().__init__(daemon=True)
+        self.interval_s = interval_s
+        self.samples = Counter()
+        self.main_id = threading.main_thread().ident
+        self.running = True
+
+    def run(self):
+        while self.running:
+            frame = sys._current_frames().get(self.main_id)
+            if frame is not None:
+                stack = traceback.extract_stack(frame)
+                self.samples[";".join(f"{f.name} ({Path(f.filename).name}:{f.lineno})" for f in stack)] += 1
+            time.sleep(self.interval_s)
+
+
+_profiler = None
+_sampler = None
+
+
+def _write_trace():
+    if _profiler is not None:
+        _profiler.disable()
+    if _sampler is not None:
+        _sampler.running = False
+
+    trace_dir = Path(TRACE_DIR)
+    trace_dir.mkdir(parents=True, exist_ok=True)
+    name = trace_name()
+    metadata = [
+        {"name": "process_name", "ph": "M", "pid": os.getpid(), "args": {"name": name}},
+    ]
+    with (trace_dir / f"{name}.json").open("w", encoding="utf-8") as f:
+        json.dump({"traceEvents": metadata + _events, "displayTimeUnit": "ms"}, f)
+    if _profiler is not None:
+        _profiler.dump_stats(trace_dir / f"{name}.prof")
+    if _sampler is not None:
+        with (trace_dir / f"{name}.folded").open("w", encoding="utf-8") as f:
+            for stack, count in _sampler.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+if TRACE_DIR:
+    if PROFILE == "cprofile":
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+    elif PROFILE == "sample":
+        _sampler = _Sampler(float(os.environ.get("DBSTATS_SAMPLE_MS", "5")) / 1000)
+        _sampler.start()
+    atexit.register(_write_trace)
+
+
+def summarize(trace_file):
+    """Top-level spans of a trace file as (name, seconds, rows, bytes read, bytes written)."""
+    with Path(trace_file).open(encoding="utf-8") as f:
+        events = json.load(f)["traceEvents"]
+    spans = sorted(
+        (event for event in events if event["ph"] == "X" and event["args"].get("depth") == 0),
+        key=lambda event: event["ts"],
+    )
+    return [
+        (
+            event["name"],
+            event["dur"] / 1e6,
+            event["args"].get("rows"),
+            event["args"].get("bytes_read", 0),
+            event["args"].get("bytes_written", 0),
+        )
+        for event in spans
+    ]
@@ -0,0 +1,150 @@
+"""Daily statistics per train: one row per train_name and day, over the whole history.
+
+build() reads every month once and writes per train_name and day (of the stop time)
+- stops and canceled,
+- delay_count, delay_sum and delay_max over the delays of the stops that were not canceled,
+- punctual, the stops that were not canceled and less than PUNCTUAL_BELOW minutes late,
+
+to build/train_days/month=YYYY-MM/part-0.parquet, sorted by train_name and day. The store is append
+only: a new month adds a partition, months whose data file and code are unchanged are skipped, and a
+month whose file changed replaces its own partition (dbstats.partitions).
+
+TrainDays loads the partitions into arrays, every partition is its own sorted index over the train
+names. The days of a train are a binary search (np.searchsorted) per partition and a slice, so a
+history over all months never touches the parquet files of the monthly releases:
+
+    history = TrainDays().history("ICE 578", start="2024-09-01")
+    history[["stops", "average_delay", "max_delay", "cancellation_rate"]]
+"""
+
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from dbstats.aggregate import PUNCTUAL_BELOW
+from dbstats.partitions import write_partitions
+from dbstats.trace import span
+
+TRAIN_DAYS_DIR = Path("build") / "train_days"
+COLUMNS = ["train_name", "time", "delay_in_min", "is_canceled"]
+STATISTICS = {
+    "stops": "sum",
+    "canceled": "sum",
+    "delay_count": "sum",
+    "delay_sum": "sum",
+    "delay_max": "max",
+    "punctual": "sum",
+}
+
+
+def month_train_days(df):
+    """The statistics per train_name and day of a DataFrame with the COLUMNS, sorted by both."""
+    df = df[df["time"].notna() & df["train_name"].notna()]
+    canceled = df["is_canceled"].fillna(False).astype(bool)
+    delay = df["delay_in_min"].where(~canceled)
+    days = pd.DataFrame(
+        {
+            "train_name": df["train_name"],
+            "day": df["time"].dt.floor("D"),
+            "stops": 1,
+            "canceled": canceled,
+            "delay_count": delay.notna(),
+            "delay_sum": delay.fillna(0),
+            "delay_max": delay,
+            "punctual": ~canceled & (delay < PUNCTUAL_BELOW),
+        }
+    )
+    days = days.groupby(["train_name", "day"], sort=False, observed=True).agg(STATISTICS).reset_index()
+    # Sorted as plain strings, the order np.searchsorted uses, whatever the dtype of the column
+    days["train_name"] = days["train_name"].astype(str)
+    days = days.sort_values(["train_name", "day"], ignore_index=True)
+    return days.astype(
+        {
+            "stops": "int32",
+            "canceled": "int32",
+            "delay_count": "int32",
+            "delay_sum": "float64",
+            "delay_max": "float32",
+            "punctual": "int32",
+        }
+    )
+
+
+def build(files, store_dir=TRAIN_DAYS_DIR, force=False):
+    """Write the daily statistics of every file that changed since the last build, returns those months.
+
+    The partitions are written with dbstats.partitions.write_partitions().
+    """
+    return write_partitions(
+        files,
+        store_dir,
+        month_train_days,
+        COLUMNS,
+        "train days",
+        describe=lambda days: {"rows": len(days), "trains": int(days["train_name"].nunique())},
+        force=force,
+    )
+
+
+class TrainDays:
+    def __init__(self, store_dir=TRAIN_DAYS_DIR):
+        """Load the partitions written by build(), oldest month first."""
+        store_dir = Path(store_dir)
+        manifest_file = store_dir / "_manifest.json"
+        manifest = json.loads(manifest_file.read_text()) if manifest_file.exists() else {}
+        self.months = []
+        # Per partition the sorted train names and the statistic columns as arrays
+        self._partitions = []
+        with span("load train days") as s:
+            for month in sorted(manifest):
+                path = store_dir / f"month={month}" / "part-0.parquet"
+                if not path.exists():
+                    continue
+                table = pq.read_table(path)
+                names = table["train_name"].to_numpy(zero_copy_only=False).astype(str)
+                columns = {name: table[name].to_numpy() for name in ["day", *STATISTICS]}
+                self.months.append(month)
+                self._partitions.append((names, columns))
+                s.add(rows=len(names), bytes_read=path.stat().st_size)
+
+    def trains(self):
+        """All train names in the store, sorted."""
+        if not self._partitions:
+            return []
+        return np.unique(np.concatenate([names for names, _ in self._partitions])).tolist()
+
+    def history(self, train_name, start=None, end=None):
+        """The days of a train with stops, from start to end (inclusive, any date pandas parses).
+
+        Returns:
+            DataFrame indexed by day with the statistics, average_delay and max_delay over the stops that
+            were not canceled, cancellation_rate and punctuality; empty for unknown trains
+        """
+        slices = []
+        for names, columns in self._partitions:
+            first = np.searchsorted(names, train_name, side="left")
+            last = np.searchsorted(names, train_name, side="right")
+            if last > first:
+                slices.append({name: values[first:last] for name, values in columns.items()})
+        if not slices:
+            days = pd.DataFrame(columns=["day", *STATISTICS])
+        else:
+            days = pd.DataFrame({name: np.concatenate([part[name] for part in slices]) for name in slices[0]})
+        # A day at the border of two months can be in both partitions
+        if days["day"].duplicated().any():
+            days = days.groupby("day").agg(STATISTICS)
+        else:
+            days = days.set_index("day")
+        if start is not None:
+            days = days[days.index >= pd.Timestamp(start)]
+        if end is not None:
+            days = days[days.index <= pd.Timestamp(end)]
+        valid = days["stops"] - days["canceled"]
+        days["average_delay"] = days["delay_sum"] / days["delay_count"].where(days["delay_count"] > 0)
+        days["max_delay"] = days.pop("delay_max")
+        days["cancellation_rate"] = days["canceled"] / days["stops"]
+        days["punctuality"] = days["punctual"] / valid.where(valid > 0)
+        return days
@@ -1,28 +1,33 @@
 #!/usr/bin/env python3
 import pathlib
-import pandas as pd
+
+from dbstats.schema import PREPARED_SCHEMA, read_csv, write_csv
+from dbstats.trace import span
 
 DATA_DIR = pathlib.Path("dashboard/public/data")
 OUT_DIR = DATA_DIR / "ice"
 OUT_DIR.mkdir(parents=True, exist_ok=True)
 
 def filter_ice(src: pathlib.Path):
-    # Read the monthly events CSV
-    df = pd.read_csv(src)
+    # Read the monthly events CSV with the declared column types
+    df = read_csv(src, PREPARED_SCHEMA)
 
     # Only keep ICE trains
     if "train_type" not in df.columns:
         print(f"⚠️  {src.name}: no 'train_type' column, skipping")
         return None
 
-    ice_df = df[df["train_type"].astype(str).str.upper() == "ICE"].copy()
+    with span("filter ICE", rows=len(df)):
+        ice_df = df[df["train_type"].astype(str).str.upper() == "ICE"].copy()
 
     if ice_df.empty:
         print(f"ℹ️  {src.name}: no ICE trains found")
         return None
 
     out = OUT_DIR / src.name.replace("events-", "events-ice-")
-    ice_df.to_csv(out, index=False)
+    with span(f"write {out.name}", rows=len(ice_df)) as s:
+        write_csv(ice_df, out)
+        s.wrote(out)
     print(f"{src.name} → {out.name} | ICE rows: {len(ice_df):,}")
     return out
 
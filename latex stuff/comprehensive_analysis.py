@@ -4,17 +4,40 @@ Comprehensive Analysis of Deutsche Bahn Train Data
 Analyzes station statistics, timing patterns, delays, and other interesting metrics.
 """
 
+import argparse
 import pandas as pd
 import numpy as np
+import pyarrow.parquet as pq
 import matplotlib.pyplot as plt
 import glob
 import os
+import sys
 from datetime import datetime, timedelta
 from collections import defaultdict
+from pathlib import Path
 import warnings
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from dbstats.sampling import read_sample
+
 warnings.filterwarnings("ignore")
 
+# Columns the analyses use, the full data mode reads only these
+COLUMNS = [
+    "station",
+    "train_name",
+    "train_type",
+    "train_line_ride_id",
+    "train_line_station_num",
+    "is_canceled",
+    "delay_in_min",
+    "time",
+    "arrival_planned_time",
+    "departure_planned_time",
+]
+DAY_ORDER = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
 
 def load_sample_data(data_dir="Deutsche-Bahn-Digital-Twin/dashboard/public/data", sample_months=3, sample_fraction=0.1):
     """Load a sample of parquet files for faster analysis."""
@@ -29,14 +52,14 @@ def load_sample_data(data_dir="Deutsche-Bahn-Digital-Twin/dashboard/public/data"
     dataframes = []
     for file in files_to_use:
         print(f"  Loading {os.path.basename(file)}...")
-        df = pd.read_parquet(file)
-        # Sample the data for faster processing
-        if len(df) > 100000:  # Only sample if dataset is large
-            df_sample = df.sample(frac=sample_fraction, random_state=42)
-            print(f"  → Sampled {len(df_sample):,} records ({sample_fraction*100:.0f}% of {len(df):,})")
+        num_rows = pq.ParquetFile(file).metadata.num_rows
+        # Sample the data for faster processing, whole rides so that the journeys stay complete
+        if num_rows > 100000:  # Only sample if dataset is large
+            df_sample = read_sample(file, sample_fraction, seed=42)
+            print(f"  → Sampled {len(df_sample):,} records ({sample_fraction*100:.0f}% of {num_rows:,})")
             dataframes.append(df_sample)
         else:
-            dataframes.append(df)
+            dataframes.append(pd.read_parquet(file))
 
     combined_df = pd.concat(dataframes, ignore_index=True)
     print(f"✅ Loaded {len(combined_df):,} records from {len(files_to_use)} files")
@@ -44,6 +67,23 @@ def load_sample_data(data_dir="Deutsche-Bahn-Digital-Twin/dashboard/public/data"
     return combined_df
 
 
+def load_full_data(data_dir="Deutsche-Bahn-Digital-Twin/dashboard/public/data", months=3):
+    """Load every row of the most recent months, only the COLUMNS the analyses use."""
+    print("🚂 Loading Deutsche Bahn data (all records)...")
+    files = sorted(glob.glob(os.path.join(data_dir, "*.parquet")))[-months:]
+    print(f"📁 Using {len(files)} most recent files: {[os.path.basename(f) for f in files]}")
+
+    dataframes = []
+    for file in files:
+        print(f"  Loading {os.path.basename(file)}...")
+        dataframes.append(pd.read_parquet(file, columns=COLUMNS))
+
+    combined_df = pd.concat(dataframes, ignore_index=True)
+    print(f"✅ Loaded {len(combined_df):,} records from {len(files)} files")
+    print(f"📅 Date range: {combined_df['time'].min()} to {combined_df['time'].max()}")
+    return combined_df
+
+
 def analyze_stations(df):
     """Analyze station-related statistics."""
     print("\n🏢 STATION ANALYSIS")
@@ -69,21 +109,29 @@ def analyze_stations(df):
 
 
 def calculate_time_between_stations(df, max_journeys=1000):
-    """Calculate average time between stations for train journeys (optimized with sampling)."""
+    """Calculate average time between stations for train journeys, of all journeys if max_journeys is None."""
     print("\n⏱️  TIME BETWEEN STATIONS ANALYSIS")
     print("=" * 50)
 
     # Filter out canceled trains and those with missing times
-    valid_df = df[
-        (~df["is_canceled"]) & (df["departure_planned_time"].notna()) & (df["arrival_planned_time"].notna())
-    ].copy()
+    valid_df = df.loc[
+        (~df["is_canceled"]) & (df["departure_planned_time"].notna()) & (df["arrival_planned_time"].notna()),
+        [
+            "train_line_ride_id",
+            "train_line_station_num",
+            "station",
+            "train_type",
+            "departure_planned_time",
+            "arrival_planned_time",
+        ],
+    ]
 
     # Sort by train ride and station number
     valid_df = valid_df.sort_values(["train_line_ride_id", "train_line_station_num"])
 
     # Get unique train journeys and sample them for faster processing
     unique_journeys = valid_df["train_line_ride_id"].unique()
-    if len(unique_journeys) > max_journeys:
+    if max_journeys is not None and len(unique_journeys) > max_journeys:
         print(
             f"🎯 Sampling {max_journeys} journeys from {len(unique_journeys):,} total journeys for faster analysis"
         )
@@ -92,40 +140,26 @@ def calculate_time_between_stations(df, max_journeys=1000):
     else:
         print(f"📊 Processing all {len(unique_journeys):,} train journeys")
 
-    journey_times = []
-
-    # Group by train journey (now with fewer journeys)
-    for ride_id, group in valid_df.groupby("train_line_ride_id"):
-        if len(group) < 2:  # Need at least 2 stations
-            continue
-
-        group = group.sort_values("train_line_station_num")
-
-        for i in range(len(group) - 1):
-            current_station = group.iloc[i]
-            next_station = group.iloc[i + 1]
-
-            # Calculate travel time between stations
-            if pd.notna(current_station["departure_planned_time"]) and pd.notna(
-                next_station["arrival_planned_time"]
-            ):
-                travel_time = (
-                    next_station["arrival_planned_time"] - current_station["departure_planned_time"]
-                ).total_seconds() / 60
-
-                # Filter out unrealistic times (negative or extremely long)
-                if 0 < travel_time < 300:  # Between 0 and 5 hours
-                    journey_times.append(
-                        {
-                            "from_station": current_station["station"],
-                            "to_station": next_station["station"],
-                            "travel_time_min": travel_time,
-                            "train_type": current_station["train_type"],
-                        }
-                    )
-
-    if journey_times:
-        journey_df = pd.DataFrame(journey_times)
+    # Travel time from every stop to the next stop of the same journey, for all journeys at once
+    ride = valid_df["train_line_ride_id"].to_numpy()
+    station = valid_df["station"].to_numpy()
+    train_type = valid_df["train_type"].to_numpy()
+    travel_time = (
+        valid_df["arrival_planned_time"].to_numpy()[1:] - valid_df["departure_planned_time"].to_numpy()[:-1]
+    ) / np.timedelta64(1, "m")
+
+    # Filter out unrealistic times (negative or extremely long), between 0 and 5 hours
+    keep = (ride[1:] == ride[:-1]) & pd.notna(ride[1:]) & (travel_time > 0) & (travel_time < 300)
+    journey_df = pd.DataFrame(
+        {
+            "from_station": station[:-1][keep],
+            "to_station": station[1:][keep],
+            "travel_time_min": travel_time[keep],
+            "train_type": train_type[:-1][keep],
+        }
+    )
+
+    if len(journey_df):
         avg_time = journey_df["travel_time_min"].mean()
         median_time = journey_df["travel_time_min"].median()
 
@@ -229,13 +263,12 @@ def analyze_temporal_patterns(df):
     print("\n📅 TEMPORAL PATTERNS ANALYSIS")
     print("=" * 50)
 
-    df = df.copy()
-    df["hour"] = df["time"].dt.hour
-    df["day_of_week"] = df["time"].dt.day_name()
-    df["month"] = df["time"].dt.month_name()
+    # Group by the integer hour and weekday, the names are only looked up for the few groups
+    hour = df["time"].dt.hour
+    day_of_week = df["time"].dt.dayofweek.map(dict(enumerate(DAY_ORDER)))
 
     # Peak hours analysis
-    hourly_records = df.groupby("hour").size().sort_index()
+    hourly_records = hour.value_counts().sort_index()
     peak_hour = hourly_records.idxmax()
     peak_count = hourly_records.max()
 
@@ -245,14 +278,11 @@ def analyze_temporal_patterns(df):
         print(f"  {hour:2d}:00 - {count:,} records")
 
     # Day of week patterns
-    daily_avg_delay = df[~df["is_canceled"]].groupby("day_of_week")["delay_in_min"].mean()
-    daily_cancellation = df.groupby("day_of_week")["is_canceled"].mean() * 100
-
-    # Order days properly
-    day_order = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+    daily_avg_delay = df["delay_in_min"][~df["is_canceled"]].groupby(day_of_week).mean()
+    daily_cancellation = df["is_canceled"].groupby(day_of_week).mean() * 100
 
     print(f"\n📈 Average delays by day of week:")
-    for day in day_order:
+    for day in DAY_ORDER:
         if day in daily_avg_delay:
             delay = daily_avg_delay[day]
             cancel_rate = daily_cancellation[day]
@@ -312,9 +342,7 @@ def create_visualizations(df, journey_df, station_counts):
 
     # 4. Hourly patterns
     ax4 = axes[1, 0]
-    df_copy = df.copy()
-    df_copy["hour"] = df_copy["time"].dt.hour
-    hourly_counts = df_copy.groupby("hour").size()
+    hourly_counts = df["time"].dt.hour.value_counts().sort_index()
     ax4.plot(hourly_counts.index, hourly_counts.values, marker="o")
     ax4.set_title("Train Activity by Hour of Day")
     ax4.set_xlabel("Hour of Day")
@@ -373,17 +401,20 @@ def create_visualizations(df, journey_df, station_counts):
     return fig
 
 
-def main():
-    """Main analysis function."""
+def main(full=False):
+    """Main analysis function, over every record of the recent 3 months if full is set."""
     print("🇩🇪 Deutsche Bahn Train Data Analysis")
     print("=" * 60)
 
-    # Load data (sample for faster analysis)
-    df = load_sample_data(sample_months=3, sample_fraction=0.2)  # Use recent 3 months, 20% sample
+    if full:
+        df = load_full_data(months=3)
+    else:
+        # Load data (sample for faster analysis)
+        df = load_sample_data(sample_months=3, sample_fraction=0.2)  # Use recent 3 months, 20% sample
 
     # Run all analyses
     station_counts = analyze_stations(df)
-    journey_df = calculate_time_between_stations(df)
+    journey_df = calculate_time_between_stations(df, max_journeys=None if full else 1000)
     analyze_delays_and_cancellations(df)
     analyze_train_types(df)
     analyze_temporal_patterns(df)
@@ -415,4 +446,10 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Comprehensive analysis of the Deutsche Bahn train data.")
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="analyze every record and every journey instead of a 20%% sample and 1000 journeys",
+    )
+    main(parser.parse_args().full)
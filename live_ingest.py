@@ -0,0 +1,71 @@
+import argparse
+import multiprocessing
+import time
+
+import pandas as pd
+
+from dbstats.live import LIVE_DIR, POLL, REFRESH, LiveIngest, produce
+from dbstats.months import month_files, month_of
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Fold stop events arriving in a directory into live statistics, published as JSON."
+    )
+    parser.add_argument("--incoming", default=str(LIVE_DIR / "incoming"), help="directory to tail")
+    parser.add_argument("--out", default=str(LIVE_DIR), help="directory of the published JSON files")
+    parser.add_argument("--refresh", type=float, default=REFRESH, help="seconds between publishes")
+    parser.add_argument(
+        "--duration", type=float, help="stop after this many seconds, run forever if not given"
+    )
+    parser.add_argument(
+        "--produce",
+        type=float,
+        metavar="RATE",
+        help="also start the stand-in producer, replaying a month at RATE events per second",
+    )
+    parser.add_argument("--month", help="YYYY-MM the producer replays, the last month if not given")
+    parser.add_argument("--limit", type=int, help="events the producer writes at most")
+    args = parser.parse_args()
+
+    producer = None
+    if args.produce:
+        files = month_files()
+        files = [file for file in files if month_of(file) == args.month] if args.month else files[-1:]
+        if not files:
+            parser.error(f"no data file for {args.month}")
+        # A separate process, so that the ingest has its core to itself
+        producer = multiprocessing.Process(
+            target=produce,
+            args=(pd.read_parquet(files[0]), args.incoming, args.produce),
+            kwargs={"limit": args.limit},
+            daemon=True,
+        )
+        producer.start()
+
+    ingest = LiveIngest(args.incoming, args.out, args.refresh)
+    started = time.perf_counter()
+    last_report = started
+    try:
+        while args.duration is None or time.perf_counter() - started < args.duration:
+            if not ingest.step():
+                time.sleep(POLL)
+            if time.perf_counter() - last_report >= args.refresh:
+                last_report = time.perf_counter()
+                status = ingest.status()
+                print(
+                    f"{status['events']:>10,} events | {status['events_per_second']:>8,.0f} events/s | "
+                    f"capacity: {status['capacity_per_second'] or 0:>9,.0f} events/s | "
+                    f"latency p50: {status['latency_p50_s']} s, p99: {status['latency_p99_s']} s"
+                )
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ingest.poll()
+        ingest.publish()
+        if producer is not None:
+            producer.terminate()
+    status = ingest.status()
+    print(
+        f"{status['events']:,} events in {status['batches']:,} batches, one core sustains "
+        f"{status['capacity_per_second'] or 0:,.0f} events/s ({status['busy_share']:.0%} busy)"
+    )
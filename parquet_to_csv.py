@@ -1,12 +1,16 @@
 #!/usr/bin/env python3
-import pandas as pd
 import pathlib
 
+from dbstats.schema import read_parquet, write_csv
+from dbstats.trace import span
+
 DATA_DIR = pathlib.Path("dashboard/public/data")
 
+
 def convert_file(parquet_path: pathlib.Path):
     print(f"Converting {parquet_path.name} …")
-    df = pd.read_parquet(parquet_path)
+    # Declared column types, nothing is required so no row is dropped
+    df = read_parquet(parquet_path, required=[])
 
     # Optional: keep only the useful columns (uncomment if needed)
     # cols = [c for c in df.columns if c in ["train_id","timestamp","station_name","delay_min","planned_ts","actual_ts"]]
@@ -15,12 +19,16 @@ def convert_file(parquet_path: pathlib.Path):
 
     # Optional: sort by timestamp if it exists
     if "timestamp" in df.columns:
-        df = df.sort_values("timestamp")
+        with span("sort", rows=len(df)):
+            df = df.sort_values("timestamp")
 
     csv_path = parquet_path.with_suffix(".csv")
-    df.to_csv(csv_path, index=False)
+    with span(f"write {csv_path.name}", rows=len(df)) as s:
+        write_csv(df, csv_path)
+        s.wrote(csv_path)
     print(f" → wrote {len(df):,} rows to {csv_path.name}")
 
+
 def main():
     DATA_DIR.mkdir(exist_ok=True)
     parquet_files = sorted(DATA_DIR.glob("*.parquet"))
@@ -31,5 +39,6 @@ def main():
     for f in parquet_files:
         convert_file(f)
 
+
 if __name__ == "__main__":
     main()
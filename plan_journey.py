@@ -0,0 +1,51 @@
+import argparse
+import time
+
+import pandas as pd
+
+from dbstats.journeys import MIN_TRANSFER, Reliability, Timetable
+from dbstats.months import month_files, month_of
+from dbstats.segments import build, read_segments
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Plan journeys on the timetable of a day, scored with past delays."
+    )
+    parser.add_argument("source", help="station to leave from")
+    parser.add_argument("target", help="station to arrive at")
+    parser.add_argument("departure", help="earliest departure, e.g. '2024-09-16 08:00'")
+    parser.add_argument("--last", type=int, default=3, help="months of delays for the reliability")
+    parser.add_argument("--transfer", type=float, default=MIN_TRANSFER.total_seconds() / 60, help="minutes")
+    parser.add_argument(
+        "--alternatives", type=int, default=3, help="itineraries, each leaving after the previous"
+    )
+    args = parser.parse_args()
+
+    files = month_files(last=args.last)
+    build(files)
+    departure = pd.Timestamp(args.departure)
+    transfer = pd.Timedelta(minutes=args.transfer)
+    history = read_segments([month_of(file) for file in files])
+    timetable = Timetable.from_segments(history, departure)
+    reliability = Reliability.from_segments(history)
+    print(f"{len(timetable):,} connections on {departure:%Y-%m-%d}")
+
+    for _ in range(args.alternatives):
+        started = time.perf_counter()
+        legs = timetable.earliest_arrival(args.source, args.target, departure, transfer)
+        elapsed = (time.perf_counter() - started) * 1000
+        if not legs:
+            print(f"no connection from {args.source} to {args.target} after {departure:%H:%M}")
+            break
+        journey = reliability.score(legs, transfer)
+        print(
+            f"\n{legs[0]['departure']:%H:%M} → {legs[-1]['arrival']:%H:%M} | transfers: {journey['transfers']} | "
+            f"reliability: {journey['reliability']:.0%} | expected delay: "
+            f"{journey['expected_arrival_delay']:.1f} min | found in {elapsed:.1f} ms"
+        )
+        for leg in legs:
+            print(
+                f"  {leg['departure']:%H:%M} {leg['from_station']} → {leg['arrival']:%H:%M} {leg['to_station']}"
+                f" ({leg['train_name']})"
+            )
+        departure = legs[0]["departure"] + pd.Timedelta(minutes=1)
@@ -1,90 +1,117 @@
 #!/usr/bin/env python3
+import argparse
 import pathlib
-import pandas as pd
-import json
+
+import numpy as np
+
+from dbstats.output import atomic_writer, write_json
+from dbstats.positions import write_snapshots
+from dbstats.schema import EVENT_TIME, read_csv, write_csv
+from dbstats.trace import span
 
 OUT_DIR = pathlib.Path("dashboard/public/data")
 RAW_DIR = OUT_DIR  # <- read the monthly CSVs from the same folder
 OUT_DIR.mkdir(parents=True, exist_ok=True)
 
-FALLBACK_TS = ["arrival_planned_time","arrival_change_time","departure_planned_time","departure_change_time"]
-
-def pick_time_column(df: pd.DataFrame) -> str:
-    if "time" in df.columns:
-        return "time"
-    for c in FALLBACK_TS:
-        if c in df.columns:
-            return c
-    raise RuntimeError(f"No usable time column found. Columns: {list(df.columns)}")
-
-def process_month(src: pathlib.Path) -> str:
+def process_month(src: pathlib.Path, positions: bool = False) -> dict:
+    """Write events-YYYY-MM.csv for a monthly CSV, returns its entry of the manifest."""
     # Month tag from filename like data-2024-07.csv
     month = src.stem.replace("data-", "")
-    # Load
+    # Load with the declared column types, rows without a time are quarantined
     if src.suffix.lower() != ".csv":
         raise ValueError(f"Unsupported: {src}")
-    df = pd.read_csv(src)
-
-    # Choose and normalize time
-    tcol = pick_time_column(df)
-    ts = pd.to_datetime(df[tcol], errors="coerce")  # naive -> assume local clock
+    df = read_csv(src)
 
-    df = df.loc[ts.notna()].copy()
-    df.insert(0, "timestamp", ts.loc[ts.notna()].astype("datetime64[ns]"))
-    # epoch ms
-    df.insert(1, "ts_ms", (df["timestamp"].astype("int64") // 1_000_000))
+    with span("timestamps", rows=len(df)):
+        df.insert(0, "timestamp", df[EVENT_TIME])
+        # epoch ms
+        df.insert(1, "ts_ms", df["timestamp"].to_numpy().astype("int64") // 1_000_000)
 
     # Sort chronologically
-    df = df.sort_values("timestamp")
+    with span("sort", rows=len(df)):
+        df = df.sort_values("timestamp")
 
-    # Write out
+    # Write out day by day, the byte range of every day goes into the manifest so the dashboard can
+    # request single days; the file is hashed on the way
     out = OUT_DIR / f"events-{month}.csv"
-    df.to_csv(out, index=False)
+    days = df["timestamp"].to_numpy().astype("datetime64[D]")
+    starts = np.flatnonzero(np.r_[True, days[1:] != days[:-1]]) if len(df) else np.empty(0, "int64")
+    ends = np.r_[starts[1:], len(df)]
+    day_ranges = []
+    with span(f"write {out.name}", rows=len(df)) as s:
+        with atomic_writer(out) as f:
+            write_csv(df.iloc[:0], f)
+            header_bytes = f.size
+            for start, end in zip(starts, ends):
+                offset = f.size
+                write_csv(df.iloc[start:end], f, header=False)
+                day_ranges.append(
+                    {
+                        "day": str(days[start]),
+                        "offset": offset,
+                        "bytes": f.size - offset,
+                        "rows": int(end - start),
+                    }
+                )
+        s.wrote(out)
     print(f"{src.name} → {out.name} | rows: {len(df):,}")
-    return out.name
 
-def main():
+    entry = {
+        "file": out.name,
+        "month": month,
+        "rows": len(df),
+        "bytes": f.size,
+        "sha256": f.sha256.hexdigest(),
+        "tsMin": int(df["ts_ms"].iloc[0]) if len(df) else None,
+        "tsMax": int(df["ts_ms"].iloc[-1]) if len(df) else None,
+        "columns": list(df.columns),
+        "trainTypes": {str(name): int(count) for name, count in df["train_type"].value_counts().items()},
+        "headerBytes": header_bytes,
+        "days": day_ranges,
+    }
+
+    # Train positions every 30 s for the map, interpolated between the station coordinates
+    if positions:
+        windows = write_snapshots(df, OUT_DIR / f"positions-{month}")
+        print(f"{src.name} → positions-{month}/ | windows: {windows:,}")
+        entry["positions"] = f"positions-{month}"
+    return entry
+
+def main(positions: bool = False):
     # Only pick up the monthly inputs, not our outputs
     files = sorted(list(RAW_DIR.glob("data-*.csv")))
     if not files:
         print("No monthly files found in ./dashboard/public/data/ (expected data-YYYY-MM.csv)")
         return
-    written = []
+    entries = []
     for f in files:
         try:
-            written.append(process_month(f))
+            with span(f"process {f.name}"):
+                entries.append(process_month(f, positions))
         except Exception as e:
             print(f"❌ {f.name}: {e}")
 
-    with open(OUT_DIR / "months.json", "w", encoding="utf-8") as fh:
-        json.dump({"files": written, "default": written[0] if written else None}, fh, indent=2)
-        
-    # after processing all files, determine rangeStart and rangeEnd
-    if written:
-        first_file = OUT_DIR / written[0]
-        last_file = OUT_DIR / written[-1]
-
-        df_first = pd.read_csv(first_file, usecols=["ts_ms"])
-        df_last = pd.read_csv(last_file, usecols=["ts_ms"])
-
-        range_start = int(df_first["ts_ms"].min())
-        range_end = int(df_last["ts_ms"].max())
-    else:
-        range_start = None
-        range_end = None
-
-    with open(OUT_DIR / "months.json", "w", encoding="utf-8") as fh:
-        json.dump(
-            {
-                "files": written,
-                "default": written[0] if written else None,
-                "rangeStart": range_start,
-                "rangeEnd": range_end,
-            },
-            fh,
-            indent=2,
-        )
+    # The manifest: the file names and the time range as before, plus per file its statistics, gathered
+    # while writing, so the dashboard does not have to download a file to learn about it
+    written = [entry["file"] for entry in entries]
+    starts = [entry["tsMin"] for entry in entries if entry["tsMin"] is not None]
+    ends = [entry["tsMax"] for entry in entries if entry["tsMax"] is not None]
+    write_json(
+        OUT_DIR / "months.json",
+        {
+            "files": written,
+            "default": written[0] if written else None,
+            "rangeStart": min(starts) if starts else None,
+            "rangeEnd": max(ends) if ends else None,
+            "months": entries,
+        },
+        indent=2,
+    )
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Prepare the monthly event CSVs for the dashboard.")
+    parser.add_argument(
+        "--positions", action="store_true", help="also write the interpolated train positions for the map"
+    )
+    main(parser.parse_args().positions)
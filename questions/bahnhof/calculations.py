@@ -1,78 +1,106 @@
-import json
+import sys
 from pathlib import Path
 
 import pandas as pd
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from dbstats.aggregate import aggregate, total
+from dbstats.bootstrap import mean_interval, rate_interval
+from dbstats.months import month_files
+from dbstats.output import write_json
+from dbstats.sketch import DELAY_BUCKET_SQL, QUANTILES, add_delay_buckets, quantiles
+from dbstats.trace import span
+
 save_dir = Path(__file__).parent / "data"
 save_dir.mkdir(exist_ok=True)
 
-# Load and combine data from the last 3 full months
-df_list = []
-for file in sorted(Path("data").iterdir())[-3:]:
-    df_list.append(pd.read_parquet(file)[["delay_in_min", "station", "is_canceled", "train_type"]])
-df = pd.concat(df_list, ignore_index=True)
-
-# Calculate statistics for all trains (marking them as "alle Züge")
-all_stats = (
-    df.groupby("station")
-    .agg(
-        {
-            "delay_in_min": lambda x: x[~df.loc[x.index, "is_canceled"]].mean(),
-            "is_canceled": "mean",
-            "station": "size",
-        }
+# Sum up the statistics per station, train type and delay bucket over the last 3 full months
+with span("aggregate months"):
+    stats = aggregate(
+        month_files(last=3),
+        by=["station", "train_type", "delay_bucket"],
+        columns=["delay_in_min", "station", "is_canceled", "train_type"],
+        prepare=add_delay_buckets,
+        sql_columns={"delay_bucket": DELAY_BUCKET_SQL},
+        dropna=False,
     )
-    .rename(
-        columns={
-            "delay_in_min": "average_delay",
-            "is_canceled": "cancellation_rate",
-            "station": "sample_size",
-        }
-    )
-    .reset_index()
-)
-all_stats["train_type"] = "alle Züge"
+    delay_counts = stats["delay_count"]
+    stats = total(stats, "delay_bucket", dropna=False)
 
-# Calculate statistics by train type
-type_stats = (
-    df.groupby(["station", "train_type"])
-    .agg(
-        {
-            "delay_in_min": lambda x: x[~df.loc[x.index, "is_canceled"]].mean(),
-            "is_canceled": "mean",
-            "station": "size",
-        }
-    )
-    .rename(
-        columns={
-            "delay_in_min": "average_delay",
-            "is_canceled": "cancellation_rate",
-            "station": "sample_size",
-        }
+
+def station_statistics(stats, delay_counts):
+    """Average delay and delay percentiles of the stops that were not canceled, cancellation rate and
+    sample size, with 95 % confidence intervals of the average delay and the cancellation rate."""
+    cancellation_low, cancellation_high = rate_interval(stats["canceled"], stats["rows"])
+    return (
+        pd.DataFrame(
+            {
+                "average_delay": stats["delay_sum"] / stats["delay_count"],
+                "cancellation_rate": stats["canceled"] / stats["rows"],
+                "cancellation_rate_ci_low": cancellation_low,
+                "cancellation_rate_ci_high": cancellation_high,
+                "sample_size": stats["rows"],
+            }
+        )
+        .join(quantiles(delay_counts))
+        .join(mean_interval(delay_counts).add_prefix("average_delay_"))
+        .reset_index()
     )
-    .reset_index()
-)
 
-# Combine all_stats and type_stats
-combined_stats = pd.concat([all_stats, type_stats], ignore_index=True)
 
-# Round the numeric columns
-combined_stats["average_delay"] = combined_stats["average_delay"].round(2).fillna(0)
-combined_stats["cancellation_rate"] = combined_stats["cancellation_rate"].round(2)
+with span("statistics per station and train type", rows=len(stats)):
+    # Calculate statistics for all trains (marking them as "alle Züge")
+    all_stats = station_statistics(total(stats, "train_type"), total(delay_counts, "train_type"))
+    all_stats["train_type"] = "alle Züge"
 
-# Create a dictionary where each station has a list of its train type statistics
-station_dict = {}
-for station in combined_stats["station"].unique():
-    station_stats = (
-        combined_stats[combined_stats["station"] == station]
-        .sort_values(["sample_size"], ascending=False)[
-            ["train_type", "average_delay", "cancellation_rate", "sample_size"]
-        ]
-        .to_dict("records")
-    )
-    station_dict[station] = station_stats
+    # Calculate statistics by train type
+    type_stats = station_statistics(stats, delay_counts).dropna(subset=["station", "train_type"])
+
+with span("combine"):
+    # Combine all_stats and type_stats
+    combined_stats = pd.concat([all_stats, type_stats], ignore_index=True)
+
+    # Round the numeric columns
+    combined_stats["average_delay"] = combined_stats["average_delay"].round(2).fillna(0)
+    combined_stats["cancellation_rate"] = combined_stats["cancellation_rate"].round(2)
+    # Stations without delays have no percentiles and no interval of the average delay, null in the JSON
+    percentiles = list(QUANTILES)
+    intervals = [
+        "average_delay_ci_low",
+        "average_delay_ci_high",
+        "cancellation_rate_ci_low",
+        "cancellation_rate_ci_high",
+    ]
+    nullable = [*percentiles, *intervals]
+    combined_stats[nullable] = combined_stats[nullable].round(2).astype(object)
+    combined_stats[nullable] = combined_stats[nullable].where(combined_stats[nullable].notna(), None)
+
+with span("build station dict"):
+    # Create a dictionary where each station has a list of its train type statistics
+    station_dict = {}
+    for station in combined_stats["station"].unique():
+        station_stats = (
+            combined_stats[combined_stats["station"] == station]
+            .sort_values(["sample_size"], ascending=False)[
+                [
+                    "train_type",
+                    "average_delay",
+                    "average_delay_ci_low",
+                    "average_delay_ci_high",
+                    *percentiles,
+                    "cancellation_rate",
+                    "cancellation_rate_ci_low",
+                    "cancellation_rate_ci_high",
+                    "sample_size",
+                ]
+            ]
+            .to_dict("records")
+        )
+        station_dict[station] = station_stats
 
 # Save the combined statistics
 title = "Bahnhof_Statistiken"
-with (save_dir / f"{title}.json").open("w", encoding="utf-8") as f:
-    json.dump(station_dict, f, ensure_ascii=False, indent=2)
+with span("write json") as s:
+    write_json(save_dir / f"{title}.json", station_dict)
+    s.wrote(save_dir / f"{title}.json")
@@ -1,9 +1,15 @@
-import json
+import sys
 from pathlib import Path
 
 import pandas as pd
 from tqdm import tqdm
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from dbstats.months import month_files, stitched_months
+from dbstats.output import write_json
+from dbstats.trace import current, span
+
 
 def populate_direct_train_dict(df, direct_train_dict):
     df["arrival_time_delta_in_min"] = (
@@ -94,8 +100,8 @@ def calculate_stats_and_save(direct_train_dict, save_dir):
                     )
                 )
                 file_name = f"{station}_to_{station2}.json".replace("/", "_").replace(" ", "_")
-                with (save_dir / "alle_direkten_zuege" / file_name).open("w") as f:
-                    f.write(direct_train_df.to_json(orient="records"))
+                write_json(save_dir / "alle_direkten_zuege" / file_name, direct_train_df)
+                current().wrote(save_dir / "alle_direkten_zuege" / file_name)
                 direct_train_dict[station][station2] = file_name
 
 
@@ -115,17 +121,18 @@ columns = [
     "departure_change_time",
 ]
 
-last_full_months = sorted(Path("data").iterdir())[-3:]
+last_full_months = month_files(last=3)
 
 direct_train_dict = {}
-print("Processing Month 1/3")
-populate_direct_train_dict(pd.read_parquet(last_full_months[0], columns=columns), direct_train_dict)
-print("Processing Month 2/3")
-populate_direct_train_dict(pd.read_parquet(last_full_months[1], columns=columns), direct_train_dict)
-print("Processing Month 3/3")
-populate_direct_train_dict(pd.read_parquet(last_full_months[2], columns=columns), direct_train_dict)
+# Rides over the end of a month are processed with the next month, so their pairs are counted once
+for i, (month_file, df) in enumerate(stitched_months(last_full_months, columns), start=1):
+    print(f"Processing Month {i}/{len(last_full_months)}")
+    with span(f"direct train pairs {month_file.name}", rows=len(df)):
+        populate_direct_train_dict(df, direct_train_dict)
 print("Calculating Stats")
-calculate_stats_and_save(direct_train_dict, save_dir)
+with span("calculate stats and write pair files"):
+    calculate_stats_and_save(direct_train_dict, save_dir)
 
-with (save_dir / "direkte_zuege_uebersicht.json").open("w", encoding="utf-8") as f:
-    json.dump(direct_train_dict, f, ensure_ascii=False, indent=2)
+with span("write overview json") as s:
+    write_json(save_dir / "direkte_zuege_uebersicht.json", direct_train_dict)
+    s.wrote(save_dir / "direkte_zuege_uebersicht.json")
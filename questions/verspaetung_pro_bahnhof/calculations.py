@@ -1,55 +1,87 @@
+import sys
 from pathlib import Path
 
 import pandas as pd
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from dbstats.aggregate import aggregate, select, total
+from dbstats.bootstrap import mean_interval, rate_interval
+from dbstats.months import month_files
+from dbstats.output import write_json
+from dbstats.sketch import DELAY_BUCKET_SQL, QUANTILES, add_delay_buckets, quantiles
+from dbstats.taxonomy import MAIN_TRAIN_TYPES
+from dbstats.trace import span
+
 save_dir = Path(__file__).parent / "data"
 save_dir.mkdir(exist_ok=True)
 
-# Load and combine data from the last 3 full months
-df_list = []
-for file in sorted(Path("data").iterdir())[-3:]:
-    df_list.append(pd.read_parquet(file)[["delay_in_min", "station", "is_canceled", "train_type"]])
-df = pd.concat(df_list, ignore_index=True)
+# Sum up the statistics per station, train type and delay bucket over the last 3 full months
+with span("aggregate months"):
+    stats = aggregate(
+        month_files(last=3),
+        by=["station", "train_type", "delay_bucket"],
+        columns=["delay_in_min", "station", "is_canceled", "train_type"],
+        prepare=add_delay_buckets,
+        sql_columns={"delay_bucket": DELAY_BUCKET_SQL},
+        dropna=False,
+    )
+    delay_counts = stats["delay_count"]
+    stats = total(stats, "delay_bucket", dropna=False)
 
 # Process data for different train types
-for train_type in ["all", "ICE", "IC", "RE", "RB", "S"]:
-    # Set up the title and filter data if necessary
+for train_type in ["all", *MAIN_TRAIN_TYPES]:
+    # Set up the title and select the statistics if necessary
     title = "Durchschnittliche Verspätungen an Bahnhöfen und Anzahl an Halten"
     if train_type == "all":
-        df_train_type = df
+        station_stats = total(stats, "train_type")
+        station_delay_counts = total(delay_counts, "train_type")
     else:
-        df_train_type = df[df["train_type"] == train_type]
+        station_stats = select(stats, "train_type", train_type)
+        station_delay_counts = select(delay_counts, "train_type", train_type)
         title = f"[{train_type}] {title}"
 
-    # Calculate average delays and stop counts for each station
-    station_df = (
-        df_train_type[~df_train_type["is_canceled"]]
-        .groupby("station")["delay_in_min"]
-        .agg(["mean", "count"])
-        .reset_index()
-        .sort_values("mean", ascending=False)
-        .reset_index(drop=True)
-    )
-    station_df.columns = ["station", "average_delay", "stop_count"]
-
-    # Calculate cancellation rates and sample sizes for each station
-    cancellation_sample_size_df = (
-        df_train_type.groupby("station")
-        .agg({"is_canceled": "mean", "station": "size"})
-        .rename(
-            columns={
-                "is_canceled": "cancellation_rate",
-                "station": "sample_size",
-            }
+    with span(f"statistics {train_type}", rows=len(station_stats)):
+        # Calculate average delays with their 95 % confidence interval, delay percentiles and stop counts
+        # for each station that has stops which were not canceled
+        not_canceled = station_stats[station_stats["valid"] > 0]
+        station_df = (
+            pd.DataFrame(
+                {
+                    "mean": not_canceled["delay_sum"] / not_canceled["delay_count"],
+                    "count": not_canceled["delay_count"],
+                }
+            )
+            .join(mean_interval(station_delay_counts).round(2))
+            .join(quantiles(station_delay_counts).round(2))
+            .reset_index()
+            .sort_values("mean", ascending=False)
+            .reset_index(drop=True)
         )
-    )
+        station_df.columns = [
+            "station",
+            "average_delay",
+            "stop_count",
+            "average_delay_ci_low",
+            "average_delay_ci_high",
+            *QUANTILES,
+        ]
 
-    # Combine all statistics for each station
-    station_df = station_df.merge(cancellation_sample_size_df, on="station")
+        # Calculate cancellation rates with their 95 % confidence interval and sample sizes for each station
+        cancellation_low, cancellation_high = rate_interval(station_stats["canceled"], station_stats["rows"])
+        cancellation_sample_size_df = pd.DataFrame(
+            {
+                "cancellation_rate": station_stats["canceled"] / station_stats["rows"],
+                "cancellation_rate_ci_low": cancellation_low.round(2),
+                "cancellation_rate_ci_high": cancellation_high.round(2),
+                "sample_size": station_stats["rows"],
+            }
+        )
 
-    station_df.sort_values("average_delay")
+        # Combine all statistics for each station
+        station_df = station_df.merge(cancellation_sample_size_df, on="station")
 
     # Convert the results to JSON and save to a file
-    json_data = station_df.to_json(orient="records")
-    with (save_dir / f"{title}.json").open("w") as f:
-        f.write(json_data)
+    with span(f"write json {train_type}") as s:
+        write_json(save_dir / f"{title}.json", station_df)
+        s.wrote(save_dir / f"{title}.json")
@@ -1,51 +1,48 @@
+import sys
 from pathlib import Path
 
-import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
-from tqdm import tqdm
 
-save_dir = Path(__file__).parent / "data"
-save_dir.mkdir(exist_ok=True)
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
 
-# Load and combine data from the last 3 full months
-df_list = []
-for file in sorted(Path("data").iterdir())[-3:]:
-    df_list.append(
-        pd.read_parquet(file)[["delay_in_min", "time", "is_canceled", "train_type", "train_line_ride_id"]]
-    )
-df = pd.concat(df_list, ignore_index=True)
+from dbstats import plots
+from dbstats.months import month_files, stitched_months
+from dbstats.trace import span
 
-# only look at stops that are not canceled
-df = df[~df["is_canceled"]]
+save_dir = Path(__file__).parent / "data"
+save_dir.mkdir(exist_ok=True)
 
-# Create a 'time_minutes' column that uses time since 2024-01-01 in minutes
-df["time_minutes"] = (df["time"] - pd.Timestamp("2024-01-01")).dt.total_seconds() / 60
+# Load the last 3 full months one at a time, with the rides over a month boundary in one month, and keep
+# the minutes since the first stop of the ride instead of the stops themselves
+with span("load months"):
+    progressions = []
+    for _, month in stitched_months(
+        month_files(last=3),
+        columns=["delay_in_min", "time", "is_canceled", "train_type", "train_line_ride_id"],
+    ):
+        # only look at stops that are not canceled
+        month = month[~month["is_canceled"]]
+
+        # Time since 2024-01-01 in minutes, minus the first stop of the ride
+        time_minutes = (month["time"] - pd.Timestamp("2024-01-01")).dt.total_seconds() / 60
+        first_stop = time_minutes.groupby(month["train_line_ride_id"]).transform("min")
+        progressions.append(
+            pd.DataFrame(
+                {
+                    "time_since_start": time_minutes - first_stop,
+                    "delay_in_min": month["delay_in_min"],
+                    "train_type": month["train_type"],
+                }
+            )
+        )
+    df = pd.concat(progressions, ignore_index=True)
 
 
 def calculate_delay_progression(data, max_time_since_start, train_type):
     print(f"Calculation delay progression for {train_type}")
-    # Group by train_line_ride_id and aggregate time and delay
-    grouped = data.groupby("train_line_ride_id").agg({"time_minutes": list, "delay_in_min": list})
-
-    # Calculate time since start and average delay
-    all_times = []
-    all_delays = []
-
-    for _, row in tqdm(
-        grouped.iterrows(), total=len(grouped), mininterval=1.0, smoothing=0.4, miniters=10000
-    ):
-        times = np.array(row["time_minutes"])
-        delays = row["delay_in_min"]
-
-        all_times.extend(times - np.min(times))  # add times deltas (minutes since first stop)
-        all_delays.extend(delays)
-
-    # Create a DataFrame with the results
-    result_df = pd.DataFrame({"time_since_start": all_times, "delay_in_min": all_delays})
-
     # Filter by max_time_since_start
-    result_df = result_df[result_df["time_since_start"] <= max_time_since_start]
+    result_df = data[data["time_since_start"] <= max_time_since_start]
 
     # Group by time_since_start and calculate mean delay and count
     avg_delay = result_df.groupby("time_since_start").agg({"delay_in_min": ["mean", "count"]}).reset_index()
@@ -56,14 +53,28 @@ def calculate_delay_progression(data, max_time_since_start, train_type):
 
 def plot_delay_progression(avg_delay, prefix):
     # Plot delay progression with weighted regression
-    plt.figure(figsize=(12, 6))
+    max_time = max(avg_delay["time_since_start"])
+    spec = plots.figure(
+        save_dir / f"{prefix}Verspätungsverlauf.png",
+        figsize=(12, 6),
+        dpi=150,
+        title=f"{prefix}Durchschnittlicher Verspätungsverlauf",
+        xlabel="Zeit seit Zugstart (Minuten)",
+        ylabel="Durchschnittliche Verspätung (Minuten)",
+        ylim=(0, 40),
+        xticks={"positions": np.arange(0, max_time + 60, 60).tolist()},
+        legend={"loc": "upper left"},
+        grid={},
+    )
 
     # Scatter plot with point size proportional to count
-    plt.scatter(
-        avg_delay["time_since_start"],
-        avg_delay["mean_delay"],
-        alpha=0.99,
-        s=avg_delay["count"] / avg_delay["count"].max() * 1000,
+    spec["series"].append(
+        plots.scatter(
+            avg_delay["time_since_start"],
+            avg_delay["mean_delay"],
+            sizes=avg_delay["count"] / avg_delay["count"].max() * 1000,
+            alpha=0.99,
+        )
     )
 
     # Weighted regression
@@ -82,29 +93,25 @@ def plot_delay_progression(avg_delay, prefix):
 
     line = slope * x + intercept
 
-    plt.plot(
-        x, line, color="r", label=f"Startverspätung: {intercept:.0f} min, Steigung: {slope * 60:.1f} min/h"
+    spec["series"].append(
+        plots.line(
+            x,
+            line,
+            color="r",
+            label=f"Startverspätung: {intercept:.0f} min, Steigung: {slope * 60:.1f} min/h",
+        )
     )
+    plots.emit(spec)
 
-    plt.xlabel("Zeit seit Zugstart (Minuten)")
-    plt.ylabel("Durchschnittliche Verspätung (Minuten)")
-    plt.title(f"{prefix}Durchschnittlicher Verspätungsverlauf")
-    plt.legend(loc="upper left")
-    plt.grid(True)
-    plt.ylim(0, 40)
 
-    max_time = max(avg_delay["time_since_start"])
-    xticks = np.arange(0, max_time + 60, 60)
-    plt.xticks(xticks)
-
-    plt.savefig(save_dir / f"{prefix}Verspätungsverlauf.png", dpi=150, bbox_inches="tight")
-
-
-all_trains_delay = calculate_delay_progression(df, max_time_since_start=300, train_type="all trains")
+with span("delay progression all trains", rows=len(df)):
+    all_trains_delay = calculate_delay_progression(df, max_time_since_start=300, train_type="all trains")
 plot_delay_progression(all_trains_delay, "")
 
 for train_type, max_time_since_start in [("IC", 420), ("ICE", 480), ("RB", 180), ("RE", 180), ("S", 180)]:
-    all_trains_delay = calculate_delay_progression(
-        df[df["train_type"] == train_type], max_time_since_start=max_time_since_start, train_type=train_type
-    )
+    df_train_type = df[df["train_type"] == train_type]
+    with span(f"delay progression {train_type}", rows=len(df_train_type)):
+        all_trains_delay = calculate_delay_progression(
+            df_train_type, max_time_since_start=max_time_since_start, train_type=train_type
+        )
     plot_delay_progression(all_trains_delay, prefix=f"[{train_type}] ")
@@ -1,114 +1,151 @@
+import sys
 from pathlib import Path
 
-import matplotlib.pyplot as plt
 import pandas as pd
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from dbstats import plots
+from dbstats.aggregate import aggregate, select
+from dbstats.months import month_files
+from dbstats.taxonomy import MAIN_TRAIN_TYPES
+from dbstats.trace import span
+
 save_dir = Path(__file__).parent / "data"
 save_dir.mkdir(exist_ok=True)
 
 
-def create_time_period_plots(df, save_dir, freq, format_func, xlabel):
+def add_month(df):
+    """prepare function for aggregate(): the month of the stops with a time."""
+    df = df[df["time"].notna()]
+    return df.assign(month=df["time"].to_numpy().astype("datetime64[M]").astype("datetime64[ns]"))
+
+
+def add_day_and_hour(df):
+    """prepare function for aggregate(): the day and hour of the stops with a time."""
+    df = df[df["time"].notna()]
+    return df.assign(day=df["time"].dt.floor("D"), hour=df["time"].dt.hour)
+
+
+def create_time_period_plots(stats, save_dir, format_func, xlabel, freq=None):
     """Create plots for a specific time period.
 
     Args:
-        df: DataFrame with the data
+        stats: aggregate() statistics indexed by train_type (including missing ones) and period
         save_dir: Path object for saving the plots
-        freq: Frequency string for period creation (e.g., 'M', 'D', 'h') or None for weekday
         format_func: Function to format period labels
         xlabel: Label for x-axis
+        freq: 'D' or 'h' for the tick labels of days and hours
     """
     save_dir.mkdir(exist_ok=True)
 
-    # Create time period column
-    if freq is None:  # weekday case
-        df["period"] = pd.to_datetime(df["time"]).dt.weekday
-    elif freq == "h":
-        df["period"] = pd.to_datetime(df["time"]).dt.hour
-    else:
-        df["period"] = pd.to_datetime(df["time"]).dt.to_period(freq)
-
-    # Create figures
-    figs_axes = {
-        "cancellations": plt.subplots(figsize=(10, 6)),
-        "delays": plt.subplots(figsize=(10, 6)),
-        "punctuality": plt.subplots(figsize=(10, 6)),
-        "stops": plt.subplots(figsize=(10, 6)),
-    }
+    # One spec per statistic, the series are added per train type
+    plot_configs = [
+        ("cancellations", "canceled_rate", 100, "Ausgefallene Züge", "Prozent (%)"),
+        ("delays", "avg_delay", 1, "Durchschnittliche Verspätung", "Minuten"),
+        ("punctuality", "punctuality", 100, "Pünktlichkeit (<6 min)", "Prozent (%)"),
+        ("stops", "total_stops", 1, "Anzahl geplanter Halte", "Anzahl"),
+    ]
+    specs = {}
+    for plot_type, _, _, title, ylabel in plot_configs:
+        specs[plot_type] = plots.figure(
+            save_dir / f"{plot_type}.png",
+            figsize=(10, 6),
+            dpi=300,
+            title=title,
+            xlabel=xlabel,
+            ylabel=ylabel,
+            legend={"bbox_to_anchor": [1.05, 1], "loc": "upper left"},
+            grid={},
+        )
+        if plot_type == "stops":
+            specs[plot_type]["axes"]["yformat"] = "thousands"
 
     # Process data for different train types
-    for train_type in ["all", "ICE", "IC", "RE", "RB", "S"]:
-        df_train_type = df if train_type == "all" else df[df["train_type"] == train_type]
+    for train_type in ["all", *MAIN_TRAIN_TYPES]:
+        if train_type == "all":
+            type_stats = stats.groupby(level="period").sum()
+        else:
+            type_stats = select(stats, "train_type", train_type)
         display_name = "Alle" if train_type == "all" else train_type
 
-        # Calculate statistics by period
-        period_stats = df_train_type.groupby("period").agg(
+        # Calculate statistics by period, delays and punctuality over the stops that were not canceled
+        period_stats = pd.DataFrame(
             {
-                "is_canceled": ["mean", "count"],
-                "delay_in_min": [
-                    ("avg_delay", lambda x: x[~df_train_type.loc[x.index, "is_canceled"]].mean()),
-                    ("punctuality", lambda x: (x[~df_train_type.loc[x.index, "is_canceled"]] < 6).mean()),
-                ],
+                "canceled_rate": type_stats["canceled"] / type_stats["rows"],
+                "total_stops": type_stats["rows"],
+                "avg_delay": type_stats["delay_sum"] / type_stats["delay_count"],
+                "punctuality": type_stats["punctual"] / type_stats["valid"],
             }
         )
-
-        period_stats.columns = ["canceled_rate", "total_stops", "avg_delay", "punctuality"]
         periods_str = period_stats.index.map(format_func)
 
-        # Plot the statistics
-        plot_configs = [
-            ("cancellations", "canceled_rate", 100, "Ausgefallene Züge", "Prozent (%)"),
-            ("delays", "avg_delay", 1, "Durchschnittliche Verspätung", "Minuten"),
-            ("punctuality", "punctuality", 100, "Pünktlichkeit (<6 min)", "Prozent (%)"),
-            ("stops", "total_stops", 1, "Anzahl geplanter Halte", "Anzahl"),
-        ]
-
-        for plot_type, stat, multiplier, title, ylabel in plot_configs:
-            fig, ax = figs_axes[plot_type]
-            ax.plot(periods_str, period_stats[stat] * multiplier, marker="o", label=display_name)
-            ax.set_title(title)
-            ax.set_xlabel(xlabel)
-            ax.set_ylabel(ylabel)
-            ax.legend(bbox_to_anchor=(1.05, 1), loc="upper left")
-            ax.grid(True)
+        for plot_type, stat, multiplier, _, _ in plot_configs:
+            spec = specs[plot_type]
+            spec["series"].append(
+                plots.line(periods_str, period_stats[stat] * multiplier, marker="o", label=display_name)
+            )
 
             # Special handling for hourly plots
             if freq == "h":
-                ax.set_xticks(range(24))
-                ax.set_xticklabels([f"{hour:02d}:00" for hour in range(24)], rotation=45)
+                spec["axes"]["xticks"] = {
+                    "positions": list(range(24)),
+                    "labels": [f"{hour:02d}:00" for hour in range(24)],
+                    "rotation": 45,
+                }
             elif freq == "D":
                 all_days = pd.to_datetime(periods_str)
                 tick_mask = all_days.day.isin([1, 15])
                 tick_positions = [i for i, mask in enumerate(tick_mask) if mask]
-                tick_labels = periods_str[tick_mask]
-                ax.set_xticks(tick_positions)
-                ax.set_xticklabels(tick_labels, rotation=45)
+                tick_labels = list(periods_str[tick_mask])
+                spec["axes"]["xticks"] = {"positions": tick_positions, "labels": tick_labels, "rotation": 45}
             else:
-                plt.setp(ax.get_xticklabels(), rotation=45)
-
-            if plot_type == "stops":
-                ax.yaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: format(int(x), ",")))
-
-    # Save the plots
-    for plot_type, (fig, _) in figs_axes.items():
-        filename = f"{plot_type}.png"
-        fig.tight_layout()
-        fig.savefig(save_dir / filename, bbox_inches="tight", dpi=300)
-        plt.close(fig)
-
-
-# Load data from all full months
-df_list = []
-for file in sorted(Path("data").iterdir()):
-    df_list.append(pd.read_parquet(file)[["delay_in_min", "time", "is_canceled", "train_type"]])
-df = pd.concat(df_list, ignore_index=True)
-
-create_time_period_plots(df, save_dir / "monat", "M", lambda x: str(x), "Monat")
-
-df = pd.concat(df_list[-3:], ignore_index=True)
-
-create_time_period_plots(df, save_dir / "tag", "D", lambda x: x.strftime("%Y-%m-%d"), "Tag")
-
-create_time_period_plots(df, save_dir / "uhrzeit", "h", lambda x: f"{x:02d}:00", "Stunde")
+                spec["axes"]["xtick_rotation"] = 45
+
+    for spec in specs.values():
+        plots.emit(spec)
+
+
+columns = ["delay_in_min", "time", "is_canceled", "train_type"]
+
+# Sum up the statistics per train type and month over all full months
+with span("aggregate months"):
+    stats = aggregate(
+        month_files(),
+        by=["train_type", "month"],
+        columns=columns,
+        prepare=add_month,
+        dropna=False,
+        sql_columns={"month": "date_trunc('month', time)"},
+        sql_where="time IS NOT NULL",
+    )
+
+create_time_period_plots(
+    stats.rename_axis(index={"month": "period"}), save_dir / "monat", lambda x: x.strftime("%Y-%m"), "Monat"
+)
+
+# and per train type, day and hour over the last 3 months
+with span("aggregate days and hours"):
+    stats = aggregate(
+        month_files(last=3),
+        by=["train_type", "day", "hour"],
+        columns=columns,
+        prepare=add_day_and_hour,
+        dropna=False,
+        sql_columns={"day": "date_trunc('day', time)", "hour": "hour(time)"},
+        sql_where="time IS NOT NULL",
+    )
+
+days = stats.groupby(level=["train_type", "day"], dropna=False).sum().rename_axis(index={"day": "period"})
+create_time_period_plots(days, save_dir / "tag", lambda x: x.strftime("%Y-%m-%d"), "Tag", freq="D")
+
+hours = stats.groupby(level=["train_type", "hour"], dropna=False).sum().rename_axis(index={"hour": "period"})
+create_time_period_plots(hours, save_dir / "uhrzeit", lambda x: f"{x:02d}:00", "Stunde", freq="h")
 
 weekdays = ["Montag", "Dienstag", "Mittwoch", "Donnerstag", "Freitag", "Samstag", "Sonntag"]
-create_time_period_plots(df, save_dir / "wochentag", None, lambda x: weekdays[x], "Wochentag")
+weekday_index = pd.MultiIndex.from_arrays(
+    [days.index.get_level_values("train_type"), days.index.get_level_values("period").weekday],
+    names=days.index.names,
+)
+weekday_stats = days.set_axis(weekday_index).groupby(level=["train_type", "period"], dropna=False).sum()
+create_time_period_plots(weekday_stats, save_dir / "wochentag", lambda x: weekdays[x], "Wochentag")
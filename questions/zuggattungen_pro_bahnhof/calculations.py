@@ -1,36 +1,42 @@
-import json
+import sys
 from pathlib import Path
 
-import pandas as pd
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from dbstats.aggregate import aggregate
+from dbstats.months import month_files
+from dbstats.output import write_json
+from dbstats.taxonomy import classify
+from dbstats.trace import span
 
 save_dir = Path(__file__).parent / "data"
 save_dir.mkdir(exist_ok=True)
 
-# Load and combine data from the last 3 full months
-df_list = []
-for file in sorted(Path("data").iterdir())[-3:]:
-    df_list.append(pd.read_parquet(file)[["station", "train_type"]])
-df = pd.concat(df_list, ignore_index=True)
-
-
-# Function to categorize train types
-def categorize_train_type(train_type):
-    return train_type if train_type in ["IC", "ICE", "RB", "RE", "S"] else "Sonstige"
+# Count the stops per station and train type over the last 3 full months
+with span("aggregate months"):
+    stats = aggregate(
+        month_files(last=3), by=["station", "train_type"], columns=["station", "train_type"], dropna=False
+    )
 
 
-# Add a new column for categorized train types
-df["train_type_category"] = df["train_type"].map(categorize_train_type)
+with span("count train types per station", rows=len(stats)):
+    # Add a new column for categorized train types, the main ones on their own and the rest as "Sonstige"
+    counts = stats["rows"].reset_index()
+    counts["train_type_category"] = classify(counts["train_type"])["train_type_main"]
 
-# Group by station and train type, then count
-station_train_counts = df.groupby(["station", "train_type_category"]).size().unstack(fill_value=0)
+    # Group by station and train type, then count
+    station_train_counts = (
+        counts.groupby(["station", "train_type_category"])["rows"].sum().unstack(fill_value=0)
+    )
 
-# Add total column
-station_train_counts["Total"] = station_train_counts.sum(axis=1)
+    # Add total column
+    station_train_counts["Total"] = station_train_counts.sum(axis=1)
 
-station_train_counts.sort_values(by="ICE", ascending=False, inplace=True)
+    station_train_counts.sort_values(by="ICE", ascending=False, inplace=True)
 
 data_for_json = station_train_counts.reset_index().to_dict("records")
 
 # Save data as JSON
-with open(save_dir / "Verteilung_von_Zuggattungen_pro_Bahnhof.json", "w", encoding="utf-8") as f:
-    json.dump(data_for_json, f, ensure_ascii=False, indent=4)
+with span("write json") as s:
+    write_json(save_dir / "Verteilung_von_Zuggattungen_pro_Bahnhof.json", data_for_json)
+    s.wrote(save_dir / "Verteilung_von_Zuggattungen_pro_Bahnhof.json")
@@ -1,43 +1,80 @@
+import sys
 from pathlib import Path
 
 import pandas as pd
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from dbstats.aggregate import aggregate, total
+from dbstats.bootstrap import mean_interval, rate_interval
+from dbstats.months import month_files
+from dbstats.output import write_json
+from dbstats.sketch import DELAY_BUCKET_SQL, add_delay_buckets, quantiles
+from dbstats.taxonomy import classify, group_condition
+from dbstats.trace import span
+
 save_dir = Path(__file__).parent / "data"
 save_dir.mkdir(exist_ok=True)
 
-# Load and combine data from the last 3 full months
-df_list = []
-for file in sorted(Path("data").iterdir())[-3:]:
-    df = pd.read_parquet(file, columns=["delay_in_min", "train_name", "train_type", "is_canceled"])
-    df_list.append(df)
-df = pd.concat(df_list, ignore_index=True)
 
-# Define long-distance train types
-long_distance_train_types = ["ICE", "IC", "FLX", "EC"]
+def long_distance_buckets(df):
+    """prepare function for aggregate(): the stops of the long-distance trains with their delay bucket.
+
+    The partials of aggregate() are keyed on this file and the modules it imports, so a change to the
+    long-distance group in dbstats/taxonomy.py rescans the months.
+    """
+    return add_delay_buckets(df[classify(df["train_type"])["in_long_distance_connections"]])
+
 
-# Calculate average delays, cancellation percentages, and sample counts by train
-train_stats = (
-    df[df["train_type"].isin(long_distance_train_types)]
-    .groupby("train_name")
-    .agg({"delay_in_min": ["mean", "count"], "is_canceled": "mean"})
-    .sort_values(("delay_in_min", "count"), ascending=False)
-)
+# Sum up the statistics per delay bucket of the long-distance trains over the last 3 full months
+with span("aggregate months"):
+    stats = aggregate(
+        month_files(last=3),
+        by=["train_name", "delay_bucket"],
+        columns=["delay_in_min", "train_name", "train_type", "is_canceled"],
+        prepare=long_distance_buckets,
+        sql_columns={"delay_bucket": DELAY_BUCKET_SQL},
+        sql_where=group_condition("long_distance_connections"),
+    )
+    delay_counts = stats["delay_count"]
+    delay_counts_all = stats["delay_count_all"]
+    stats = total(stats, "delay_bucket")
 
-# Flatten column names and rename for clarity
-train_stats.columns = ["avg_delay", "sample_count", "cancellation_rate"]
+with span("statistics per train", rows=len(stats)):
+    # Calculate average delays, cancellation percentages, and sample counts by train with the 95 %
+    # confidence intervals of the averages and percentages, the delay percentiles are over the stops that
+    # were not canceled
+    cancellation_low, cancellation_high = rate_interval(stats["canceled"], stats["rows"])
+    train_stats = (
+        pd.DataFrame(
+            {
+                "avg_delay": stats["delay_sum_all"] / stats["delay_count_all"],
+                "sample_count": stats["delay_count_all"],
+                "cancellation_rate": stats["canceled"] / stats["rows"],
+                "cancellation_rate_ci_low": cancellation_low,
+                "cancellation_rate_ci_high": cancellation_high,
+            }
+        )
+        .join(mean_interval(delay_counts_all).round(2).add_prefix("avg_delay_"))
+        .join(quantiles(delay_counts).round(2))
+        .sort_values("sample_count", ascending=False)
+    )
 
-# Reset index to include train name in the DataFrame
-train_stats = train_stats.reset_index()
+    # Reset index to include train name in the DataFrame
+    train_stats = train_stats.reset_index()
 
-# Convert cancellation rate to percentage and remove the original rate
-train_stats["cancellation_percentage"] = train_stats["cancellation_rate"] * 100
-train_stats = train_stats.drop(columns=["cancellation_rate"])
+    # Convert cancellation rate and its interval to percentages and remove the original rates
+    for rate in ["cancellation_rate", "cancellation_rate_ci_low", "cancellation_rate_ci_high"]:
+        percentage = rate.replace("cancellation_rate", "cancellation_percentage")
+        train_stats[percentage] = (train_stats[rate] * 100).round(2)
+    train_stats = train_stats.drop(
+        columns=["cancellation_rate", "cancellation_rate_ci_low", "cancellation_rate_ci_high"]
+    )
 
-# Round avg_delay and cancellation_percentage to two decimal places
-train_stats["avg_delay"] = train_stats["avg_delay"].round(2)
-train_stats["cancellation_percentage"] = train_stats["cancellation_percentage"].round(2)
+    # Round avg_delay to two decimal places
+    train_stats["avg_delay"] = train_stats["avg_delay"].round(2)
 
 # Convert the results to JSON and save to a file
-json_data = train_stats.to_json(orient="records")
-with (save_dir / "long_distance_train_stats.json").open("w") as f:
-    f.write(json_data)
+with span("write json") as s:
+    write_json(save_dir / "long_distance_train_stats.json", train_stats)
+    s.wrote(save_dir / "long_distance_train_stats.json")
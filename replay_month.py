@@ -0,0 +1,43 @@
+import argparse
+import time
+
+import pandas as pd
+
+from dbstats.months import month_files, month_of
+from dbstats.replay import Replay
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay the stop events of a month through dbstats.replay.")
+    parser.add_argument("--month", help="YYYY-MM, the last month if not given")
+    parser.add_argument("--jump", help="jump to this timestamp before playing, e.g. '2024-09-15 08:00'")
+    parser.add_argument("--until", help="stop at this timestamp, the end of the month if not given")
+    parser.add_argument(
+        "--speed", type=float, help="replay seconds per second, e.g. 3600; as fast as possible if not given"
+    )
+    parser.add_argument("--step", type=float, default=60, help="minutes of replay time between status lines")
+    args = parser.parse_args()
+
+    files = month_files()
+    files = [file for file in files if month_of(file) == args.month] if args.month else files[-1:]
+    if not files:
+        parser.error(f"no data file for {args.month}")
+    replay = Replay.from_files(files)
+    started = time.perf_counter()
+    first = replay.timestamp
+
+    if args.jump:
+        replay.jump(args.jump)
+        print(f"jumped to {replay.timestamp} in {time.perf_counter() - started:.2f}s")
+    for state in replay.play(speed=args.speed, step=pd.Timedelta(minutes=args.step), until=args.until):
+        print(
+            f"{state['time']:%Y-%m-%d %H:%M} | en route: {state['en_route']:>6,} | dwelling: "
+            f"{state['dwelling']:>6,} | finished: {state['finished']:>8,} | "
+            f"average delay: {state['average_delay']:6.2f} min"
+        )
+
+    elapsed = time.perf_counter() - started
+    replayed = (replay.timestamp - first).total_seconds()
+    print(
+        f"{replay.events_processed:,} events in {elapsed:.2f}s ({replay.events_processed / elapsed:,.0f} events/s), "
+        f"{replayed / elapsed:,.0f}x real time"
+    )
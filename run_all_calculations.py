@@ -1,33 +1,145 @@
+import argparse
+import json
+import os
 import subprocess
 import time
 from datetime import datetime
 from pathlib import Path
 
+from dbstats.cache import OutputCache, fingerprint
+from dbstats.plots import render_specs
+from dbstats.trace import summarize
+
+
 def find_calculation_scripts():
     questions_dir = Path("questions")
     return sorted(questions_dir.rglob("calculations.py"))
 
-def run_scripts():
+
+def print_stages(trace_file):
+    for name, seconds, rows, bytes_read, bytes_written in summarize(trace_file):
+        details = []
+        if rows is not None:
+            details.append(f"{rows:,} rows")
+        if bytes_read:
+            details.append(f"{bytes_read / 2**20:,.1f} MB read")
+        if bytes_written:
+            details.append(f"{bytes_written / 2**20:,.1f} MB written")
+        print(f"    {seconds:8.2f}s  {name}" + (f" ({', '.join(details)})" if details else ""))
+
+
+def merge_traces(trace_dir):
+    """Combine the per-script Chrome traces into one trace.json for the whole run."""
+    events = []
+    for trace_file in sorted(trace_dir.glob("*.json")):
+        if trace_file.name != "trace.json":
+            with trace_file.open(encoding="utf-8") as f:
+                events.extend(json.load(f)["traceEvents"])
+    with (trace_dir / "trace.json").open("w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+def render_queue(queue_file):
+    """Render the queued plot specs in parallel, returns the spec paths that failed."""
+    if not queue_file.exists():
+        return {}
+    specs = queue_file.read_text(encoding="utf-8").splitlines()
+    print(f"\nRendering {len(specs)} plots")
+    start_time = time.time()
+    errors = render_specs(specs)
+    for spec, error in errors.items():
+        print(f"✗ {spec}: {error}")
+    print(f"✓ Rendered {len(specs) - len(errors)} plots in {time.time() - start_time:.2f} seconds")
+    return errors
+
+
+def run_scripts(trace=False, profile=None, use_cache=True, render=True, engine="pandas"):
     print(f"Starting calculations at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print("-" * 50)
 
+    env = dict(os.environ)
+    trace_dir = None
+    if trace or profile:
+        trace_dir = Path("build") / "traces" / datetime.now().strftime("%Y%m%d-%H%M%S")
+        env["DBSTATS_TRACE"] = str(trace_dir.resolve())
+        if profile:
+            env["DBSTATS_PROFILE"] = profile
+
+    # The scripts only write plot specs, the PNGs are rendered together once all of them are done
+    queue_file = Path("build") / "render_queue.txt"
+    queue_file.parent.mkdir(parents=True, exist_ok=True)
+    queue_file.unlink(missing_ok=True)
+    env["DBSTATS_RENDER"] = "queue" if render else "none"
+    env["DBSTATS_RENDER_QUEUE"] = str(queue_file.resolve())
+    env["DBSTATS_ENGINE"] = engine
+    # duckdb is optional, uv adds it to the environment of the scripts only when it is used
+    uv_run = ["uv", "run", "--with", "duckdb"] if engine == "duckdb" else ["uv", "run"]
+
     total_start_time = time.time()
     scripts = find_calculation_scripts()
+    cache = OutputCache()
+    completed = {}
 
     for script in scripts:
-        print(f"\nExecuting 'uv run {script}'")
+        question = script.parent.name
+        output_dir = script.parent / "data"
+        script_fingerprint = fingerprint(script, cache.hashes, env=env)
+        if use_cache and cache.restore(question, output_dir, script_fingerprint):
+            print(f"\n↺ {script}: inputs unchanged, restored outputs from cache")
+            continue
+
+        print(f"\nExecuting '{' '.join(uv_run)} {script}'")
         start_time = time.time()
 
         try:
-            subprocess.run(["uv", "run", str(script)], check=True)
+            subprocess.run([*uv_run, str(script)], check=True, env=env)
             duration = time.time() - start_time
             print(f"✓ Completed in {duration:.2f} seconds")
+            completed[question] = (output_dir, script_fingerprint)
         except subprocess.CalledProcessError as e:
             print(f"✗ Failed with error code {e.returncode}")
 
+        if trace_dir and (trace_dir / f"{script.parent.name}.json").exists():
+            print_stages(trace_dir / f"{script.parent.name}.json")
+
+    errors = render_queue(queue_file) if render else {}
+    # Only cache questions whose plots are all there, DBSTATS_RENDER keeps unrendered runs apart
+    for question, (output_dir, script_fingerprint) in completed.items():
+        if not any(Path(spec).is_relative_to(output_dir.resolve()) for spec in errors):
+            cache.store(question, output_dir, script_fingerprint)
+
     total_duration = time.time() - total_start_time
     print("\n" + "-" * 50)
     print(f"All calculations completed in {total_duration:.2f} seconds")
 
+    if trace_dir and trace_dir.exists():
+        merge_traces(trace_dir)
+        print(f"Trace written to {trace_dir / 'trace.json'} (open in https://ui.perfetto.dev)")
+
+
 if __name__ == "__main__":
-    run_scripts()
+    parser = argparse.ArgumentParser(description="Run all questions/*/calculations.py scripts.")
+    parser.add_argument("--trace", action="store_true", help="write per-stage timings to build/traces/")
+    parser.add_argument(
+        "--profile", choices=["cprofile", "sample"], help="also profile each script (implies --trace)"
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true", help="run every script even if its inputs are unchanged"
+    )
+    parser.add_argument(
+        "--no-render", action="store_true", help="only write the .plot.json specs, skip drawing the PNGs"
+    )
+    parser.add_argument(
+        "--engine",
+        choices=["pandas", "duckdb"],
+        default="pandas",
+        help="run the aggregations of the questions with pandas or as DuckDB queries over the parquet files",
+    )
+    args = parser.parse_args()
+    run_scripts(
+        trace=args.trace,
+        profile=args.profile,
+        use_cache=not args.no_cache,
+        render=not args.no_render,
+        engine=args.engine,
+    )
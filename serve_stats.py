@@ -0,0 +1,22 @@
+import argparse
+import asyncio
+import time
+
+from dbstats.server import CACHE_SIZE, QueryServer, Tables
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Serve the computed statistics of questions/*/data over HTTP."
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--cache-size", type=int, default=CACHE_SIZE, help="responses kept in the LRU cache")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    tables = Tables.load()
+    print(
+        f"loaded {len(tables.stations):,} stations, {len(tables.direct):,} direct connections and "
+        f"{len(tables.trains):,} trains in {time.perf_counter() - started:.2f}s"
+    )
+    asyncio.run(QueryServer(tables, args.cache_size).serve(args.host, args.port))
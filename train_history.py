@@ -0,0 +1,28 @@
+import argparse
+import time
+
+from dbstats.train_days import TRAIN_DAYS_DIR, TrainDays
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=f"Print the day by day statistics of a train from {TRAIN_DAYS_DIR}/ "
+        "(run build_train_days.py first)."
+    )
+    parser.add_argument("train_name", help='e.g. "ICE 578"')
+    parser.add_argument("--from", dest="start", help="first day, YYYY-MM-DD")
+    parser.add_argument("--to", dest="end", help="last day, YYYY-MM-DD")
+    args = parser.parse_args()
+
+    store = TrainDays()
+    started = time.perf_counter()
+    history = store.history(args.train_name, args.start, args.end)
+    elapsed = time.perf_counter() - started
+    if history.empty:
+        parser.exit(1, f"no days of {args.train_name} in {', '.join(store.months) or 'an empty store'}\n")
+    columns = ["stops", "canceled", "average_delay", "max_delay", "cancellation_rate", "punctuality"]
+    print(history[columns].round(2).to_string())
+    average = history["delay_sum"].sum() / history["delay_count"].sum()
+    print(
+        f"{args.train_name}: {len(history):,} days, {history['stops'].sum():,} stops, average delay "
+        f"{average:.2f} min (looked up in {elapsed * 1000:.2f} ms)"
+    )